@@ -0,0 +1,112 @@
+"""Compare cold-start cost of the docx renderers and chart modes.
+
+Every sample runs in a fresh interpreter so imports are genuinely cold:
+
+    python -m benchmarks.cold_start --words 2000 --repeat 5
+
+``native`` leaves the chart out, ``native+fast`` and ``native+matplotlib``
+add it with that ``CHART_MODE``. tscribe always draws it with matplotlib.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from benchmarks.synthetic import make_transcript
+
+
+CONVERT_DIR = Path(__file__).resolve().parent.parent / "functions" / "convert"
+
+NATIVE_IMPORTS = (
+    "from docx_renderer import write_docx\nfrom transcript import load_transcript\n"
+)
+NATIVE_RENDER = "write_docx(load_transcript(source), target)\n"
+IMPORTS = {
+    "native": NATIVE_IMPORTS,
+    "native+fast": NATIVE_IMPORTS,
+    "native+matplotlib": NATIVE_IMPORTS,
+    "tscribe": "from tscribe import write\n",
+}
+
+RENDERS = {
+    "native": NATIVE_RENDER,
+    "native+fast": NATIVE_RENDER,
+    "native+matplotlib": NATIVE_RENDER,
+    "tscribe": "write(source, save_as=target)\n",
+}
+
+CHART_MODES = {"native+fast": "fast", "native+matplotlib": "matplotlib"}
+
+PROBE = """
+import json, os, resource, sys, time
+sys.path.insert(0, {convert_dir!r})
+os.environ["CHART_MODE"] = {chart_mode!r}
+source, target = {source!r}, {target!r}
+start = time.perf_counter()
+{imports}
+imported = time.perf_counter()
+{render}
+rendered = time.perf_counter()
+print(json.dumps({{
+    "import_s": imported - start,
+    "render_s": rendered - imported,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+
+def sample(renderer, source, target):
+    probe = PROBE.format(
+        convert_dir=str(CONVERT_DIR),
+        source=str(source),
+        target=str(target),
+        imports=IMPORTS[renderer],
+        render=RENDERS[renderer],
+        chart_mode=CHART_MODES.get(renderer, "off"),
+    )
+    # tscribe prints its own timing line, the measurement is always last
+    output = subprocess.run(
+        [sys.executable, "-c", probe], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(words, repeat, renderers):
+    with tempfile.TemporaryDirectory() as workdir:
+        source = Path(workdir) / "transcript.json"
+        source.write_text(json.dumps(make_transcript(words=words)))
+        results = {}
+        for renderer in renderers:
+            samples = [
+                sample(renderer, source, Path(workdir) / f"{renderer}.docx")
+                for _ in range(repeat)
+            ]
+            results[renderer] = {
+                key: statistics.median(s[key] for s in samples) for key in samples[0]
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--renderer", action="append", choices=sorted(IMPORTS), dest="renderers"
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.words, args.repeat, args.renderers or sorted(IMPORTS))
+    print(f"{'renderer':<18} {'import s':>9} {'render s':>9} {'peak RSS MB':>12}")
+    for renderer, result in results.items():
+        print(
+            f"{renderer:<18} {result['import_s']:>9.3f} {result['render_s']:>9.3f}"
+            f" {result['peak_rss_mb']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare the python-docx and ooxml docx backends on a large transcript.
+
+Each backend runs in a fresh interpreter, which parses the transcript first
+so that only writing the docx is timed and counted towards peak memory:
+
+    python -m benchmarks.docx_backends --words 200000 --repeat 3
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from benchmarks.cold_start import CONVERT_DIR
+from benchmarks.synthetic import make_transcript
+
+
+BACKENDS = ("python-docx", "ooxml")
+
+# The high-water mark is reset after parsing, then read again after writing
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {convert_dir!r})
+from io import BytesIO
+from exporters import save_docx
+from ooxml import skeleton
+from transcript import load_transcript, parse_transcript
+
+def peak_rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+transcript = parse_transcript(load_transcript({source!r}))
+skeleton()
+with open("/proc/self/clear_refs", "w") as clear_refs:
+    clear_refs.write("5")
+baseline = peak_rss_mb()
+start = time.perf_counter()
+save_docx(transcript, BytesIO(), {backend!r})
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "peak_mb": peak_rss_mb() - baseline,
+    "turns": len(transcript.turns),
+}}))
+"""
+
+
+def sample(backend, source):
+    probe = PROBE.format(
+        convert_dir=str(CONVERT_DIR), source=str(source), backend=backend
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", probe], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output)
+
+
+def run(words, repeat):
+    with tempfile.TemporaryDirectory() as workdir:
+        source = Path(workdir) / "transcript.json"
+        source.write_text(json.dumps(make_transcript(words=words)))
+        results = {}
+        for backend in BACKENDS:
+            samples = [sample(backend, source) for _ in range(repeat)]
+            results[backend] = {
+                key: statistics.median(s[key] for s in samples) for key in samples[0]
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    results = run(args.words, args.repeat)
+    print(f"{'backend':<12} {'turns':>7} {'seconds':>9} {'peak MB':>9}")
+    for backend, result in results.items():
+        print(
+            f"{backend:<12} {result['turns']:>7} {result['seconds']:>9.3f}"
+            f" {result['peak_mb']:>9.1f}"
+        )
+    speedup = results["python-docx"]["seconds"] / results["ooxml"]["seconds"]
+    print(f"ooxml speedup over python-docx: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
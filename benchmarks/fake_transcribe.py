@@ -0,0 +1,193 @@
+"""A local stand-in for the Amazon Transcribe API on a simulated clock.
+
+``FakeTranscribe`` serves the calls the functions make, with the same
+arguments, responses and modelled exceptions as the boto3 client. It
+enforces a concurrent-job quota and a request rate, and finishes every job
+``job_seconds`` of clock time after it started. Nothing sleeps: the clock
+only moves when ``FakeClock.sleep`` is called, so throughput and fairness
+runs over hours of simulated time take milliseconds.
+"""
+
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from botocore.exceptions import ClientError
+
+
+ACTIVE_STATUSES = ("QUEUED", "IN_PROGRESS")
+
+
+class FakeClock:
+    def __init__(self, start=0.0):
+        self.now = start
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += max(0.0, seconds)
+
+
+def _error(code):
+    class Error(ClientError):
+        def __init__(self, message, operation_name="StartTranscriptionJob"):
+            response = {"Error": {"Code": code, "Message": message}}
+            super().__init__(response, operation_name)
+
+    Error.__name__ = Error.__qualname__ = code
+    return Error
+
+
+class FakeTranscribe:
+    """Transcribe allowing ``max_concurrent`` jobs and ``max_rate`` starts a second.
+
+    ``job_seconds`` is a number or a function of the start request.
+    ``on_complete`` is called with the job when it finishes, e.g. to write
+    its transcript.
+    """
+
+    exceptions = SimpleNamespace(
+        BadRequestException=_error("BadRequestException"),
+        ConflictException=_error("ConflictException"),
+        LimitExceededException=_error("LimitExceededException"),
+    )
+
+    def __init__(
+        self,
+        clock=None,
+        max_concurrent=100,
+        max_rate=None,
+        job_seconds=60,
+        on_complete=None,
+    ):
+        self.clock = clock or FakeClock()
+        self.max_concurrent = max_concurrent
+        self.max_rate = max_rate
+        self.job_seconds = job_seconds
+        self.on_complete = on_complete
+        self.jobs = {}
+        self.started = []
+        self.rejected = 0
+        self.peak_in_flight = 0
+        self._starts = []
+        self._lock = threading.RLock()
+
+    def start_transcription_job(self, **request):
+        with self._lock:
+            self.advance()
+            now = self.clock.time()
+            name = request["TranscriptionJobName"]
+            if name in self.jobs:
+                raise self.exceptions.ConflictException(
+                    "The requested job name already exists."
+                )
+            self._starts = [start for start in self._starts if start > now - 1]
+            if self.max_rate is not None and len(self._starts) >= self.max_rate:
+                self.rejected += 1
+                raise self.exceptions.LimitExceededException("Rate exceeded")
+            if self.in_flight() >= self.max_concurrent:
+                self.rejected += 1
+                raise self.exceptions.LimitExceededException(
+                    "You have reached your limit of concurrent jobs."
+                )
+
+            self._starts.append(now)
+            seconds = self.job_seconds
+            if callable(seconds):
+                seconds = seconds(request)
+            job = {
+                "TranscriptionJobName": name,
+                "TranscriptionJobStatus": "IN_PROGRESS",
+                "LanguageCode": request.get("LanguageCode"),
+                "MediaFormat": request.get("MediaFormat"),
+                "Media": request.get("Media"),
+                "Settings": request.get("Settings", {}),
+                "OutputKey": request.get("OutputKey"),
+                "OutputBucketName": request.get("OutputBucketName"),
+                "CreationTime": self._datetime(now),
+                "StartTime": self._datetime(now),
+                "_finishes": now + seconds,
+            }
+            self.jobs[name] = job
+            self.started.append(name)
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight())
+            return {"TranscriptionJob": self._public(job)}
+
+    def get_transcription_job(self, TranscriptionJobName):
+        with self._lock:
+            self.advance()
+            if TranscriptionJobName not in self.jobs:
+                raise self.exceptions.BadRequestException(
+                    "The requested job couldn't be found.", "GetTranscriptionJob"
+                )
+            return {"TranscriptionJob": self._public(self.jobs[TranscriptionJobName])}
+
+    def list_transcription_jobs(
+        self, Status=None, JobNameContains=None, NextToken=None, MaxResults=100
+    ):
+        with self._lock:
+            self.advance()
+            jobs = [
+                job
+                for job in self.jobs.values()
+                if (Status is None or job["TranscriptionJobStatus"] == Status)
+                and (
+                    JobNameContains is None
+                    or JobNameContains in job["TranscriptionJobName"]
+                )
+            ]
+            first = int(NextToken or 0)
+            page = jobs[first : first + MaxResults]
+            response = {
+                "TranscriptionJobSummaries": [
+                    {
+                        "TranscriptionJobName": job["TranscriptionJobName"],
+                        "TranscriptionJobStatus": job["TranscriptionJobStatus"],
+                        "CreationTime": job["CreationTime"],
+                    }
+                    for job in page
+                ]
+            }
+            if first + MaxResults < len(jobs):
+                response["NextToken"] = str(first + MaxResults)
+            return response
+
+    def delete_transcription_job(self, TranscriptionJobName):
+        with self._lock:
+            if self.jobs.pop(TranscriptionJobName, None) is None:
+                raise self.exceptions.BadRequestException(
+                    "The requested job couldn't be found.", "DeleteTranscriptionJob"
+                )
+            return {}
+
+    def in_flight(self):
+        return sum(
+            job["TranscriptionJobStatus"] in ACTIVE_STATUSES
+            for job in self.jobs.values()
+        )
+
+    def advance(self):
+        """Finish every job whose time is up, in the order they finish"""
+        now = self.clock.time()
+        finished = sorted(
+            (
+                job
+                for job in self.jobs.values()
+                if job["TranscriptionJobStatus"] in ACTIVE_STATUSES
+                and job["_finishes"] <= now
+            ),
+            key=lambda job: job["_finishes"],
+        )
+        for job in finished:
+            job["TranscriptionJobStatus"] = "COMPLETED"
+            job["CompletionTime"] = self._datetime(job["_finishes"])
+            if self.on_complete:
+                self.on_complete(self._public(job))
+
+    def _public(self, job):
+        return {key: value for key, value in job.items() if not key.startswith("_")}
+
+    def _datetime(self, seconds):
+        return datetime.fromtimestamp(seconds, timezone.utc)
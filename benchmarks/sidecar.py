@@ -0,0 +1,57 @@
+"""Compare loading a transcript from its sidecar with parsing its JSON.
+
+Both start from the bytes a conversion would GET from S3 and end with the
+parsed ``Transcript`` the writers take:
+
+    python -m benchmarks.sidecar --words 100000 --repeat 5
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from io import BytesIO
+from benchmarks.cold_start import CONVERT_DIR
+from benchmarks.synthetic import make_transcript
+
+
+def best_time(load, repeat):
+    return min(timeit.repeat(load, number=1, repeat=repeat))
+
+
+def run(words, repeat, speakers=3):
+    sys.path.insert(0, str(CONVERT_DIR))
+    import sidecar
+    from transcript import load_transcript, parse_transcript
+
+    data = make_transcript(words=words, speakers=speakers)
+    raw = json.dumps(data).encode()
+    packed = sidecar.dumps(parse_transcript(data), data["results"]["items"], "etag")
+    return {
+        "json": (
+            len(raw),
+            best_time(lambda: parse_transcript(load_transcript(BytesIO(raw))), repeat),
+        ),
+        "sidecar": (len(packed), best_time(lambda: sidecar.loads(packed), repeat)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = run(args.words, args.repeat)
+    print(f"{'source':<8} {'words':>8} {'MB read':>9} {'seconds':>9}")
+    for source, (size, seconds) in results.items():
+        print(f"{source:<8} {args.words:>8} {size / 2**20:>9.2f} {seconds:>9.3f}")
+    (json_size, json_seconds), (size, seconds) = results.values()
+    print(
+        f"sidecar reads {json_size / size:.1f}x fewer bytes"
+        f" and loads {json_seconds / seconds:.1f}x faster"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Benchmark the convert path against a stored baseline.
+
+Times ``make_docx_file`` on synthetic transcripts of several sizes and
+``get_docket`` of both functions over a batch of filenames, each case in a
+fresh interpreter after one warm-up run, with the caches the warm-up filled
+cleared so the timed run pays for its misses. Peak memory is the rise in the
+high-water mark during the timed run. The medians are compared with
+``benchmarks/baseline.json`` and the run fails when a case is slower or
+larger than the baseline by more than ``--threshold``:
+
+    python -m benchmarks.suite --repeat 3
+    python -m benchmarks.suite --save-baseline
+
+Baselines only compare on the same machine, save a new one after moving.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from benchmarks.synthetic import make_transcript
+
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+DOCX_WORDS = (1000, 10000, 50000)
+DOCKET_FILENAMES = 10000
+THRESHOLD = 0.25
+# Peak memory of the small cases is a few MB, so allow for allocator noise
+MEMORY_SLACK_MB = 2.0
+
+PROBE = """
+import json, os, sys, time
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, {root!r})
+from functions.{function} import app
+
+def peak_rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+{setup}
+def run():
+{body}
+
+def reset():
+{reset}
+
+run()
+reset()
+with open("/proc/self/clear_refs", "w") as clear_refs:
+    clear_refs.write("5")
+baseline = peak_rss_mb()
+start = time.perf_counter()
+run()
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "peak_mb": peak_rss_mb() - baseline,
+}}))
+"""
+
+DOCX_SETUP = "source, target = {source!r}, {target!r}\n"
+DOCX_BODY = "    app.make_docx_file(source, target)\n"
+DOCX_RESET = "    pass\n"
+DOCKET_SETUP = "import dockets\nfilenames = json.load(open({source!r}))\n"
+DOCKET_BODY = "    for filename in filenames:\n        app.get_docket(filename)\n"
+DOCKET_RESET = "    dockets.find_docket.cache_clear()\n"
+
+
+def make_filenames(count, seed=0):
+    """Upload names as they arrive, one in ten without a docket"""
+    rng = random.Random(seed)
+    names = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.6:
+            docket = f"P{rng.randrange(10000, 99999)}-US{rng.randrange(100):02d}"
+        elif kind < 0.9:
+            docket = f"ABC-{rng.randrange(1000):03d}DE{rng.randrange(100):02d}"
+        else:
+            docket = "recording"
+        names.append(f"{rng.choice(('Call', 'Hearing'))} {docket}.json")
+    return names
+
+
+def cases(workdir):
+    """Benchmark name, function, probe setup, body and reset"""
+    for words in DOCX_WORDS:
+        source = Path(workdir) / f"transcript-{words}.json"
+        source.write_text(json.dumps(make_transcript(words=words)))
+        setup = DOCX_SETUP.format(
+            source=str(source), target=str(Path(workdir) / f"{words}.docx")
+        )
+        yield f"make_docx_file[{words}]", "convert", setup, DOCX_BODY, DOCX_RESET
+
+    source = Path(workdir) / "filenames.json"
+    source.write_text(json.dumps(make_filenames(DOCKET_FILENAMES)))
+    setup = DOCKET_SETUP.format(source=str(source))
+    for function in ("convert", "transcribe"):
+        name = f"{function}.get_docket[{DOCKET_FILENAMES}]"
+        yield name, function, setup, DOCKET_BODY, DOCKET_RESET
+
+
+def sample(function, setup, body, reset):
+    probe = PROBE.format(
+        root=str(ROOT), function=function, setup=setup, body=body, reset=reset
+    )
+    # The docket warnings go to stderr, the measurement is the last line
+    output = subprocess.run(
+        [sys.executable, "-c", probe],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        env={**os.environ, "WARM_UP": "false"},
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, function, setup, body, reset in cases(workdir):
+            samples = [sample(function, setup, body, reset) for _ in range(repeat)]
+            results[name] = {
+                key: statistics.median(s[key] for s in samples) for key in samples[0]
+            }
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD, slack_mb=MEMORY_SLACK_MB):
+    """Regressions past ``threshold``, as (name, measure, baseline, result)"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if result["seconds"] > expected["seconds"] * (1 + threshold):
+            regressions.append(
+                (name, "seconds", expected["seconds"], result["seconds"])
+            )
+        limit = max(
+            expected["peak_mb"] * (1 + threshold), expected["peak_mb"] + slack_mb
+        )
+        if result["peak_mb"] > limit:
+            regressions.append(
+                (name, "peak_mb", expected["peak_mb"], result["peak_mb"])
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+
+    print(f"{'case':<32} {'seconds':>9} {'peak MB':>9} {'baseline s':>11}")
+    for name, result in results.items():
+        expected = baseline.get(name, {}).get("seconds")
+        expected = "-" if expected is None else f"{expected:.3f}"
+        print(
+            f"{name:<32} {result['seconds']:>9.3f} {result['peak_mb']:>9.1f}"
+            f" {expected:>11}"
+        )
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, measure, expected, result in regressions:
+        print(f"REGRESSION {name} {measure}: {expected:.3f} -> {result:.3f}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
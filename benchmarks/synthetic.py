@@ -0,0 +1,138 @@
+"""Synthetic Amazon Transcribe output and audio for tests and benchmarks."""
+
+import random
+import wave
+
+
+VOCABULARY = (
+    "the a call docket number please confirm your name and address we have "
+    "received disclosure thank you for calling today is that correct yes no "
+    "I will send it over by email"
+).split()
+
+
+# Pace of the default word and pause lengths, pauses between turns included
+DEFAULT_WORDS_PER_MINUTE = 115
+
+
+def make_transcript(
+    words=1000,
+    speakers=2,
+    seed=0,
+    job_name="synthetic",
+    duration=None,
+    words_per_minute=None,
+    punctuation=0.08,
+    confidence=(8, 1),
+):
+    """Return a speaker-labelled transcript dict with ``words`` pronunciations.
+
+    ``duration`` in seconds, when given, sets the length instead of ``words``.
+    ``words_per_minute`` scales every word and pause, ``punctuation`` is the
+    chance of a comma after a word (every turn ends in a full stop) and
+    ``confidence`` the ``(alpha, beta)`` of the beta distribution the word
+    confidences are drawn from, or a function of the ``random.Random``.
+    The same arguments always make the same transcript.
+    """
+    rng = random.Random(seed)
+    pace = 1.0
+    if words_per_minute is not None:
+        pace = DEFAULT_WORDS_PER_MINUTE / words_per_minute
+    if callable(confidence):
+        draw_confidence = confidence
+    else:
+        alpha, beta = confidence
+        draw_confidence = lambda rng: rng.betavariate(alpha, beta)
+    items = []
+    segments = []
+    clock = 0.0
+    remaining = words if duration is None else float("inf")
+
+    while remaining > 0 and (duration is None or clock < duration):
+        speaker = f"spk_{rng.randrange(speakers)}"
+        segment_items = []
+        segment_start = clock
+        for _ in range(min(remaining, rng.randint(3, 40))):
+            if duration is not None and segment_items and clock >= duration:
+                break
+            length = rng.uniform(0.15, 0.6) * pace
+            timing = {
+                "start_time": f"{clock:.3f}",
+                "end_time": f"{clock + length:.3f}",
+            }
+            score = min(1.0, max(0.0, draw_confidence(rng)))
+            items.append(
+                {
+                    **timing,
+                    "alternatives": [
+                        {
+                            "confidence": f"{score:.4f}",
+                            "content": rng.choice(VOCABULARY),
+                        }
+                    ],
+                    "type": "pronunciation",
+                }
+            )
+            segment_items.append({**timing, "speaker_label": speaker})
+            clock += length + rng.uniform(0.01, 0.2) * pace
+            if rng.random() < punctuation:
+                items.append(_punctuation(","))
+        items.append(_punctuation("."))
+        segments.append(
+            {
+                "start_time": f"{segment_start:.3f}",
+                "speaker_label": speaker,
+                "end_time": segment_items[-1]["end_time"],
+                "items": segment_items,
+            }
+        )
+        remaining -= len(segment_items)
+        clock += rng.uniform(0.3, 1.5) * pace
+
+    return {
+        "jobName": job_name,
+        "accountId": "123456789012",
+        "results": {
+            "transcripts": [{"transcript": ""}],
+            "speaker_labels": {"speakers": speakers, "segments": segments},
+            "items": items,
+        },
+        "status": "COMPLETED",
+    }
+
+
+def make_speech_wav(path, seconds=600, rate=8000, seed=0):
+    """Write a mono 16-bit WAV of noise bursts separated by short silences.
+
+    Returns the ``(start, end)`` seconds of every silence.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    parts = []
+    silences = []
+    clock = 0.0
+    while clock < seconds:
+        sound = rng.uniform(2, 8)
+        silence = rng.uniform(0.6, 1.5)
+        parts.append(rng.normal(0, 6000, int(sound * rate)))
+        # Room noise rather than digital silence
+        parts.append(rng.normal(0, 30, int(silence * rate)))
+        clock += int(sound * rate) / rate
+        silences.append((clock, clock + int(silence * rate) / rate))
+        clock = silences[-1][1]
+
+    samples = np.clip(np.concatenate(parts), -32768, 32767).astype("<i2")
+    with wave.open(str(path), "wb") as target:
+        target.setnchannels(1)
+        target.setsampwidth(2)
+        target.setframerate(rate)
+        target.writeframes(samples.tobytes())
+    return silences
+
+
+def _punctuation(content):
+    return {
+        "alternatives": [{"confidence": "0.0", "content": content}],
+        "type": "punctuation",
+    }
@@ -0,0 +1,68 @@
+"""Time speaker-turn assembly of the numpy and python engines.
+
+    python -m benchmarks.turns --words 100000 --repeat 5
+
+tscribe's pandas decoding grows quadratically with the word count, so it is
+only timed when asked for, on a shorter transcript:
+
+    python -m benchmarks.turns --words 100000 --tscribe-words 5000
+"""
+
+import argparse
+import sys
+import timeit
+from benchmarks.cold_start import CONVERT_DIR
+from benchmarks.synthetic import make_transcript
+
+
+ENGINES = ("numpy", "python")
+
+
+def best_time(decode, repeat):
+    return min(timeit.repeat(decode, number=1, repeat=repeat))
+
+
+def run(words, repeat, speakers=3):
+    sys.path.insert(0, str(CONVERT_DIR))
+    from transcript import decode_turns
+
+    data = make_transcript(words=words, speakers=speakers)
+    return {
+        engine: best_time(lambda: decode_turns(data, engine), repeat)
+        for engine in ENGINES
+    }
+
+
+def run_tscribe(words, repeat, speakers=3):
+    from tscribe import decode_transcript
+
+    data = make_transcript(words=words, speakers=speakers)
+    return best_time(lambda: decode_transcript(data), repeat)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tscribe-words", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    results = run(args.words, args.repeat)
+    print(f"{'engine':<8} {'words':>8} {'seconds':>9} {'words/s':>10}")
+    for engine, seconds in results.items():
+        print(
+            f"{engine:<8} {args.words:>8} {seconds:>9.3f}"
+            f" {args.words / seconds:>10.0f}"
+        )
+    print(f"numpy speedup over python: {results['python'] / results['numpy']:.1f}x")
+
+    if args.tscribe_words:
+        seconds = run_tscribe(args.tscribe_words, 1)
+        print(
+            f"{'tscribe':<8} {args.tscribe_words:>8} {seconds:>9.3f}"
+            f" {args.tscribe_words / seconds:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
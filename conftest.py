@@ -9,6 +9,7 @@ import re
 import os
 import time
 from moto import mock_aws
+from benchmarks.synthetic import make_transcript
 
 
 base_path = Path(__file__).parent
@@ -69,6 +70,42 @@ def mock_upload_bucket(mock_s3_client, upload_bucket):
     return upload_bucket
 
 
+@pytest.fixture
+def transcript_data():
+    return make_transcript(words=300, speakers=3, job_name="audiotojson-P12345-US01")
+
+
+@pytest.fixture
+def transcript_file(tmp_path, transcript_data):
+    path = tmp_path / "P12345-US01.json"
+    path.write_text(json.dumps(transcript_data))
+    return path
+
+
+@pytest.fixture
+def s3_event():
+    def make_event(bucket, *keys):
+        return {
+            "Records": [
+                {
+                    "eventSource": "aws:s3",
+                    "eventTime": "1970-01-01T00:00:00.000Z",
+                    "s3": {
+                        "bucket": {"name": bucket},
+                        "object": {
+                            "key": key,
+                            "eTag": "0123456789abcdef0123456789abcdef",
+                            "sequencer": f"0A1B2C3D4E5F67890{index}",
+                        },
+                    },
+                }
+                for index, key in enumerate(keys)
+            ]
+        }
+
+    return make_event
+
+
 @pytest.fixture
 def event(request):
     filename = request.param
@@ -183,7 +220,8 @@ def files_for_tests(
         converted=docx_file,
         generated_converted=f"{test_docket_number} {common_filename}.docx",
         generated_transcription=f"{test_docket_number}.json",
-        transcription_job_name=f"audiotojson-{test_docket_number}",
+        # Prefix only, the job name ends in a per-upload suffix
+        transcription_job_name=f"audiotojson-{test_docket_number}-",
     )
 
 
@@ -292,22 +330,25 @@ def delete_test_job(files_for_tests):
 
     yield
     # Cleanup code will be executed after all tests have finished
+    # Job names end in a per-upload suffix, so find them by prefix
+    response = transcribe.list_transcription_jobs(
+        JobNameContains=files_for_tests.transcription_job_name
+    )
+    for job in response["TranscriptionJobSummaries"]:
+        delete_job(transcribe, job["TranscriptionJobName"])
+
+
+def delete_job(transcribe, job_name):
     job_del_attempts = 0
     error = None
 
     while True:
         try:
-            transcribe.delete_transcription_job(
-                TranscriptionJobName=files_for_tests.transcription_job_name
-            )
-            print(
-                f"Deleted transcription job: {files_for_tests.transcription_job_name}"
-            )
+            transcribe.delete_transcription_job(TranscriptionJobName=job_name)
+            print(f"Deleted transcription job: {job_name}")
             break
         except transcribe.exceptions.BadRequestException:
-            print(
-                f"Transcription job to del not found: {files_for_tests.transcription_job_name}"
-            )
+            print(f"Transcription job to del not found: {job_name}")
             break
         except Exception as e:
             error = e
@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+# Lambda deploys each function directory as its own code root, so modules
+# inside a function import their siblings top-level (e.g. ``import transcript``).
+# Mirror that layout when the functions are imported as a package (tests, tools).
+for function_dir in sorted(Path(__file__).parent.iterdir()):
+    if function_dir.is_dir() and (function_dir / "app.py").exists():
+        if str(function_dir) not in sys.path:
+            sys.path.insert(0, str(function_dir))
+
+# Layers are unpacked onto the Lambda path (/opt/python), so their modules are
+# imported top-level too (e.g. ``import metrics``).
+for layer_dir in sorted((Path(__file__).parent.parent / "layers").iterdir()):
+    if layer_dir.is_dir() and str(layer_dir) not in sys.path:
+        sys.path.insert(0, str(layer_dir))
@@ -1,65 +1,595 @@
-import re
-from time import time
-from uuid import uuid4
+import metrics
+import compression
+import dockets
+import manifest
+import search
+import sidecar
+import workspace
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from os import environ
-from io import StringIO
-from contextlib import redirect_stdout
+from os.path import getsize
+from io import BytesIO, StringIO, SEEK_END
+from contextlib import closing, redirect_stdout
 from logging import getLogger
 from urllib.parse import unquote_plus
-from json import dumps
-from pathlib import Path
+from json import dumps, loads
+from tempfile import SpooledTemporaryFile
+from shutil import copyfileobj
 from boto3 import client
-from tscribe import write as docx_writer
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from chart import get_chart_mode
+from docx_renderer import RENDERER_VERSION, template
+from ooxml import skeleton
+from exporters import get_exporter, save_docx
+from streaming import stream_turns, write_docx_stream
+from transcript import load_transcript, parse_transcript
 
 
-s3_client = client("s3")
-valid_docket_type1 = re.compile(r"P\d+-\w{2}\d{2}", flags=re.IGNORECASE)
-valid_docket_type2 = re.compile(r"\w{3}-\d{3}\w{2}\d{2}")
+MB = 1024 * 1024
+# Shared by every invocation in a warm container
+s3_client = client(
+    "s3",
+    config=Config(
+        max_pool_connections=int(environ.get("S3_MAX_POOL_CONNECTIONS", 10)),
+        retries={
+            "max_attempts": int(environ.get("S3_MAX_ATTEMPTS", 5)),
+            "mode": "standard",
+        },
+    ),
+)
+transfer_config = TransferConfig(
+    multipart_threshold=int(environ.get("MULTIPART_THRESHOLD_MB", 8)) * MB,
+    multipart_chunksize=int(environ.get("MULTIPART_CHUNKSIZE_MB", 8)) * MB,
+    max_concurrency=int(environ.get("TRANSFER_MAX_CONCURRENCY", 10)),
+)
+# Records of one event converted at the same time
+MAX_WORKERS = int(environ.get("MAX_WORKERS", 4))
+# Streamed documents stay in memory up to this size, then spill to /tmp
+STREAM_SPOOL_MB = int(environ.get("STREAM_SPOOL_MB", 32))
+# Names the outputs of records without a docket
+DOCKET_FALLBACK = "Conversion"
 logger = getLogger()
 logger.setLevel("INFO")
 
 
+@metrics.instrument("ConvertToDocx")
 def lambda_handler(event, context):
-    re.purge()
-
     common_filename = environ.get("COMMON_FILENAME")
     if not common_filename:
         raise Exception("Cannot find env COMMON_FILENAME")
 
-    logger.info("## EVENT")
-    logger.info(dumps(event, indent=2))
+    # Re-render even when the output is already up to date
+    force = event.get("force") or environ.get("FORCE_RENDER", "false") == "true"
+
+    records = event["Records"]
+    # In queue mode every record is a message holding an S3 notification
+    if records and records[0].get("eventSource") == "aws:sqs":
+        return convert_messages(records, common_filename, force)
+    results = process_records(
+        records, lambda record: convert_record(record, common_filename, force)
+    )
+    return batch_report(results)
+
+
+def convert_messages(messages, common_filename, force=False):
+    """Convert the S3 records of a batch of queued notifications.
+
+    A message fails when any of its records does, and is reported by its
+    ``messageId`` so that only failed messages are received again. A record
+    delivered in several messages of the batch is converted once.
+    """
+    failed = set()
+    owners = {}
+    for message in messages:
+        try:
+            records = get_s3_records(message)
+        except (ValueError, KeyError, TypeError):
+            logger.exception(f"Unreadable message {message['messageId']}")
+            failed.add(message["messageId"])
+            continue
+        for record in records:
+            s3_object = record["s3"]["object"]
+            identity = (
+                record["s3"]["bucket"]["name"],
+                s3_object["key"],
+                s3_object.get("eTag"),
+            )
+            owners.setdefault(identity, (record, []))[1].append(message["messageId"])
+
+    results = process_records(
+        [record for record, _ in owners.values()],
+        lambda record: convert_record(record, common_filename, force),
+    )
+    for (_, message_ids), result in zip(owners.values(), results):
+        if result["status"] == "failure":
+            failed.update(message_ids)
+    results = [
+        {
+            "itemIdentifier": message["messageId"],
+            "status": "failure" if message["messageId"] in failed else "success",
+        }
+        for message in messages
+    ]
+    return batch_report(results, partial=True)
+
+
+def get_s3_records(message):
+    """The S3 records in a message, none in S3's test event"""
+    return loads(message["body"]).get("Records", [])
+
 
+def convert_record(record, common_filename, force=False):
     # key includes directory path (e.g., transcribed/P12345-US01)
-    key = unquote_plus(event["Records"][0]["s3"]["object"]["key"])
+    key = unquote_plus(record["s3"]["object"]["key"])
     # Docket only
     docket = get_docket(key)
-    download_bucket = event["Records"][0]["s3"]["bucket"]["name"]
+    download_bucket = record["s3"]["bucket"]["name"]
     upload_bucket = download_bucket
-    # Create a path in the Lambda tmp directory to save the file to
-    download_path = f"/tmp/{uuid4()}.json"
-    # Create another path to save the encrypted file to
-    upload_path = f"/tmp/converted-{uuid4()}.docx"
-
-    download_file(download_bucket, key, download_path)
     new_key = make_new_key(docket, common_filename)
-    result = make_docx_file(download_path, upload_path)
-    upload_file(upload_path, upload_bucket, new_key)
 
-    logger.info("## DONE")
-    logger.info(result)
+    renderer = environ.get("DOCX_RENDERER", "native")
+    mode = environ.get("CONVERT_MODE", "memory")
+    # Only a transcript parsed in memory can be exported to several formats
+    if mode == "memory" and renderer == "native":
+        export_formats = get_export_formats()
+    else:
+        export_formats = ["docx"]
+    outputs = {
+        export_format: make_new_key(docket, common_filename, export_format)
+        for export_format in export_formats
+    }
+
+    # Compression needs to know whether the transcript was rewritten yet
+    head = None
+    if compression.get_encoding() != "identity":
+        with metrics.stage("Check"):
+            head = head_transcript(download_bucket, key)
+    stamps = {
+        "source-etag": get_source_etag(record, download_bucket, key, head),
+        "renderer-version": get_renderer_version(renderer),
+    }
+    if not force:
+        outputs = {
+            export_format: output_key
+            for export_format, output_key in outputs.items()
+            if not is_up_to_date(upload_bucket, output_key, stamps)
+        }
+    if not outputs:
+        logger.info(f"Skipped, already rendered from this transcript: {key}")
+        index_transcript(download_bucket, key, docket, stamps["source-etag"])
+        compress_transcript(download_bucket, key, head, stamps["source-etag"])
+        return f"{key} is up to date"
+
+    transcript = None
+    terms = None
+    # tscribe can only read and write files, so it always goes through /tmp
+    if mode == "stream" and renderer == "native":
+        # The postings are collected from the turns as they are streamed
+        on_turn = None
+        if search.is_enabled():
+            terms = {}
+            on_turn = partial(search.add_postings, terms)
+        with workspace.allocate() as scratch, SpooledTemporaryFile(
+            max_size=STREAM_SPOOL_MB * MB, dir=scratch.path
+        ) as buffer:
+            result = make_docx_stream(download_bucket, key, buffer, on_turn)
+            sizes = {new_key: get_size(buffer)}
+            upload_fileobj(buffer, upload_bucket, new_key, stamps)
+    elif mode == "memory" and renderer == "native":
+        transcript = get_transcript(download_bucket, key, stamps["source-etag"])
+        results = []
+        sizes = {}
+        for export_format, output_key in outputs.items():
+            buffer, result = make_export_buffer(transcript, export_format)
+            sizes[output_key] = get_size(buffer)
+            upload_fileobj(buffer, upload_bucket, output_key, stamps)
+            results.append(result)
+        result = " ".join(results)
+    else:
+        # Removed again however the conversion ends
+        with workspace.allocate() as scratch:
+            download_path = scratch.file("transcript.json")
+            upload_path = scratch.file("converted.docx")
+
+            download_file(download_bucket, key, download_path)
+            scratch.check_budget()
+            result = make_docx_file(download_path, upload_path, renderer)
+            scratch.check_budget()
+            sizes = {new_key: getsize(upload_path)}
+            upload_file(upload_path, upload_bucket, new_key, stamps)
+    index_transcript(
+        download_bucket, key, docket, stamps["source-etag"], transcript, terms
+    )
+    record_progress(download_bucket, docket, key, record, sizes)
+    compress_transcript(download_bucket, key, head, stamps["source-etag"])
+    return result
+
+
+def get_export_formats():
+    formats = environ.get("EXPORT_FORMATS", "docx").split(",")
+    return [
+        export_format.strip().lower()
+        for export_format in formats
+        if export_format.strip()
+    ]
+
+
+@metrics.stage("Check")
+def get_source_etag(record, download_bucket, key, head=None):
+    """ETag of the transcript as written, the same after it is compressed"""
+    if head and compression.LOGICAL_ETAG in head["Metadata"]:
+        return head["Metadata"][compression.LOGICAL_ETAG]
+    etag = record["s3"]["object"].get("eTag")
+    if not etag:
+        head = head or head_transcript(download_bucket, key)
+        etag = head["ETag"]
+    return etag.strip('"')
+
+
+def head_transcript(download_bucket, key):
+    return s3_client.head_object(Bucket=download_bucket, Key=key)
+
+
+@metrics.stage("Compress")
+def compress_transcript(download_bucket, key, head, etag):
+    """Rewrite the transcript compressed under the same key, once.
+
+    Its event is skipped as up to date, as the outputs are stamped with the
+    ``logical-etag`` it keeps. The GET reads and the write replaces only the
+    version that was headed, so a transcript written again in between is
+    left as it is. The transcript is compressed as it is uploaded, a part at
+    a time, so it is never held in full.
+    """
+    if head is None or head.get("ContentEncoding"):
+        return
+    encoding = compression.get_encoding()
+    try:
+        response = s3_client.get_object(
+            Bucket=download_bucket, Key=key, IfMatch=head["ETag"]
+        )
+        with closing(compression.open_encoded(response["Body"], encoding)) as body:
+            upload_if_match(
+                body,
+                download_bucket,
+                key,
+                head["ETag"],
+                ContentType=response.get("ContentType") or "application/json",
+                ContentEncoding=encoding,
+                Metadata={**response["Metadata"], compression.LOGICAL_ETAG: etag},
+            )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "PreconditionFailed":
+            logger.info(f"Not compressing {key}, it was written again")
+            return
+        # The uncompressed transcript still converts, so this is not fatal
+        logger.exception(f"Failed to compress {key}")
+        return
+    logger.info(f"Compressed {key} with {encoding}")
+
+
+def upload_if_match(body, bucket, key, etag, **kwargs):
+    """Upload ``body`` over the object only while it still has ``etag``.
+
+    One PUT when it fits in a part, else a multipart upload whose completion
+    is conditional, aborted when it fails.
+    """
+    part_size = transfer_config.multipart_chunksize
+    chunk = body.read(part_size)
+    if len(chunk) < part_size:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=chunk, IfMatch=etag, **kwargs)
+        return
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, **kwargs)[
+        "UploadId"
+    ]
+    try:
+        parts = []
+        while chunk:
+            part = s3_client.upload_part(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=len(parts) + 1,
+                Body=chunk,
+            )
+            parts.append({"ETag": part["ETag"], "PartNumber": len(parts) + 1})
+            chunk = body.read(part_size)
+        s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+            IfMatch=etag,
+        )
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+def get_renderer_version(renderer):
+    if renderer == "tscribe":
+        return "tscribe"
+    # The chart changes the document as much as the renderer does
+    chart_mode = get_chart_mode()
+    if chart_mode != "off":
+        return f"{RENDERER_VERSION}+chart-{chart_mode}"
+    return RENDERER_VERSION
+
+
+@metrics.stage("Check")
+def is_up_to_date(upload_bucket, new_key, stamps):
+    """Whether ``new_key`` was rendered by this renderer from this transcript"""
+    try:
+        head = s3_client.head_object(Bucket=upload_bucket, Key=new_key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise
+    metadata = head.get("Metadata", {})
+    return all(metadata.get(name) == value for name, value in stamps.items())
+
+
+def process_records(records, handle_record):
+    """Run ``handle_record`` over every record on a bounded thread pool"""
+    workers = max(1, min(MAX_WORKERS, len(records)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(handle_record, record) for record in records]
+
+    results = []
+    for record, future in zip(records, futures):
+        result = {"itemIdentifier": get_record_id(record)}
+        try:
+            result.update(status="success", result=future.result())
+        except Exception as e:
+            logger.exception(f"Failed to process {result['itemIdentifier']}")
+            result.update(status="failure", error=str(e))
+        logger.info(dumps({"record": result}))
+        results.append(result)
+    return results
+
+
+def batch_report(results, partial=False):
+    """Raise when any record failed, or with ``partial`` when all of them did.
+
+    Lambda ignores what an asynchronous S3 invoke returns, so only raising
+    gets those records retried, and retrying converts the ones that did
+    succeed to up-to-date outputs again, which is skipped. The queue's
+    event source reads the report, so a queued batch only fails whole when
+    nothing succeeded.
+    """
+    failures = [result for result in results if result["status"] == "failure"]
+    if failures and (not partial or len(failures) == len(results)):
+        raise Exception(
+            f"Failed to process {len(failures)} of {len(results)} record(s): "
+            + ", ".join(failure["itemIdentifier"] for failure in failures)
+        )
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": failure["itemIdentifier"]} for failure in failures
+        ]
+    }
 
 
+def get_record_id(record):
+    return unquote_plus(record["s3"]["object"]["key"])
+
+
+@metrics.stage("Download")
 def download_file(download_bucket, key, download_path):
-    s3_client.download_file(download_bucket, key, download_path)
+    # A compressed transcript is decompressed on the way to disk
+    response = s3_client.get_object(Bucket=download_bucket, Key=key)
+    with closing(compression.open_body(response)) as body, open(
+        download_path, "wb"
+    ) as fp:
+        copyfileobj(body, fp, compression.CHUNK_SIZE)
     logger.info("file downloaded")
 
 
-def upload_file(upload_path, upload_bucket, new_key):
-    s3_client.upload_file(upload_path, upload_bucket, new_key)
+@metrics.stage("Upload")
+def upload_file(upload_path, upload_bucket, new_key, metadata=None):
+    s3_client.upload_file(
+        upload_path,
+        upload_bucket,
+        new_key,
+        ExtraArgs={"Metadata": metadata or {}},
+        Config=transfer_config,
+    )
     logger.info("file uploaded")
 
 
-def make_docx_file(download_path, upload_path):
+@metrics.stage("Download")
+def read_transcript(download_bucket, key):
+    # Parse straight from the response body, nothing touches /tmp
+    response = s3_client.get_object(Bucket=download_bucket, Key=key)
+    with closing(compression.open_body(response)) as body:
+        data = load_transcript(body)
+    logger.info("file read")
+    return data
+
+
+def get_transcript(download_bucket, key, etag):
+    """The parsed transcript, from its sidecar while that is current"""
+    use_sidecar = environ.get("TRANSCRIPT_SIDECAR", "true") == "true"
+    if use_sidecar:
+        transcript = read_sidecar(download_bucket, key, etag)
+        if transcript is not None:
+            return transcript
+    data = read_transcript(download_bucket, key)
+    with metrics.stage("Parse"):
+        transcript = parse_transcript(data)
+    if use_sidecar:
+        write_sidecar(download_bucket, key, transcript, data, etag)
+    return transcript
+
+
+def read_sidecar(download_bucket, key, etag):
+    with metrics.stage("Download"):
+        try:
+            response = s3_client.get_object(
+                Bucket=download_bucket, Key=sidecar.sidecar_key(key)
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        with closing(response["Body"]) as body:
+            buffer = body.read()
+    with metrics.stage("Parse"):
+        transcript = sidecar.loads(buffer, etag)
+    if transcript is None:
+        logger.info(f"Sidecar is stale, parsing the transcript: {key}")
+    return transcript
+
+
+@metrics.stage("Upload")
+def write_sidecar(download_bucket, key, transcript, data, etag):
+    # Only saves later conversions a parse, so failing to write it is fine
+    try:
+        s3_client.put_object(
+            Bucket=download_bucket,
+            Key=sidecar.sidecar_key(key),
+            Body=sidecar.dumps(transcript, data["results"]["items"], etag),
+            ContentType="application/octet-stream",
+            Metadata={
+                "source-etag": etag,
+                "schema-version": str(sidecar.SCHEMA_VERSION),
+            },
+        )
+    except ClientError:
+        logger.exception(f"Failed to write the sidecar of {key}")
+
+
+def get_size(buffer):
+    """Size of a buffer positioned at its start, left there"""
+    size = buffer.seek(0, SEEK_END)
+    buffer.seek(0)
+    return size
+
+
+def record_progress(download_bucket, docket, key, record, sizes):
+    """Append the transcript and the outputs made from it to the manifest"""
+    if not manifest.is_enabled():
+        return
+    records = [
+        manifest.make_record(
+            docket, "transcribed", key=key, size=record["s3"]["object"].get("size")
+        )
+    ]
+    records.extend(
+        manifest.make_record(docket, "converted", key=output_key, size=size)
+        for output_key, size in sizes.items()
+    )
+    with metrics.stage("Manifest"):
+        manifest.append(s3_client, download_bucket, records)
+
+
+def index_transcript(download_bucket, key, docket, etag, transcript=None, terms=None):
+    """Put the transcript in the search index, unless it is there already.
+
+    Takes the postings from the ``transcript`` the "memory" mode parsed or
+    the ``terms`` the "stream" mode collected, else reads them from S3 the
+    way the mode reads a transcript, so "stream" stays in bounded memory.
+    The index is a side output, so failing to update it is logged rather
+    than failing the conversion, and the next conversion tries again.
+    """
+    if not search.is_enabled():
+        return
+    try:
+        with metrics.stage("Check"):
+            entry = search.read_entry(s3_client, download_bucket, docket)
+        if entry == {"etag": etag, "version": search.SCHEMA_VERSION}:
+            return
+        if terms is None and transcript is not None:
+            terms = search.postings(transcript.turns)
+        elif terms is None and environ.get("CONVERT_MODE", "memory") == "stream":
+            with metrics.stage("Parse"):
+                open_stream = transcript_opener(download_bucket, key)
+                terms = search.postings(stream_turns(open_stream))
+        elif terms is None:
+            transcript = get_transcript(download_bucket, key, etag)
+            terms = search.postings(transcript.turns)
+        update_index(download_bucket, key, docket, etag, terms)
+    except ClientError:
+        logger.exception(f"Failed to index {key}")
+
+
+@metrics.stage("Index")
+def update_index(download_bucket, key, docket, etag, terms):
+    """Write the docket's postings, merged in by MergeSearchIndex"""
+    search.add_docket(s3_client, download_bucket, docket, key, etag, terms)
+    logger.info(f"Indexed {docket}, {len(terms)} terms pending a merge")
+
+
+@metrics.stage("Upload")
+def upload_fileobj(buffer, upload_bucket, new_key, metadata=None):
+    # Switches to a multipart upload above the transfer config's threshold
+    s3_client.upload_fileobj(
+        buffer,
+        upload_bucket,
+        new_key,
+        ExtraArgs={"Metadata": metadata or {}},
+        Config=transfer_config,
+    )
+    logger.info("file uploaded")
+
+
+@metrics.stage("Render")
+def make_docx_file(download_path, upload_path, renderer=None):
+    # tscribe drags in pandas and matplotlib, so only import it when asked to
+    renderer = renderer or environ.get("DOCX_RENDERER", "native")
+    if renderer == "tscribe":
+        return make_docx_file_with_tscribe(download_path, upload_path)
+    if renderer != "native":
+        raise Exception(f"Unknown docx renderer: {renderer}")
+
+    start = perf_counter()
+    try:
+        save_docx(parse_transcript(load_transcript(download_path)), upload_path)
+    except Exception as e:
+        raise Exception(f"Failed to create docx: {str(e)}")
+    duration = round(perf_counter() - start, 2)
+    return f"{upload_path} written in {duration} seconds."
+
+
+@metrics.stage("Render")
+def make_export_buffer(transcript, export_format):
+    exporter = get_exporter(export_format)
+    start = perf_counter()
+    try:
+        buffer = BytesIO(exporter(transcript))
+    except Exception as e:
+        raise Exception(f"Failed to create {export_format}: {str(e)}")
+    duration = round(perf_counter() - start, 2)
+    return buffer, f"{export_format} written in {duration} seconds."
+
+
+def transcript_opener(download_bucket, key):
+    # Every pass over the transcript is its own streamed GET
+    def open_stream():
+        response = s3_client.get_object(Bucket=download_bucket, Key=key)
+        return compression.open_body(response)
+
+    return open_stream
+
+
+@metrics.stage("Render")
+def make_docx_stream(download_bucket, key, buffer, on_turn=None):
+    start = perf_counter()
+    try:
+        write_docx_stream(transcript_opener(download_bucket, key), buffer, on_turn)
+    except Exception as e:
+        raise Exception(f"Failed to create docx: {str(e)}")
+    buffer.seek(0)
+    duration = round(perf_counter() - start, 2)
+    return f"{key} streamed in {duration} seconds."
+
+
+def make_docx_file_with_tscribe(download_path, upload_path):
+    from tscribe import write as docx_writer
+
     with StringIO() as buf, redirect_stdout(buf):
         try:
             docx_writer(download_path, save_as=upload_path)
@@ -69,14 +599,31 @@ def make_docx_file(download_path, upload_path):
     return result
 
 
-def make_new_key(docket, common_filename):
-    return f"converted/{docket} {common_filename}.docx"
+def warm_up(renderer=None):
+    """Build the per-container caches ahead of the first conversion"""
+    renderer = renderer or environ.get("DOCX_RENDERER", "native")
+    if renderer == "tscribe":
+        # Imports pandas and matplotlib, which loads (or first builds) the
+        # font cache in MPLCONFIGDIR
+        import tscribe
+
+        return
+    template()
+    chart_mode = get_chart_mode()
+    skeleton(chart_mode != "off")
+    if chart_mode == "matplotlib":
+        # Loads (or first builds) the font cache in MPLCONFIGDIR
+        import matplotlib.figure
+
+
+def make_new_key(docket, common_filename, extension="docx"):
+    return f"converted/{docket} {common_filename}.{extension}"
 
 
 def get_docket(filename):
-    path = Path(filename)
-    match = valid_docket_type1.search(path.stem) or valid_docket_type2.search(path.stem)
-    if path.stem.startswith("Transcription") or match is None:
-        logger.warning(f"Docket not found in filename: {path.stem}")
-        return f"Conversion-{int(time())}"
-    return match.group(0).upper()
+    return dockets.get_docket(filename, DOCKET_FALLBACK)
+
+
+# Runs in the init phase, so even the first invocation finds the caches built
+if environ.get("WARM_UP", "true") == "true":
+    warm_up()
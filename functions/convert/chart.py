@@ -0,0 +1,142 @@
+"""The confidence chart of the summary: every word's confidence over time.
+
+``CHART_MODE`` picks how it is drawn, if at all:
+
+- "off" leaves it out (the default)
+- "fast" bins the words into pixels with a NumPy 2-D histogram and encodes
+  the PNG directly, without a plotting library or any fonts
+- "matplotlib" draws tscribe's labelled scatter plot, importing matplotlib
+  only when this mode is used
+
+Both modes produce a ``CHART_SIZE`` PNG, so documents keep the same layout.
+"""
+
+import os
+import struct
+import zlib
+from io import BytesIO
+import numpy as np
+
+
+CHART_MODES = ("off", "fast", "matplotlib")
+# Pixels, the size of matplotlib's default figure
+CHART_SIZE = (640, 480)
+# Left, top, right and bottom edges of the plot area in the fast chart
+PLOT_AREA = (56, 24, 616, 432)
+WHITE = (255, 255, 255)
+AXIS = (64, 64, 64)
+GRID = (230, 230, 230)
+WORD = (31, 119, 180)
+MEAN = (255, 0, 0)
+
+
+def get_chart_mode():
+    mode = os.environ.get("CHART_MODE", "off")
+    if mode not in CHART_MODES:
+        raise Exception(f"Unknown chart mode: {mode}")
+    return mode
+
+
+def make_chart(stats, mode=None):
+    """Return the chart of ``stats`` as PNG bytes, or None without one"""
+    mode = mode or get_chart_mode()
+    if mode == "off" or not len(stats.timestamps):
+        return None
+    if mode == "fast":
+        return fast_chart(stats.timestamps, stats.confidences)
+    if mode == "matplotlib":
+        return matplotlib_chart(stats.timestamps, stats.confidences)
+    raise Exception(f"Unknown chart mode: {mode}")
+
+
+def fast_chart(timestamps, confidences):
+    left, top, right, bottom = PLOT_AREA
+    width, height = CHART_SIZE
+    pixels = np.full((height, width, 3), WHITE, dtype=np.uint8)
+
+    # Grid lines every 10 percent, then the axes
+    for percent in range(0, 101, 10):
+        pixels[_y(percent), left:right] = GRID
+    pixels[top : bottom + 1, left] = AXIS
+    pixels[bottom, left : right + 1] = AXIS
+
+    # Words that land on the same pixel are drawn once
+    timestamps = np.asarray(timestamps, dtype=float)
+    percents = np.floor(np.asarray(confidences, dtype=float) * 100)
+    end = max(float(timestamps.max()), 1.0)
+    counts, _, _ = np.histogram2d(
+        percents,
+        timestamps,
+        bins=[bottom - top + 1, right - left],
+        range=[[0, 100], [0, end]],
+    )
+    # Row 0 of the histogram is 0%, which is drawn at the bottom
+    hits = np.flipud(counts > 0)
+    # Thicken every hit into a 3x3 dot
+    dots = hits.copy()
+    dots[1:] |= hits[:-1]
+    dots[:-1] |= hits[1:]
+    dots[:, 1:] |= dots[:, :-1].copy()
+    dots[:, :-1] |= dots[:, 1:].copy()
+    area = pixels[top : bottom + 1, left + 1 : right + 1]
+    area[dots] = WORD
+
+    pixels[_y(float(percents.mean())), left + 1 : right + 1] = MEAN
+    return encode_png(pixels)
+
+
+def _y(percent):
+    _, top, _, bottom = PLOT_AREA
+    return bottom - int(round(percent / 100 * (bottom - top)))
+
+
+def encode_png(pixels):
+    """Encode an RGB ``(height, width, 3)`` uint8 array as a PNG"""
+    height, width, _ = pixels.shape
+    # Every scanline starts with its filter type, 0 for none
+    scanlines = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = pixels.reshape(height, width * 3)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            _png_chunk(b"IHDR", header),
+            _png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)),
+            _png_chunk(b"IEND", b""),
+        ]
+    )
+
+
+def _png_chunk(tag, data):
+    checksum = zlib.crc32(tag + data) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", checksum)
+
+
+def blank_chart():
+    """A white PNG the size of every chart"""
+    width, height = CHART_SIZE
+    return encode_png(np.full((height, width, 3), WHITE, dtype=np.uint8))
+
+
+def matplotlib_chart(timestamps, confidences):
+    # matplotlib is only imported when this mode is selected
+    from matplotlib.figure import Figure
+
+    accuracy = [int(confidence * 100) for confidence in confidences]
+    mean = sum(accuracy) / len(accuracy)
+
+    # A Figure of its own rather than pyplot's global one, so records
+    # converted on other threads cannot draw into it
+    figure = Figure(figsize=(CHART_SIZE[0] / 100, CHART_SIZE[1] / 100), dpi=100)
+    axes = figure.subplots()
+    axes.scatter(timestamps, accuracy)
+    axes.plot([timestamps[0], timestamps[-1]], [mean, mean], "r")
+    axes.set_xlabel("Time (seconds)")
+    axes.set_ylabel("Accuracy (percent)")
+    axes.set_yticks(range(0, 101, 10))
+    axes.set_title("Accuracy during transcript")
+    axes.legend(["Accuracy average (mean)", "Individual words"], loc="lower center")
+
+    buffer = BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
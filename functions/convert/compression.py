@@ -0,0 +1,149 @@
+"""Compressed transcripts in the download bucket.
+
+Transcribe JSON compresses 5-10x. With ``TRANSCRIPT_ENCODING`` set to
+``gzip`` or ``zstd``, ConvertToDocx rewrites ``transcribed/<docket>.json``
+compressed once it has converted it, under the same key so the S3 trigger
+and the key names are unchanged, and sets ``Content-Encoding``. The rewrite
+keeps the ETag of the transcript as it was written in the ``logical-etag``
+metadata, which the outputs and the sidecar are stamped with, so they stay
+up to date across it.
+
+``open_body`` wraps a GetObject response in a stream that decompresses as
+it is read, and ``open_encoded`` a body in one that compresses as it is
+read, so neither is ever held in full or written to a temporary file.
+"""
+
+import gzip
+import io
+import os
+import zlib
+
+
+ENCODINGS = ("identity", "gzip", "zstd")
+LOGICAL_ETAG = "logical-etag"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+CHUNK_SIZE = 256 * 1024
+
+
+def get_encoding():
+    encoding = os.environ.get("TRANSCRIPT_ENCODING", "identity")
+    if encoding not in ENCODINGS:
+        raise Exception(f"Unknown transcript encoding: {encoding}")
+    return encoding
+
+
+def compress(data, encoding):
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "zstd":
+        # Only needed for zstd, so only imported when asked for
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise Exception(f"Cannot compress with encoding: {encoding}")
+
+
+def _compressor(encoding):
+    if encoding == "gzip":
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if encoding == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    raise Exception(f"Cannot compress with encoding: {encoding}")
+
+
+def open_encoded(body, encoding):
+    """``body`` as a binary stream, compressed as it is read"""
+    return io.BufferedReader(EncodedBody(body, encoding), CHUNK_SIZE)
+
+
+def open_body(response):
+    """The object's content as a binary stream, decompressed as it is read"""
+    body = response["Body"]
+    encoding = response.get("ContentEncoding") or "identity"
+    if encoding == "identity":
+        return body
+    return io.BufferedReader(DecodedBody(body, encoding), CHUNK_SIZE)
+
+
+def _decompressor(encoding):
+    if encoding == "gzip":
+        return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    if encoding == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise Exception(f"Cannot decompress content encoding: {encoding}")
+
+
+class DecodedBody(io.RawIOBase):
+    """Reads the decompressed content of ``body`` and closes it when closed"""
+
+    def __init__(self, body, encoding):
+        self.body = body
+        self.encoding = encoding
+        self.decompressor = _decompressor(encoding)
+        self.pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            chunk = self.body.read(CHUNK_SIZE)
+            if not chunk:
+                return 0
+            self.pending = memoryview(self._decompress(chunk))
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def _decompress(self, chunk):
+        data = self.decompressor.decompress(chunk)
+        # Concatenated gzip members or zstd frames each need a new decompressor
+        while self.decompressor.eof and self.decompressor.unused_data:
+            unused = self.decompressor.unused_data
+            self.decompressor = _decompressor(self.encoding)
+            data += self.decompressor.decompress(unused)
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.body.close()
+        super().close()
+
+
+class EncodedBody(io.RawIOBase):
+    """Reads the compressed content of ``body`` and closes it when closed"""
+
+    def __init__(self, body, encoding):
+        self.body = body
+        self.compressor = _compressor(encoding)
+        self.pending = memoryview(b"")
+        self.flushed = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            if self.flushed:
+                return 0
+            chunk = self.body.read(CHUNK_SIZE)
+            if chunk:
+                self.pending = memoryview(self.compressor.compress(chunk))
+            else:
+                self.pending = memoryview(self.compressor.flush())
+                self.flushed = True
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.body.close()
+        super().close()
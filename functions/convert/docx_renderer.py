@@ -0,0 +1,115 @@
+"""Render a transcript as a docx using python-docx only.
+
+Produces the same layout as ``tscribe.write``: a title and confidence summary
+followed by a table of timestamped, speaker-labelled turns in which words
+below the confidence threshold are greyed out.
+"""
+
+import copy
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.shared import Cm, Inches, Mm, RGBColor
+from chart import make_chart
+from transcript import GREY_THRESHOLD, format_timestamp, parse_transcript
+
+
+# Stamped on every output, bump it whenever the rendered document changes
+RENDERER_VERSION = "native-1"
+TABLE_STYLE = "Light List Accent 1"
+GREY = RGBColor(204, 204, 204)
+# Time, speaker and content columns of the transcript table
+COLUMN_WIDTHS = (Inches(0.6), Inches(1), Inches(4.5))
+CHART_WIDTH = Cm(14.64)
+
+
+def write_docx(data, save_as):
+    """Write ``data`` (a loaded transcript) to ``save_as``, a path or stream"""
+    render_docx(parse_transcript(data), save_as)
+
+
+def render_docx(transcript, save_as):
+    """Write a parsed ``Transcript`` to ``save_as``, a path or stream"""
+    document = new_document()
+    chart = make_chart(transcript.stats)
+    write_summary(document, transcript.job_name, transcript.stats, chart=chart)
+    write_turns(document, transcript.turns)
+    document.save(save_as)
+
+
+def new_document():
+    # Cloning the loaded template is cheaper than parsing it again. Only the
+    # package is copied, proxies may cache detached copies of its elements
+    package = copy.deepcopy(template().part.package)
+    return package.main_document_part.document
+
+
+@lru_cache(maxsize=1)
+def template():
+    """python-docx's default template with the page setup, loaded once"""
+    document = Document()
+    # A4 Size
+    document.sections[0].page_width = Mm(210)
+    document.sections[0].page_height = Mm(297)
+    document.styles["Normal"].font.name = "Calibri"
+    return document
+
+
+def write_summary(document, job_name, stats, produced=None, chart=None):
+    """Write the title and confidence summary, with ``chart`` PNG if given"""
+    document.add_heading(f"Transcription of {job_name}", level=1)
+    document.add_paragraph(
+        "Transcription using AWS Transcribe automatic speech recognition."
+    )
+    document.add_paragraph(produced or produced_on())
+    document.add_paragraph()  # Spacing
+    document.add_paragraph(
+        f"Grey text has less than {int(GREY_THRESHOLD * 100)}% confidence."
+    )
+
+    table = document.add_table(rows=1, cols=3)
+    table.style = document.styles[TABLE_STYLE]
+    table.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    set_row(table.rows[0].cells, ("Confidence", "Count", "Percentage"))
+    for row in stats.rows():
+        set_row(table.add_row().cells, row)
+    document.add_paragraph()  # Spacing
+    if chart:
+        document.add_picture(BytesIO(chart), width=CHART_WIDTH)
+        document.paragraphs[-1].alignment = WD_ALIGN_PARAGRAPH.CENTER
+    document.add_page_break()
+
+
+def produced_on():
+    return datetime.now().strftime("Document produced on %A %d %B %Y at %X.")
+
+
+def write_turns(document, turns):
+    table = document.add_table(rows=1, cols=3)
+    table.style = document.styles[TABLE_STYLE]
+    header = table.rows[0].cells
+    set_row(header, ("Time", "Speaker", "Content"))
+    set_widths(header)
+
+    for turn in turns:
+        cells = table.add_row().cells
+        cells[0].text = format_timestamp(turn.start_time)
+        cells[1].text = turn.speaker
+        paragraph = cells[2].paragraphs[0]
+        for text, confidence, _, _ in turn.runs:
+            run = paragraph.add_run(text)
+            if confidence is not None and confidence < GREY_THRESHOLD:
+                run.font.color.rgb = GREY
+        set_widths(cells)
+
+
+def set_row(cells, values):
+    for cell, value in zip(cells, values):
+        cell.text = value
+
+
+def set_widths(cells):
+    for cell, width in zip(cells, COLUMN_WIDTHS):
+        cell.width = width
@@ -0,0 +1,158 @@
+"""Writers over a parsed ``Transcript``, one per export format.
+
+Every writer returns the encoded file, so a transcript parsed once can be
+exported to any selection of formats.
+"""
+
+import csv
+import ooxml
+import os
+import textwrap
+from io import BytesIO, StringIO
+from docx_renderer import render_docx
+from transcript import format_timestamp
+
+
+# Caption lines wider than this are wrapped
+CAPTION_WIDTH = 80
+# A turn is split into cues of at most this many lines and seconds
+CAPTION_LINES = 2
+CAPTION_SECONDS = 7.0
+# Both write the same document, "ooxml" without python-docx's object model
+DOCX_BACKENDS = {"python-docx": render_docx, "ooxml": ooxml.render_docx}
+
+
+def export_docx(transcript):
+    buffer = BytesIO()
+    save_docx(transcript, buffer)
+    return buffer.getvalue()
+
+
+def save_docx(transcript, save_as, backend=None):
+    """Write a docx with ``backend``, by default the one set in DOCX_BACKEND"""
+    backend = backend or os.environ.get("DOCX_BACKEND", "python-docx")
+    try:
+        render = DOCX_BACKENDS[backend]
+    except KeyError:
+        raise Exception(f"Unknown docx backend: {backend}")
+    render(transcript, save_as)
+
+
+def export_srt(transcript):
+    cues = []
+    number = 0
+    for turn in _captioned(transcript.turns):
+        label = f"{turn.speaker}: " if turn.speaker else ""
+        for start, end, text in _cues(turn, label):
+            number += 1
+            timing = _caption_timing(start, end, ",")
+            cues.append(f"{number}\n{timing}\n{_wrap(label + text)}\n")
+    return "\n".join(cues).encode("utf-8")
+
+
+def export_vtt(transcript):
+    cues = ["WEBVTT\n"]
+    for turn in _captioned(transcript.turns):
+        for start, end, text in _cues(turn):
+            timing = _caption_timing(start, end, ".")
+            text = _wrap(text)
+            if turn.speaker:
+                text = f"<v {turn.speaker}>{text}"
+            cues.append(f"{timing}\n{text}\n")
+    return "\n".join(cues).encode("utf-8")
+
+
+def export_csv(transcript):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["start_time", "end_time", "speaker", "comment"])
+    for turn in transcript.turns:
+        writer.writerow(
+            [
+                format_timestamp(turn.start_time),
+                format_timestamp(turn.end_time),
+                turn.speaker,
+                turn.text,
+            ]
+        )
+    return buffer.getvalue().encode("utf-8")
+
+
+def export_txt(transcript):
+    lines = []
+    for turn in transcript.turns:
+        speaker = f" {turn.speaker}:" if turn.speaker else ""
+        lines.append(f"[{format_timestamp(turn.start_time)}]{speaker} {turn.text}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+EXPORTERS = {
+    "docx": export_docx,
+    "srt": export_srt,
+    "vtt": export_vtt,
+    "csv": export_csv,
+    "txt": export_txt,
+}
+
+
+def get_exporter(export_format):
+    try:
+        return EXPORTERS[export_format]
+    except KeyError:
+        raise Exception(f"Unknown export format: {export_format}")
+
+
+def _captioned(turns):
+    return (turn for turn in turns if turn.text)
+
+
+def _cues(turn, label=""):
+    """(start, end, text) of the cues ``turn`` is split into.
+
+    A cue takes words while they fit in ``CAPTION_LINES`` lines after
+    ``label`` and span at most ``CAPTION_SECONDS``, timed by its words. The
+    first cue starts and the last ends with the turn.
+    """
+    words = []
+    for text, _, start_time, end_time in turn.runs:
+        # Punctuation belongs to the word before it
+        if start_time is None and words:
+            words[-1][0] += text
+        else:
+            words.append([text, start_time, end_time])
+
+    cues = []
+    cue = []
+    for word in words:
+        if cue and not _fits(cue + [word], label):
+            cues.append(cue)
+            cue = []
+        cue.append(word)
+    cues.append(cue)
+
+    for number, cue in enumerate(cues):
+        start = turn.start_time if number == 0 else cue[0][1]
+        end = turn.end_time if number == len(cues) - 1 else cue[-1][2]
+        yield start, end, "".join(text for text, _, _ in cue).lstrip()
+
+
+def _fits(cue, label):
+    start, end = cue[0][1], cue[-1][2]
+    if start is not None and end is not None and end - start > CAPTION_SECONDS:
+        return False
+    text = label + "".join(text for text, _, _ in cue).lstrip()
+    return len(textwrap.wrap(text, CAPTION_WIDTH)) <= CAPTION_LINES
+
+
+def _caption_timing(start, end, separator):
+    return f"{_caption_time(start, separator)} --> {_caption_time(end, separator)}"
+
+
+def _caption_time(seconds, separator):
+    millis = int(round(float(seconds) * 1000))
+    total, millis = divmod(millis, 1000)
+    return f"{format_timestamp(total)}{separator}{millis:03d}"
+
+
+def _wrap(text):
+    return "\n".join(textwrap.wrap(text, CAPTION_WIDTH)) or text
@@ -0,0 +1,23 @@
+import metrics
+import search
+import logging
+import json
+import boto3
+import os
+
+
+s3_client = boto3.client("s3")
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+
+@metrics.instrument("MergeSearchIndex")
+def lambda_handler(event, context):
+    bucket = os.environ.get("DOWNLOAD_BUCKET_NAME")
+    if not bucket:
+        raise Exception("Cannot find env DOWNLOAD_BUCKET_NAME")
+    workers = int(os.environ.get("MERGE_WORKERS", 4))
+    with metrics.stage("Merge"):
+        result = search.merge_pending(s3_client, bucket, workers)
+    logger.info(json.dumps({"merge": result}))
+    return result
@@ -0,0 +1,154 @@
+"""Write a docx by serializing ``word/document.xml`` directly with lxml.
+
+python-docx builds a proxy object for every paragraph, cell and run and keeps
+the whole tree until it saves. Here the transcript rows are written with
+``lxml.etree.xmlfile`` straight into the zip entry instead, one row at a
+time. Everything else, the styles, settings, summary layout and chart
+placement, comes from a package skeleton that python-docx builds once per
+container, so the result matches ``docx_renderer`` exactly.
+"""
+
+import copy
+import zipfile
+from functools import lru_cache
+from io import BytesIO
+from lxml import etree
+from docx.oxml.ns import qn
+from chart import blank_chart, make_chart
+from docx_renderer import (
+    COLUMN_WIDTHS,
+    new_document,
+    produced_on,
+    write_summary,
+    write_turns,
+)
+from transcript import CONFIDENCE_BANDS, GREY_THRESHOLD, format_timestamp
+
+
+DOCUMENT_PART = "word/document.xml"
+MEDIA_PREFIX = "word/media/"
+CELL_WIDTHS = tuple(str(width.twips) for width in COLUMN_WIDTHS)
+GREY_HEX = "CCCCCC"
+# xmlfile mis-prefixes the Clark name of the xml namespace, the literal works
+XML_SPACE = "xml:space"
+
+
+class _PlaceholderStats:
+    """Confidence table rows whose values are filled in per document"""
+
+    def rows(self):
+        for index, (label, _) in enumerate(CONFIDENCE_BANDS):
+            yield label, f"{{count_{index}}}", f"{{percentage_{index}}}"
+
+
+@lru_cache(maxsize=2)
+def skeleton(with_chart=False):
+    """Return the package parts and the document root with placeholders.
+
+    ``with_chart`` adds a blank chart, its image is swapped per document.
+    """
+    document = new_document()
+    chart = blank_chart() if with_chart else None
+    write_summary(document, "{job_name}", _PlaceholderStats(), "{produced}", chart)
+    write_turns(document, [])
+    buffer = BytesIO()
+    document.save(buffer)
+
+    with zipfile.ZipFile(buffer) as package:
+        parts = [(info, package.read(info)) for info in package.infolist()]
+        root = etree.fromstring(package.read(DOCUMENT_PART))
+    return parts, root
+
+
+def render_docx(transcript, save_as):
+    """Write a parsed ``Transcript`` to ``save_as``, a path or stream"""
+    write_package(save_as, transcript.job_name, transcript.stats, transcript.turns)
+
+
+def write_package(save_as, job_name, stats, turns):
+    """Write the skeleton to ``save_as`` with the summary and ``turns`` filled in.
+
+    ``turns`` may be any iterable, it is consumed while the document is written.
+    """
+    chart = make_chart(stats)
+    parts, root = skeleton(chart is not None)
+    values = {"job_name": job_name, "produced": produced_on()}
+    for index, (_, count, percentage) in enumerate(stats.rows()):
+        values[f"count_{index}"] = count
+        values[f"percentage_{index}"] = percentage
+
+    with zipfile.ZipFile(save_as, "w", zipfile.ZIP_DEFLATED) as target:
+        for info, data in parts:
+            if info.filename.startswith(MEDIA_PREFIX):
+                target.writestr(info, chart)
+                continue
+            if info.filename != DOCUMENT_PART:
+                target.writestr(info, data)
+                continue
+            with target.open(DOCUMENT_PART, "w") as part:
+                write_document(part, root, values, turns)
+
+
+def write_document(part, root, values, turns):
+    """Serialize ``root`` with ``turns`` appended to its last table"""
+    body = root.find(qn("w:body"))
+    *before, table, section = list(body)
+    with etree.xmlfile(part, encoding="UTF-8") as xf:
+        xf.write_declaration(standalone=True)
+        with xf.element(root.tag, root.attrib, nsmap=root.nsmap):
+            with xf.element(body.tag, body.attrib):
+                for element in before:
+                    xf.write(fill(element, values))
+                with xf.element(table.tag, table.attrib):
+                    for element in table:
+                        xf.write(element)
+                    for turn in turns:
+                        write_row(xf, turn)
+                        xf.flush()
+                xf.write(section)
+
+
+def fill(element, values):
+    """``element``, or a copy with the placeholders of its text filled in"""
+    if not any(_is_placeholder(t) for t in element.iter(qn("w:t"))):
+        return element
+    element = copy.deepcopy(element)
+    for t in element.iter(qn("w:t")):
+        if _is_placeholder(t):
+            t.text = t.text.format_map(values)
+    return element
+
+
+def _is_placeholder(t):
+    return t.text is not None and "{" in t.text
+
+
+def write_row(xf, turn):
+    cells = (
+        [(format_timestamp(turn.start_time), None, None, None)],
+        [(turn.speaker, None, None, None)],
+        turn.runs,
+    )
+    with xf.element(qn("w:tr")):
+        for width, runs in zip(CELL_WIDTHS, cells):
+            with xf.element(qn("w:tc")):
+                with xf.element(qn("w:tcPr")):
+                    with xf.element(
+                        qn("w:tcW"), {qn("w:type"): "dxa", qn("w:w"): width}
+                    ):
+                        pass
+                with xf.element(qn("w:p")):
+                    for text, confidence, _, _ in runs:
+                        write_run(xf, text, confidence)
+
+
+def write_run(xf, text, confidence):
+    with xf.element(qn("w:r")):
+        if confidence is not None and confidence < GREY_THRESHOLD:
+            with xf.element(qn("w:rPr")):
+                with xf.element(qn("w:color"), {qn("w:val"): GREY_HEX}):
+                    pass
+        # Keep the leading space in front of every word
+        attributes = {XML_SPACE: "preserve"} if text != text.strip() else {}
+        with xf.element(qn("w:t"), attributes):
+            xf.write(text)
@@ -0,0 +1,464 @@
+"""A full-text index of the transcripts, kept in the download bucket.
+
+Each converted transcript is tokenized into lower-case terms, stop words
+dropped, and every turn that says a term is a posting of
+``[speaker, start_time, count]`` under the term and the docket.
+
+Converting a transcript writes only its own postings, one object per docket,
+``index/dockets/<docket>.json``, and a marker under ``index/pending/``, so
+conversions never touch shared objects and cannot race. MergeSearchIndex
+merges the pending dockets, one merge at a time, into the partitions,
+``index/partitions/<partition>.json``, then deletes the markers it merged.
+
+A partition holds the terms starting with its name, and ``index/layout.json``
+lists the partitions. The index starts as one partition, and a merge splits
+a partition larger than ``PARTITION_BYTES`` into one per next character of
+its terms, so partitions stay small however large the index grows. A query
+reads the partition of each of its terms, and for a term ending in ``*``,
+which matches every term it starts, only the partitions of terms with that
+start. Searches are as fresh as the last merge.
+
+The docket object keeps the starts of the terms merged before, so a merge
+rewrites only the partitions holding the batch's terms, new or old. A docket
+merged again replaces its postings there, so a transcript converted again
+loses its old ones and a marker merged twice is harmless.
+"""
+
+import json
+import logging
+import os
+import re
+import uuid
+from collections import Counter
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+import compression
+
+
+SCHEMA_VERSION = 2
+DOCKETS_PREFIX = "index/dockets/"
+PENDING_PREFIX = "index/pending/"
+PARTITIONS_PREFIX = "index/partitions/"
+LAYOUT_KEY = "index/layout.json"
+# A partition larger than this, compressed, is split by the next character
+PARTITION_BYTES = 1024 * 1024
+# Characters partitions are split by, any other counts as "_"
+PARTITION_CHARACTERS = "abcdefghijklmnopqrstuvwxyz0123456789_"
+# Partitions are split by at most the first characters of a term
+MAX_PARTITION_DEPTH = 4
+# Pending dockets merged into the partitions at a time
+MERGE_BATCH = 200
+# Keys deleted by one DeleteObjects call
+DELETE_BATCH = 1000
+MAX_TERM_LENGTH = 64
+TOKEN = re.compile(r"[^\W_]+(?:['’][^\W_]+)*")
+# Said in nearly every call, they would be the largest postings of all
+STOP_WORDS = frozenset(
+    """
+    a about after all also am an and any are as at be because been but by
+    can could did do does don't for from had has have he her here him his
+    how i i'm if in into is it it's its just know like me my no not now of
+    oh ok okay on one or our out so some than that that's the their them
+    then there they this to uh um up us was we well were what when which
+    who will with would yeah yes you your
+    """.split()
+)
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+
+def is_enabled():
+    return os.environ.get("SEARCH_INDEX", "false") == "true"
+
+
+def tokenize(text):
+    """The terms of ``text``, lower-cased, in order"""
+    return [
+        token.casefold().replace("’", "'")
+        for token in TOKEN.findall(text)
+        if len(token) <= MAX_TERM_LENGTH
+    ]
+
+
+def index_terms(text):
+    """The terms of ``text`` that are indexed, without stop words"""
+    return [term for term in tokenize(text) if term not in STOP_WORDS]
+
+
+def term_prefix(term):
+    """The start of ``term`` partitions are named by, padded with "_" """
+    prefix = "".join(
+        c if c in PARTITION_CHARACTERS else "_" for c in term[:MAX_PARTITION_DEPTH]
+    )
+    return prefix.ljust(MAX_PARTITION_DEPTH, "_")
+
+
+def partition_at(prefix, partitions):
+    """The one of ``partitions`` that a term starting ``prefix`` is kept in"""
+    for depth in range(MAX_PARTITION_DEPTH + 1):
+        if prefix[:depth] in partitions:
+            return prefix[:depth]
+    return None
+
+
+def partition_of(term, partitions):
+    return partition_at(term_prefix(term), partitions)
+
+
+def partition_key(partition):
+    # "-" is no partition character, so the first partition, "", has a name
+    return f"{PARTITIONS_PREFIX}{partition or '-'}.json"
+
+
+def docket_key(docket):
+    return f"{DOCKETS_PREFIX}{docket}.json"
+
+
+def pending_key(docket):
+    return f"{PENDING_PREFIX}{docket}/{uuid.uuid4().hex}"
+
+
+def docket_of(key):
+    return key.removeprefix(PENDING_PREFIX).partition("/")[0]
+
+
+def add_postings(terms, turn):
+    """Add the postings of ``turn`` to ``terms``, by term"""
+    text = "".join(run[0] for run in turn.runs)
+    for term, count in Counter(index_terms(text)).items():
+        terms.setdefault(term, []).append([turn.speaker, turn.start_time, count])
+
+
+def postings(turns):
+    """Postings of every term said in ``turns``, by term"""
+    terms = {}
+    for turn in turns:
+        add_postings(terms, turn)
+    return terms
+
+
+def by_partition(terms, partitions):
+    """``terms`` split into the ones of ``partitions`` they are kept in"""
+    split = {}
+    for term, term_postings in terms.items():
+        split.setdefault(partition_of(term, partitions), {})[term] = term_postings
+    return split
+
+
+def empty_partition():
+    return {"version": SCHEMA_VERSION, "terms": {}}
+
+
+def empty_layout():
+    return {"version": SCHEMA_VERSION, "partitions": [""], "split": []}
+
+
+def split_partition(partition, content):
+    """The ``content`` of ``partition`` split by the next character of its terms"""
+    children = {partition + c: {} for c in PARTITION_CHARACTERS}
+    for term, term_dockets in content["terms"].items():
+        children[term_prefix(term)[: len(partition) + 1]][term] = term_dockets
+    return {
+        child: {"version": SCHEMA_VERSION, "terms": terms}
+        for child, terms in children.items()
+    }
+
+
+def merge(partition, dockets):
+    """``partition`` with the postings of each docket replaced by its terms"""
+    merged = {}
+    for term, term_dockets in partition["terms"].items():
+        remaining = {d: p for d, p in term_dockets.items() if d not in dockets}
+        if remaining:
+            merged[term] = remaining
+    for docket, terms in dockets.items():
+        for term, term_postings in terms.items():
+            merged.setdefault(term, {})[docket] = term_postings
+    return {"version": SCHEMA_VERSION, "terms": merged}
+
+
+def dumps(content):
+    data = json.dumps(content, separators=(",", ":"), sort_keys=True).encode()
+    return compression.compress(data, "gzip")
+
+
+def loads(stream):
+    content = json.load(stream)
+    if content.get("version") != SCHEMA_VERSION:
+        raise Exception(f"Unknown search index version: {content.get('version')}")
+    return content
+
+
+def parse_query(query):
+    """(term, is_prefix) for every indexed term of ``query``, once each"""
+    terms = {}
+    for word in query.split():
+        tokens = tokenize(word)
+        for index, token in enumerate(tokens):
+            is_prefix = word.endswith("*") and index == len(tokens) - 1
+            if is_prefix or token not in STOP_WORDS:
+                terms[(token, is_prefix)] = None
+    return list(terms)
+
+
+def query_partitions(query, partitions):
+    """The ones of ``partitions`` that ``query`` needs"""
+    needed = set()
+    for term, is_prefix in parse_query(query):
+        if is_prefix:
+            start = term_prefix(term)[: len(term)]
+            needed.update(
+                partition
+                for partition in partitions
+                if partition.startswith(start) or start.startswith(partition)
+            )
+        else:
+            needed.add(partition_of(term, partitions))
+    return sorted(needed)
+
+
+def search(partitions, query, limit=10):
+    """Dockets matching ``query`` in the ``partitions`` it needs, best first.
+
+    A docket ranks by the number of query terms it matches, then by how many
+    times it says them. Its matches are in time order.
+    """
+    hits = {}
+    for term, is_prefix in parse_query(query):
+        if is_prefix:
+            matched = [
+                (other, term_dockets)
+                for partition in partitions.values()
+                for other, term_dockets in partition["terms"].items()
+                if other.startswith(term)
+            ]
+        else:
+            partition = partition_of(term, partitions)
+            terms = partitions[partition]["terms"] if partition is not None else {}
+            matched = [(term, terms[term])] if term in terms else []
+        found = set()
+        for other, term_dockets in matched:
+            for docket, term_postings in term_dockets.items():
+                hit = hits.setdefault(
+                    docket, {"docket": docket, "terms": 0, "count": 0, "matches": []}
+                )
+                found.add(docket)
+                for speaker, start_time, count in term_postings:
+                    hit["count"] += count
+                    hit["matches"].append(
+                        {
+                            "term": other,
+                            "speaker": speaker,
+                            "start_time": start_time,
+                            "count": count,
+                        }
+                    )
+        for docket in found:
+            hits[docket]["terms"] += 1
+
+    ranked = sorted(
+        hits.values(), key=lambda h: (-h["terms"], -h["count"], h["docket"])
+    )
+    for hit in ranked:
+        hit["matches"].sort(key=lambda match: (match["start_time"], match["term"]))
+    return ranked[:limit]
+
+
+def read_entry(s3_client, bucket, docket):
+    """The ETag and version a docket was indexed from, None when it was not"""
+    try:
+        head = s3_client.head_object(Bucket=bucket, Key=docket_key(docket))
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
+    return {
+        "etag": head["Metadata"].get("source-etag"),
+        "version": int(head["Metadata"].get("index-version", 0)),
+    }
+
+
+def add_docket(s3_client, bucket, docket, key, etag, terms):
+    """Write the docket's postings and mark it pending for the next merge.
+
+    Keeps the starts of the terms it replaces, whose partitions the merge
+    removes them from.
+    """
+    previous = read_docket(s3_client, bucket, docket)
+    stale = set()
+    if previous is not None:
+        stale.update(term_prefix(term) for term in previous["terms"])
+        if is_pending(s3_client, bucket, docket):
+            # Not merged yet, so the terms it replaced are still there too
+            stale.update(previous["stale"])
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=docket_key(docket),
+        Body=dumps(
+            {
+                "version": SCHEMA_VERSION,
+                "docket": docket,
+                "key": key,
+                "terms": terms,
+                "stale": sorted(stale),
+            }
+        ),
+        ContentType="application/json",
+        ContentEncoding="gzip",
+        Metadata={"source-etag": etag, "index-version": str(SCHEMA_VERSION)},
+    )
+    # Written after the postings, so a merge never misses them
+    s3_client.put_object(Bucket=bucket, Key=pending_key(docket), Body=b"")
+
+
+def _read(s3_client, bucket, key):
+    """The content of an index object, None when there is no such object"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
+    with closing(compression.open_body(response)) as body:
+        return loads(body)
+
+
+def read_docket(s3_client, bucket, docket):
+    return _read(s3_client, bucket, docket_key(docket))
+
+
+def read_partition(s3_client, bucket, partition):
+    content = _read(s3_client, bucket, partition_key(partition))
+    return empty_partition() if content is None else content
+
+
+def read_layout(s3_client, bucket):
+    content = _read(s3_client, bucket, LAYOUT_KEY)
+    return empty_layout() if content is None else content
+
+
+def write_index_object(s3_client, bucket, key, body):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=body,
+        ContentType="application/json",
+        ContentEncoding="gzip",
+    )
+
+
+def delete_keys(s3_client, bucket, keys):
+    for offset in range(0, len(keys), DELETE_BATCH):
+        s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={
+                "Objects": [
+                    {"Key": key} for key in keys[offset : offset + DELETE_BATCH]
+                ],
+                "Quiet": True,
+            },
+        )
+
+
+def is_pending(s3_client, bucket, docket):
+    response = s3_client.list_objects_v2(
+        Bucket=bucket, Prefix=f"{PENDING_PREFIX}{docket}/", MaxKeys=1
+    )
+    return response["KeyCount"] > 0
+
+
+def list_pending(s3_client, bucket):
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=PENDING_PREFIX):
+        keys.extend(entry["Key"] for entry in page.get("Contents", []))
+    return keys
+
+
+def merge_partition(s3_client, bucket, partition, dockets):
+    """Merge ``dockets`` into ``partition``, the partitions it is split into if any.
+
+    Writes only the split partitions that hold terms, the others read empty.
+    """
+    content = merge(read_partition(s3_client, bucket, partition), dockets)
+    body = dumps(content)
+    if len(body) <= PARTITION_BYTES or len(partition) == MAX_PARTITION_DEPTH:
+        write_index_object(s3_client, bucket, partition_key(partition), body)
+        return None
+    children = split_partition(partition, content)
+    for child, child_content in children.items():
+        if child_content["terms"]:
+            write_index_object(
+                s3_client, bucket, partition_key(child), dumps(child_content)
+            )
+    return list(children)
+
+
+def merge_pending(s3_client, bucket, workers=4):
+    """Merge the pending dockets into the partitions, then delete the markers.
+
+    Must not run twice at once, two merges would overwrite each other's
+    partitions. A docket converted again while it is merged leaves a marker
+    this merge did not list, so it is merged again next time. A partition
+    split is deleted by the next merge, once no query can be reading it.
+    """
+    keys = list_pending(s3_client, bucket)
+    by_docket = {}
+    for key in keys:
+        by_docket.setdefault(docket_of(key), []).append(key)
+    dockets = sorted(by_docket)
+    layout = read_layout(s3_client, bucket)
+    if layout["split"]:
+        delete_keys(s3_client, bucket, [partition_key(p) for p in layout["split"]])
+        layout = {**layout, "split": []}
+        write_index_object(s3_client, bucket, LAYOUT_KEY, dumps(layout))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(dockets), MERGE_BATCH):
+            batch = dockets[start : start + MERGE_BATCH]
+            contents = executor.map(
+                lambda docket: read_docket(s3_client, bucket, docket), batch
+            )
+            partitions = set(layout["partitions"])
+            touched = {}
+            for docket, content in zip(batch, contents):
+                if content is None:
+                    continue
+                # Removed from the partitions of its old terms, added to its new
+                for prefix in content["stale"]:
+                    touched.setdefault(partition_at(prefix, partitions), {})[
+                        docket
+                    ] = {}
+                for partition, terms in by_partition(
+                    content["terms"], partitions
+                ).items():
+                    touched.setdefault(partition, {})[docket] = terms
+
+            # Raises before any marker is deleted, so a failed merge is retried
+            splits = executor.map(
+                lambda partition: merge_partition(
+                    s3_client, bucket, partition, touched[partition]
+                ),
+                sorted(touched),
+            )
+            split = {
+                partition: children
+                for partition, children in zip(sorted(touched), splits)
+                if children
+            }
+            if split:
+                layout = {
+                    "version": SCHEMA_VERSION,
+                    "partitions": sorted(
+                        (partitions - set(split))
+                        | {child for children in split.values() for child in children}
+                    ),
+                    "split": sorted(set(layout["split"]) | set(split)),
+                }
+                write_index_object(s3_client, bucket, LAYOUT_KEY, dumps(layout))
+            delete_keys(
+                s3_client,
+                bucket,
+                [key for docket in batch for key in by_docket[docket]],
+            )
+    return {"pending": len(keys), "dockets": len(dockets)}
@@ -0,0 +1,209 @@
+"""A compact columnar copy of a parsed transcript, kept next to its JSON.
+
+``transcribed/<docket>.json`` is parsed once, then ``dumps`` stores the
+result as ``transcribed/<docket>.turns.bin`` so that re-renders, retries and
+exports load the turns instead of parsing the verbose Transcribe JSON again.
+
+The file is ``MAGIC``, the header length as a little-endian uint32, a JSON
+header and then fixed-width little-endian arrays, each aligned to 8 bytes
+so they can be viewed in place in a bytes object or a memory map:
+
+* word start and end times and confidences, one per pronunciation item
+* the token, confidence and start and end times of every run (NaN for
+  punctuation) and the offset of every turn's first run
+* turn start and end times and speaker ids
+
+Tokens and speakers are interned in tables in the header. The header also
+holds ``SCHEMA_VERSION`` and the ETag of the JSON it was made from, and
+``loads`` rejects a sidecar with either one different. Bump the version
+whenever the file layout or the turns produced by ``transcript`` change.
+"""
+
+import json
+import math
+import mmap
+import struct
+import numpy as np
+from array import array
+from transcript import ConfidenceStats, Transcript, Turn
+
+
+MAGIC = b"TRNSTURN"
+SCHEMA_VERSION = 2
+SUFFIX = ".turns.bin"
+ALIGNMENT = 8
+HEADER_LENGTH = struct.Struct("<I")
+
+# Column name and dtype, in file order
+COLUMNS = (
+    ("word_starts", "<f8"),
+    ("word_ends", "<f8"),
+    ("word_confidences", "<f8"),
+    ("run_tokens", "<u4"),
+    ("run_confidences", "<f8"),
+    ("run_starts", "<f8"),
+    ("run_ends", "<f8"),
+    ("turn_runs", "<u4"),
+    ("turn_starts", "<f8"),
+    ("turn_ends", "<f8"),
+    ("turn_speakers", "<u4"),
+)
+
+
+def sidecar_key(key):
+    """``transcribed/<docket>.json`` to ``transcribed/<docket>.turns.bin``"""
+    return key.removesuffix(".json") + SUFFIX
+
+
+def dumps(transcript, items, etag):
+    """The sidecar of ``transcript``, parsed from ``items``, as bytes"""
+    tokens = {}
+    speakers = {}
+    run_tokens = []
+    run_confidences = []
+    run_starts = []
+    run_ends = []
+    turn_runs = [0]
+    for turn in transcript.turns:
+        for text, confidence, start_time, end_time in turn.runs:
+            run_tokens.append(tokens.setdefault(text, len(tokens)))
+            run_confidences.append(math.nan if confidence is None else confidence)
+            run_starts.append(math.nan if start_time is None else start_time)
+            run_ends.append(math.nan if end_time is None else end_time)
+        turn_runs.append(len(run_tokens))
+
+    columns = {
+        "word_starts": transcript.stats.timestamps,
+        "word_ends": [
+            float(item["end_time"]) for item in items if item["type"] == "pronunciation"
+        ],
+        "word_confidences": transcript.stats.confidences,
+        "run_tokens": run_tokens,
+        "run_confidences": run_confidences,
+        "run_starts": run_starts,
+        "run_ends": run_ends,
+        "turn_runs": turn_runs,
+        "turn_starts": [turn.start_time for turn in transcript.turns],
+        "turn_ends": [turn.end_time for turn in transcript.turns],
+        "turn_speakers": [
+            speakers.setdefault(turn.speaker, len(speakers))
+            for turn in transcript.turns
+        ],
+    }
+    arrays = [(name, np.asarray(columns[name], dtype=dtype)) for name, dtype in COLUMNS]
+
+    header = {
+        "version": SCHEMA_VERSION,
+        "etag": etag,
+        "job_name": transcript.job_name,
+        "total": transcript.stats.total,
+        "counts": transcript.stats.counts,
+        "tokens": list(tokens),
+        "speakers": list(speakers),
+        "columns": {},
+    }
+    # Offsets are relative to the end of the header, which is padded
+    offset = 0
+    for name, values in arrays:
+        header["columns"][name] = [offset, len(values)]
+        offset += _padded(values.nbytes)
+    prefix = len(MAGIC) + HEADER_LENGTH.size
+    encoded = json.dumps(header).encode()
+    encoded = encoded.ljust(_padded(prefix + len(encoded)) - prefix)
+
+    parts = [MAGIC, HEADER_LENGTH.pack(len(encoded)), encoded]
+    for _, values in arrays:
+        data = values.tobytes()
+        parts.append(data.ljust(_padded(len(data)), b"\0"))
+    return b"".join(parts)
+
+
+def _padded(length):
+    return -(-length // ALIGNMENT) * ALIGNMENT
+
+
+def read_header(buffer):
+    """The header and the offset of the first column"""
+    view = memoryview(buffer)
+    if bytes(view[: len(MAGIC)]) != MAGIC:
+        raise Exception("Not a transcript sidecar")
+    (length,) = HEADER_LENGTH.unpack_from(view, len(MAGIC))
+    start = len(MAGIC) + HEADER_LENGTH.size
+    return json.loads(bytes(view[start : start + length])), start + length
+
+
+def columns(buffer, header, base):
+    """The arrays of the sidecar, viewed in ``buffer`` without copying"""
+    return {
+        name: np.frombuffer(
+            buffer,
+            dtype=dtype,
+            count=header["columns"][name][1],
+            offset=base + header["columns"][name][0],
+        )
+        for name, dtype in COLUMNS
+    }
+
+
+def loads(buffer, etag=None):
+    """The transcript in ``buffer``, None when it is stale.
+
+    ``buffer`` is any bytes-like object, e.g. a response body or a memory
+    map. A sidecar of another schema version, or made from a transcript
+    with another ETag than ``etag``, is stale.
+    """
+    header, base = read_header(buffer)
+    if header["version"] != SCHEMA_VERSION:
+        return None
+    if etag is not None and header["etag"] != etag:
+        return None
+    arrays = columns(buffer, header, base)
+
+    stats = ConfidenceStats()
+    stats.total = header["total"]
+    stats.counts = header["counts"]
+    stats.timestamps = array("d", arrays["word_starts"].astype("=f8").tobytes())
+    stats.confidences = array("d", arrays["word_confidences"].astype("=f8").tobytes())
+
+    tokens = header["tokens"]
+    # NaN, the only value not equal to itself, is None
+    runs = [
+        (
+            tokens[token],
+            None if confidence != confidence else confidence,
+            None if start_time != start_time else start_time,
+            None if end_time != end_time else end_time,
+        )
+        for token, confidence, start_time, end_time in zip(
+            arrays["run_tokens"].tolist(),
+            arrays["run_confidences"].tolist(),
+            arrays["run_starts"].tolist(),
+            arrays["run_ends"].tolist(),
+        )
+    ]
+    bounds = arrays["turn_runs"].tolist()
+    speakers = header["speakers"]
+    turns = [
+        Turn(
+            start_time=start,
+            end_time=end,
+            speaker=speakers[speaker],
+            runs=runs[first:last],
+        )
+        for start, end, speaker, first, last in zip(
+            arrays["turn_starts"].tolist(),
+            arrays["turn_ends"].tolist(),
+            arrays["turn_speakers"].tolist(),
+            bounds,
+            bounds[1:],
+        )
+    ]
+    return Transcript(job_name=header["job_name"], stats=stats, turns=turns)
+
+
+def load(path, etag=None):
+    """Load a sidecar file through a memory map"""
+    with open(path, "rb") as fp, mmap.mmap(
+        fp.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        return loads(mapped, etag)
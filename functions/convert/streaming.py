@@ -0,0 +1,145 @@
+"""Convert transcripts of any length in roughly constant memory.
+
+The transcript is read with ijson in one pass that validates it and counts
+confidences, then as two streams walked side by side, and ``ooxml``
+serializes the body of ``word/document.xml`` one table row at a time
+straight into the zip entry, so neither the parsed JSON nor the document
+tree is ever held in full. Only speaker-labelled transcripts can be streamed.
+"""
+
+from contextlib import closing
+import ijson
+from ijson.common import ObjectBuilder
+from ooxml import write_package
+from transcript import ConfidenceStats, Turn, best_alternative
+
+
+ITEMS = "results.items.item"
+SEGMENTS = "results.speaker_labels.segments.item"
+
+
+def write_docx_stream(open_stream, save_as, on_turn=None):
+    """Write a docx for the transcript behind ``open_stream`` to ``save_as``.
+
+    ``open_stream`` is called once per pass and must return a new binary
+    stream over the transcript each time (an open file, an S3 response body).
+    ``on_turn`` is called with every turn as it is written.
+    """
+    job_name, stats = scan_transcript(open_stream)
+    turns = stream_turns(open_stream)
+    if on_turn is not None:
+        turns = _tap(turns, on_turn)
+    write_package(save_as, job_name, stats, turns)
+
+
+def scan_transcript(open_stream):
+    """Validate the transcript and count confidences in one streamed pass.
+
+    ``status`` comes after ``results`` in Transcribe JSON, so it is read in
+    the same pass as the items rather than in a pass of its own.
+    """
+    job_name = None
+    status = None
+    stats = ConfidenceStats()
+    item = None
+    with closing(open_stream()) as stream:
+        for prefix, event, value in ijson.parse(stream):
+            if item is not None:
+                item.event(event, value)
+                if prefix == ITEMS and event == "end_map":
+                    stats.add(item.value)
+                    item = None
+            elif prefix == ITEMS and event == "start_map":
+                item = ObjectBuilder()
+                item.event(event, value)
+            elif prefix == "jobName":
+                job_name = value
+            elif prefix == "status":
+                status = value
+    if job_name is None:
+        raise Exception("Transcript is missing 'jobName'")
+    if status != "COMPLETED":
+        raise Exception("Transcript is not shown as completed")
+    return job_name, stats
+
+
+def stream_turns(open_stream):
+    """Yield speaker turns by walking segments and items side by side.
+
+    Segments list their words in the same order as ``results.items``, so the
+    two streams can be merged without indexing the items first.
+    """
+    with closing(open_stream()) as segment_stream, closing(
+        open_stream()
+    ) as item_stream:
+        items = _Peekable(ijson.items(item_stream, ITEMS))
+        segments_seen = False
+        for segment in ijson.items(segment_stream, SEGMENTS):
+            segments_seen = True
+            if not segment["items"]:
+                continue
+            turn = Turn(
+                start_time=float(segment["start_time"]),
+                end_time=float(segment["end_time"]),
+                speaker=str(segment["speaker_label"]),
+            )
+            for word in segment["items"]:
+                item = _next_pronunciation(items, word)
+                result = best_alternative(item)
+                turn.runs.append(
+                    (
+                        " " + result["content"],
+                        float(result["confidence"]),
+                        float(item["start_time"]),
+                        float(item["end_time"]),
+                    )
+                )
+                # Punctuation directly following a word belongs to it
+                following = items.peek()
+                if following is not None and following["type"] == "punctuation":
+                    punctuation = next(items)["alternatives"][0]["content"]
+                    turn.runs.append((punctuation, None, None, None))
+            yield turn
+
+        if not segments_seen and items.peek() is not None:
+            raise Exception("Streaming conversion requires speaker labels")
+
+
+def _tap(turns, on_turn):
+    for turn in turns:
+        on_turn(turn)
+        yield turn
+
+
+def _next_pronunciation(items, word):
+    timing = (word["start_time"], word["end_time"])
+    for item in items:
+        if item["type"] != "pronunciation":
+            continue
+        if (item["start_time"], item["end_time"]) == timing:
+            return item
+    raise Exception(f"No word found at {timing[0]}-{timing[1]}")
+
+
+class _Peekable:
+    def __init__(self, iterator):
+        self._iterator = iterator
+        self._next = None
+        self._peeked = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._peeked:
+            self._peeked = False
+            if self._next is None:
+                raise StopIteration
+            return self._next
+        return next(self._iterator)
+
+    def peek(self):
+        if not self._peeked:
+            self._next = next(self._iterator, None)
+            self._peeked = True
+        return self._next
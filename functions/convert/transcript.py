@@ -0,0 +1,254 @@
+"""Decode Amazon Transcribe JSON into speaker turns without pandas."""
+
+import json
+import os
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+# Words below this confidence are greyed out in rendered documents
+GREY_THRESHOLD = 0.98
+
+# (label, lower bound) pairs, highest band first
+CONFIDENCE_BANDS = (
+    ("98% - 100%", 0.98),
+    ("90% - 97%", 0.9),
+    ("80% - 89%", 0.8),
+    ("70% - 79%", 0.7),
+    ("60% - 69%", 0.6),
+    ("50% - 59%", 0.5),
+    ("40% - 49%", 0.4),
+    ("30% - 39%", 0.3),
+    ("20% - 29%", 0.2),
+    ("10% - 19%", 0.1),
+    ("0% - 9%", 0.0),
+)
+
+
+@dataclass
+class Turn:
+    """A run of speech by one speaker.
+
+    ``runs`` holds ``(text, confidence, start_time, end_time)`` in document
+    order. Words carry a leading space, punctuation does not and has a
+    confidence and times of ``None``.
+    """
+
+    start_time: float
+    end_time: float
+    speaker: str
+    runs: list = field(default_factory=list)
+
+    @property
+    def text(self):
+        return "".join(run[0] for run in self.runs).lstrip()
+
+
+class ConfidenceStats:
+    """Counts of words per confidence band, built one item at a time.
+
+    The start time and confidence of every word are kept too, compactly, for
+    the confidence chart.
+    """
+
+    def __init__(self):
+        self.counts = [0] * len(CONFIDENCE_BANDS)
+        self.total = 0
+        self.timestamps = array("d")
+        self.confidences = array("d")
+
+    def add(self, item):
+        # Punctuation counts towards the total but has no band
+        self.total += 1
+        if item["type"] != "pronunciation":
+            return
+        confidence = float(item["alternatives"][0]["confidence"])
+        self.timestamps.append(float(item["start_time"]))
+        self.confidences.append(confidence)
+        for index, (_, lower_bound) in enumerate(CONFIDENCE_BANDS):
+            if confidence >= lower_bound:
+                self.counts[index] += 1
+                break
+
+    def rows(self):
+        """Yield (band, count, percentage) strings for the confidence table"""
+        for (label, _), count in zip(CONFIDENCE_BANDS, self.counts):
+            percentage = round(count / self.total * 100, 2) if self.total else 0.0
+            yield label, str(count), f"{percentage}%"
+
+
+@dataclass
+class Transcript:
+    """A transcript parsed once, ready for any number of writers"""
+
+    job_name: str
+    stats: ConfidenceStats
+    turns: list
+
+
+def load_transcript(source):
+    """Load a transcript from a path or a readable stream"""
+    if isinstance(source, (str, Path)):
+        with open(source, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+    else:
+        data = json.load(source)
+    validate_transcript(data)
+    return data
+
+
+def validate_transcript(data):
+    for key in ("jobName", "results", "status"):
+        if key not in data:
+            raise Exception(f"Transcript is missing '{key}'")
+    if data["status"] != "COMPLETED":
+        raise Exception("Transcript is not shown as completed")
+
+
+def format_timestamp(seconds):
+    """Seconds to H:M:S, truncating any fraction"""
+    total = int(float(seconds))
+    return f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}"
+
+
+def best_alternative(item):
+    return sorted(item["alternatives"], key=lambda x: x["confidence"])[-1]
+
+
+def confidence_stats(items):
+    stats = ConfidenceStats()
+    for item in items:
+        stats.add(item)
+    return stats
+
+
+def parse_transcript(data):
+    return Transcript(
+        job_name=data["jobName"],
+        stats=confidence_stats(data["results"]["items"]),
+        turns=decode_turns(data),
+    )
+
+
+def decode_turns(data, engine=None):
+    """Group transcript items into speaker turns.
+
+    Speaker labels are preferred, then channel labels. Without either the
+    whole transcript becomes a single turn with no speaker.
+
+    ``engine`` (default ``TURN_ENGINE``) is "python" for the decoder below
+    or "numpy" for the vectorized assembly in ``turns``.
+    """
+    engine = engine or os.environ.get("TURN_ENGINE", "python")
+    results = data["results"]
+    if engine == "numpy":
+        # turns builds on this module, so it can only be imported here
+        from turns import assemble_turns
+
+        return assemble_turns(results)
+    if engine != "python":
+        raise Exception(f"Unknown turn engine: {engine}")
+    if "speaker_labels" in results:
+        return list(_speaker_turns(results))
+    if "channel_labels" in results:
+        return list(_channel_turns(results))
+    return list(_unlabelled_turns(results))
+
+
+def _add_word(turn, item):
+    result = best_alternative(item)
+    turn.runs.append(
+        (
+            " " + result["content"],
+            float(result["confidence"]),
+            float(item["start_time"]),
+            float(item["end_time"]),
+        )
+    )
+
+
+def _add_punctuation(turn, items, index):
+    # Punctuation directly following a word belongs to it
+    if index + 1 < len(items) and items[index + 1]["type"] == "punctuation":
+        punctuation = items[index + 1]["alternatives"][0]["content"]
+        turn.runs.append((punctuation, None, None, None))
+
+
+def _speaker_turns(results):
+    items = results["items"]
+
+    # Segment items only reference words by their timings, so index the
+    # pronunciations once instead of scanning them for every word
+    by_timing = {}
+    for index, item in enumerate(items):
+        if item["type"] == "pronunciation":
+            timing = (item["start_time"], item["end_time"])
+            first, _ = by_timing.get(timing, (index, index))
+            by_timing[timing] = (first, index)
+
+    for segment in results["speaker_labels"]["segments"]:
+        if not segment["items"]:
+            continue
+        turn = Turn(
+            start_time=float(segment["start_time"]),
+            end_time=float(segment["end_time"]),
+            speaker=str(segment["speaker_label"]),
+        )
+        for word in segment["items"]:
+            try:
+                first, last = by_timing[(word["start_time"], word["end_time"])]
+            except KeyError:
+                raise Exception(
+                    f"No word found at {word['start_time']}-{word['end_time']}"
+                )
+            _add_word(turn, items[last])
+            _add_punctuation(turn, items, first)
+        yield turn
+
+
+def _channel_turns(results):
+    items = results["items"]
+    channel_of = {}
+    for channel in results["channel_labels"]["channels"]:
+        for item in channel["items"]:
+            if "start_time" in item:
+                timing = (item["start_time"], item["end_time"])
+                channel_of[timing] = channel["channel_label"]
+
+    turn = None
+    for index, item in enumerate(items):
+        # Punctuation items do not include a start_time
+        if "start_time" not in item:
+            continue
+        channel = channel_of[(item["start_time"], item["end_time"])]
+        if turn is None or turn.speaker != channel:
+            if turn is not None:
+                yield turn
+            turn = Turn(
+                start_time=float(item["start_time"]),
+                end_time=float(item["end_time"]),
+                speaker=channel,
+            )
+        turn.end_time = float(item["end_time"])
+        _add_word(turn, item)
+        _add_punctuation(turn, items, index)
+    if turn is not None:
+        yield turn
+
+
+def _unlabelled_turns(results):
+    items = results["items"]
+    pronunciations = [item for item in items if item["type"] == "pronunciation"]
+    if not pronunciations:
+        return
+    turn = Turn(
+        start_time=float(pronunciations[0]["start_time"]),
+        end_time=float(pronunciations[-1]["end_time"]),
+        speaker="",
+    )
+    for index, item in enumerate(items):
+        if item["type"] == "pronunciation":
+            _add_word(turn, item)
+            _add_punctuation(turn, items, index)
+    yield turn
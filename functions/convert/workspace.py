@@ -0,0 +1,111 @@
+"""Scratch space under /tmp that does not outlive the conversion using it.
+
+A warm container keeps /tmp between invocations, so every file written there
+must be removed again or the disk eventually fills and conversions fail.
+``allocate`` hands out a private directory under ``WORKSPACE_ROOT`` and
+removes it however the block exits. Directories left behind by a container
+that crashed or timed out are evicted when this module is first imported.
+
+matplotlib (only used by the tscribe renderer) keeps its font cache in one
+persistent ``MPLCONFIGDIR`` outside the workspaces, so it is built once per
+container rather than once per conversion.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from logging import getLogger
+from pathlib import Path
+
+
+MB = 1024 * 1024
+WORKSPACE_ROOT = Path(os.environ.get("WORKSPACE_ROOT", "/tmp/workspaces"))
+# Across every workspace in use at the same time
+WORKSPACE_BUDGET_MB = int(os.environ.get("WORKSPACE_BUDGET_MB", 384))
+# Must be set before matplotlib is first imported
+os.environ.setdefault("MPLCONFIGDIR", "/tmp/cache/matplotlib")
+logger = getLogger()
+
+_active = set()
+_lock = threading.Lock()
+
+
+class Workspace:
+    """A private scratch directory"""
+
+    def __init__(self, path, budget_mb):
+        self.path = Path(path)
+        self.budget_mb = budget_mb
+
+    def file(self, name):
+        # A string, python-docx treats anything else as a stream
+        return str(self.path / name)
+
+    def check_budget(self):
+        """Raise once the workspaces hold more than the budget"""
+        used = usage(WORKSPACE_ROOT)
+        if used > self.budget_mb * MB:
+            raise Exception(
+                f"Workspace budget of {self.budget_mb} MB exceeded: "
+                f"{round(used / MB, 1)} MB in use"
+            )
+
+
+@contextmanager
+def allocate(budget_mb=None):
+    """Yield a new ``Workspace``, always removed when the block exits"""
+    workspace = Workspace(
+        tempfile.mkdtemp(dir=make_root()), budget_mb or WORKSPACE_BUDGET_MB
+    )
+    with _lock:
+        _active.add(workspace.path)
+    try:
+        workspace.check_budget()
+        yield workspace
+    finally:
+        shutil.rmtree(workspace.path, ignore_errors=True)
+        with _lock:
+            _active.discard(workspace.path)
+
+
+def make_root():
+    WORKSPACE_ROOT.mkdir(parents=True, exist_ok=True)
+    return WORKSPACE_ROOT
+
+
+def evict_stale():
+    """Remove every workspace not in use, returning how many were removed"""
+    if not WORKSPACE_ROOT.exists():
+        return 0
+    evicted = 0
+    with _lock:
+        for path in WORKSPACE_ROOT.iterdir():
+            if path in _active:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            evicted += 1
+    if evicted:
+        logger.warning(f"Evicted {evicted} stale workspace(s)")
+    return evicted
+
+
+def usage(path):
+    """Bytes used by the files under ``path``"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                # Removed by a workspace finishing on another thread
+                pass
+    return total
+
+
+# Nothing can be in use before the first invocation
+evict_stale()
@@ -1,23 +1,36 @@
+import metrics
+import dockets
+import manifest
 import logging
 import json
-import time
+import hashlib
 import boto3
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import unquote_plus
-import re
 import os
+import tempfile
+import dedupe
+import scheduler
 
 
 transcribe = boto3.client("transcribe")
-valid_docket_type1 = re.compile(r"P\d+-\w{2}\d{0,2}", flags=re.IGNORECASE)
-valid_docket_type2 = re.compile(r"\w{3}-\d{3}\w{2}\d{2}")
+s3_client = boto3.client("s3")
+JOB_NAME_PREFIX = "audiotojson-"
+JOB_SUFFIX_LENGTH = 12
+# Where split recordings are transcribed, read by the stitcher
+CHUNK_PREFIX = "chunks/"
+MANIFEST_NAME = "manifest.json"
+# Records of one event submitted at the same time
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", 4))
+# Names the outputs of records without a docket
+DOCKET_FALLBACK = "Transcription"
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
 
+@metrics.instrument("RunTranscriptionJob")
 def lambda_handler(event, context):
-    re.purge()
-
     max_speakers = os.environ.get("MAX_SPEAKERS")
     if not max_speakers:
         raise Exception("Cannot find env MAX_SPEAKERS")
@@ -25,77 +38,242 @@ def lambda_handler(event, context):
     if not outputbucketname:
         raise Exception("Cannot find env DOWNLOAD_BUCKET_NAME")
 
-    logger.info("## EVENT")
-    logger.info(json.dumps(event, indent=2))
+    records = event["Records"]
+    results = process_records(
+        records,
+        lambda record: transcribe_record(record, max_speakers, outputbucketname),
+    )
+    return batch_report(results)
+
 
+def transcribe_record(record, max_speakers, outputbucketname):
     # key includes directory path
-    key = unquote_plus(event["Records"][0]["s3"]["object"]["key"])
-    bucketname = event["Records"][0]["s3"]["bucket"]["name"]
+    key = unquote_plus(record["s3"]["object"]["key"])
+    bucketname = record["s3"]["bucket"]["name"]
     url = f"s3://{bucketname}/{key}"
     # The final path component, without its suffix
     save_as_filename = get_docket(key)
     # The suffix
     media_format = get_media_format(key)
-    transcription_job_name = f"audiotojson-{save_as_filename}"
+    output_key = f"transcribed/{save_as_filename}.json"
+    transcription_job_name = make_job_name(save_as_filename, record)
+
+    etag = record["s3"]["object"].get("eTag")
+    use_dedupe = etag and os.environ.get("DEDUPE_TRANSCRIPTS", "true") == "true"
+    if use_dedupe:
+        existing_key = dedupe.find_transcript(s3_client, outputbucketname, etag)
+        if existing_key:
+            dedupe.reuse_transcript(
+                s3_client, outputbucketname, existing_key, output_key
+            )
+            logger.info(f"Reused transcript of identical audio: {existing_key}")
+            record_progress(outputbucketname, save_as_filename, key, record)
+            return existing_key
+
+    status = "split"
+    if should_split(bucketname, key, media_format):
+        chunks = transcribe_in_chunks(
+            bucketname,
+            key,
+            transcription_job_name,
+            max_speakers,
+            outputbucketname,
+            output_key,
+            save_as_filename,
+        )
+        logger.info(f"Split {key} into {chunks} chunks: {transcription_job_name}")
+    else:
+        status = start_job(
+            transcription_job_name,
+            url,
+            media_format,
+            max_speakers,
+            outputbucketname,
+            output_key,
+            save_as_filename,
+        )
+        if status is None:
+            return transcription_job_name
+
+    if use_dedupe:
+        dedupe.record_transcript(
+            s3_client, outputbucketname, etag, output_key, transcription_job_name
+        )
+    record_progress(
+        outputbucketname, save_as_filename, key, record, transcription_job_name, status
+    )
+    return transcription_job_name
 
-    del_previous_job(transcription_job_name)
-    wait_for_previous_job_to_be_del(transcription_job_name)
 
-    response = transcribe.start_transcription_job(
-        TranscriptionJobName=transcription_job_name,
-        LanguageCode="en-US",
-        MediaFormat=media_format,
-        Media={"MediaFileUri": url},
-        Settings={
+def record_progress(bucket, docket, key, record, job_name=None, status=None):
+    """Append the upload, and the job submitted for it, to the manifest"""
+    if not manifest.is_enabled():
+        return
+    records = [
+        manifest.make_record(
+            docket, "uploaded", key=key, size=record["s3"]["object"].get("size")
+        )
+    ]
+    if job_name:
+        records.append(
+            manifest.make_record(docket, "submitted", job_name=job_name, status=status)
+        )
+    with metrics.stage("Manifest"):
+        manifest.append(s3_client, bucket, records)
+
+
+def start_job(
+    job_name, url, media_format, max_speakers, outputbucketname, output_key, docket
+):
+    """Submit a transcription job, None when it was submitted before.
+
+    Returns "started", or "queued" when the job is queued for
+    SubmitPendingJobs while Transcribe's concurrent-job quota is used up.
+    """
+    request = {
+        "TranscriptionJobName": job_name,
+        "LanguageCode": "en-US",
+        "MediaFormat": media_format,
+        "Media": {"MediaFileUri": url},
+        "Settings": {
             "ShowSpeakerLabels": True,
             "MaxSpeakerLabels": int(max_speakers),
         },
-        OutputBucketName=outputbucketname,
-        OutputKey=f"transcribed/{save_as_filename}.json",
-    )
+        "OutputBucketName": outputbucketname,
+        # Whole recordings stay docket based, the newest upload overwrites
+        "OutputKey": output_key,
+    }
+    status = scheduler.submit(transcribe, s3_client, outputbucketname, request, docket)
+    if status == "exists":
+        # A retry of an event whose job was already submitted
+        logger.info(f"Transcription job already submitted: {job_name}")
+        return None
+    logger.info(json.dumps({"job": {"name": job_name, "status": status}}))
+    return status
 
-    logger.info("## RESPONSE")
-    logger.info(response)
 
+def should_split(bucketname, key, media_format):
+    """Whether to transcribe a long PCM WAV upload in chunks"""
+    if media_format != "wav" or os.environ.get("SPLIT_AUDIO", "false") != "true":
+        return False
+    # NumPy is only loaded when an upload may be split
+    import chunking
 
-def get_docket(filename):
-    path = Path(filename)
-    match = valid_docket_type1.search(path.stem) or valid_docket_type2.search(path.stem)
-    if match:
-        return match.group(0).upper()
-    else:
-        logger.warning(f"Docket not found in filename: {path.stem}")
-        return f"Transcription-{int(time.time())}"
+    duration = chunking.read_duration(s3_client, bucketname, key)
+    if duration is None:
+        logger.warning(f"Not a PCM WAV file, transcribing it whole: {key}")
+        return False
+    return duration > float(os.environ.get("SPLIT_MIN_SECONDS", 2700))
 
 
-def del_previous_job(transcription_job_name):
-    try:
-        transcribe.delete_transcription_job(TranscriptionJobName=transcription_job_name)
-        logger.info(f"Deleted previous transcription job: {transcription_job_name}")
-    except Exception:
-        pass
+def transcribe_in_chunks(
+    bucketname, key, job_name, max_speakers, outputbucketname, output_key, docket
+):
+    """Split the upload into chunks and submit a job for every one of them.
 
+    Chunks, their transcripts and the manifest the stitcher reads go under
+    ``chunks/<job name>/`` in the download bucket. Returns the chunk count.
+    """
+    import chunking
 
-def wait_for_previous_job_to_be_del(transcription_job_name):
-    MAX_WAIT = 80
-    start_time = time.time()
+    prefix = f"{CHUNK_PREFIX}{job_name}/"
+    manifest = {"job_name": job_name, "output_key": output_key, "chunks": []}
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "source.wav")
+        with metrics.stage("Download"):
+            s3_client.download_file(bucketname, key, source)
+        chunks = chunking.split_wav(source, workdir)
+        while True:
+            with metrics.stage("Split"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            name = f"{prefix}{chunk['index']:03d}"
+            path = chunk.pop("path")
+            with metrics.stage("Upload"):
+                s3_client.upload_file(path, outputbucketname, name + ".wav")
+            # Only the source and one chunk are ever on disk
+            os.remove(path)
+            manifest["chunks"].append(
+                dict(chunk, audio_key=name + ".wav", transcript_key=name + ".json")
+            )
+
+    # Written before any job starts, the stitcher needs it for every transcript
+    s3_client.put_object(
+        Bucket=outputbucketname,
+        Key=prefix + MANIFEST_NAME,
+        Body=json.dumps(manifest).encode(),
+        ContentType="application/json",
+    )
+    for chunk in manifest["chunks"]:
+        start_job(
+            f"{job_name}-{chunk['index']:03d}",
+            f"s3://{outputbucketname}/{chunk['audio_key']}",
+            "wav",
+            max_speakers,
+            outputbucketname,
+            chunk["transcript_key"],
+            docket,
+        )
+    return len(manifest["chunks"])
+
+
+def process_records(records, handle_record):
+    """Run ``handle_record`` over every record on a bounded thread pool"""
+    workers = max(1, min(MAX_WORKERS, len(records)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(handle_record, record) for record in records]
 
-    while True:
+    results = []
+    for record, future in zip(records, futures):
+        result = {"itemIdentifier": get_record_id(record)}
         try:
-            job = transcribe.get_transcription_job(
-                TranscriptionJobName=transcription_job_name
-            )
-            if job:
-                logger.info(f"Previous job {transcription_job_name} still exists")
-        except (
-            transcribe.exceptions.NotFoundException,
-            transcribe.exceptions.BadRequestException,
-        ):
-            return
-        if time.time() - start_time > MAX_WAIT:
-            raise Exception(f"Could not delete previous job: {transcription_job_name}")
-
-        time.sleep(10)
+            result.update(status="success", result=future.result())
+        except Exception as e:
+            logger.exception(f"Failed to process {result['itemIdentifier']}")
+            result.update(status="failure", error=str(e))
+        logger.info(json.dumps({"record": result}))
+        results.append(result)
+    return results
+
+
+def batch_report(results):
+    """Raise when any record failed.
+
+    Lambda ignores what an asynchronous S3 invoke returns, so only raising
+    gets the failed records retried. Retrying the records that succeeded
+    is safe, their job names are stable and an existing job is skipped.
+    """
+    failures = [result for result in results if result["status"] == "failure"]
+    if failures:
+        raise Exception(
+            f"Failed to process {len(failures)} of {len(results)} record(s): "
+            + ", ".join(failure["itemIdentifier"] for failure in failures)
+        )
+    # Every record succeeded, the failures raised above
+    return {"batchItemFailures": []}
+
+
+def get_record_id(record):
+    return unquote_plus(record["s3"]["object"]["key"])
+
+
+def get_docket(filename):
+    return dockets.get_docket(filename, DOCKET_FALLBACK)
+
+
+def make_job_name(docket, record):
+    """Job name unique to this upload but stable across retries of its event"""
+    s3_object = record["s3"]["object"]
+    upload = "/".join(
+        [
+            s3_object["key"],
+            s3_object.get("eTag", ""),
+            s3_object.get("sequencer") or record.get("eventTime", ""),
+        ]
+    )
+    suffix = hashlib.sha1(upload.encode()).hexdigest()[:JOB_SUFFIX_LENGTH]
+    return f"{JOB_NAME_PREFIX}{docket}-{suffix}"
 
 
 def get_media_format(filename):
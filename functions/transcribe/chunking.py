@@ -0,0 +1,153 @@
+"""Cut long PCM WAV recordings into overlapping chunks at silences.
+
+The recording is read once with the stdlib ``wave`` module to measure the
+energy of every short window, then a cut is placed at the quietest window
+near every ``chunk_seconds`` mark. Each chunk reaches ``overlap_seconds``
+past its cuts on both sides, so a word cut short at one edge is heard whole
+by the neighbouring chunk. The stitcher keeps every word in the chunk that
+owns its start time, between the chunk's ``keep_from`` and ``keep_until``.
+
+Only PCM WAV is read, FLAC and other formats are transcribed in one job.
+"""
+
+import os
+import wave
+from io import BytesIO
+import numpy as np
+
+
+CHUNK_SECONDS = int(os.environ.get("SPLIT_CHUNK_SECONDS", 1200))
+OVERLAP_SECONDS = float(os.environ.get("SPLIT_OVERLAP_SECONDS", 10))
+# How far a cut may move from its mark to find a silence
+SEARCH_SECONDS = 60
+WINDOW_SECONDS = 0.05
+# Windows measured per read
+WINDOWS_PER_BLOCK = 1200
+# Bytes fetched to read the header of an upload
+HEADER_BYTES = 65536
+SAMPLE_TYPES = {1: np.uint8, 2: np.dtype("<i2"), 4: np.dtype("<i4")}
+
+
+def read_duration(s3_client, bucket, key):
+    """Seconds of audio in a WAV upload, read from its header only.
+
+    Returns None when the upload is not a PCM WAV file.
+    """
+    response = s3_client.get_object(
+        Bucket=bucket, Key=key, Range=f"bytes=0-{HEADER_BYTES - 1}"
+    )
+    try:
+        with wave.open(BytesIO(response["Body"].read())) as wav:
+            if wav.getsampwidth() not in SAMPLE_TYPES:
+                return None
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError):
+        return None
+
+
+def split_wav(source, workdir, chunk_seconds=None, overlap_seconds=None):
+    """Write the chunks of ``source`` to ``workdir``, one at a time.
+
+    Yields one dict per chunk once it is written, with its ``path`` and, in
+    seconds of the recording, its ``start``, ``end``, ``keep_from`` and
+    ``keep_until``, so the caller can upload and remove each chunk before
+    the next one is written.
+    """
+    chunk_seconds = chunk_seconds or CHUNK_SECONDS
+    if overlap_seconds is None:
+        overlap_seconds = OVERLAP_SECONDS
+
+    with wave.open(str(source)) as wav:
+        rate = wav.getframerate()
+        duration = wav.getnframes() / rate
+        energies = window_energies(wav)
+        cuts = find_cuts(energies, duration, chunk_seconds, SEARCH_SECONDS)
+        chunks = plan_chunks(cuts, overlap_seconds)
+        for chunk in chunks:
+            chunk["path"] = os.path.join(workdir, f"{chunk['index']:03d}.wav")
+            write_chunk(wav, chunk, chunk["path"])
+            yield chunk
+
+
+def window_energies(wav):
+    """Mean square amplitude of every ``WINDOW_SECONDS`` of ``wav``"""
+    channels = wav.getnchannels()
+    sample_type = SAMPLE_TYPES.get(wav.getsampwidth())
+    if sample_type is None:
+        raise Exception(f"Unsupported sample width: {wav.getsampwidth()} bytes")
+    window = max(1, int(wav.getframerate() * WINDOW_SECONDS))
+
+    wav.rewind()
+    energies = []
+    while True:
+        data = wav.readframes(window * WINDOWS_PER_BLOCK)
+        if not data:
+            break
+        samples = np.frombuffer(data, dtype=sample_type).astype(np.float64)
+        if sample_type == np.uint8:
+            # 8-bit WAV is unsigned, centred on 128
+            samples -= 128
+        frames = samples.reshape(-1, channels)
+        # A partial last window is padded with silence
+        padding = -len(frames) % window
+        if padding:
+            frames = np.vstack([frames, np.zeros((padding, channels))])
+        energies.append((frames**2).reshape(-1, window * channels).mean(axis=1))
+    if not energies:
+        return np.zeros(0)
+    return np.concatenate(energies)
+
+
+def find_cuts(energies, duration, chunk_seconds, search_seconds):
+    """Seconds at which to cut, from 0 to ``duration`` inclusive.
+
+    Each cut is the quietest window within ``search_seconds`` of the mark
+    ``chunk_seconds`` after the previous cut. The last chunk may run up to
+    ``chunk_seconds + search_seconds`` rather than end in a short chunk.
+    """
+    cuts = [0.0]
+    while duration - cuts[-1] > chunk_seconds + search_seconds:
+        mark = cuts[-1] + chunk_seconds
+        # Never at or before the previous cut
+        first = max(
+            int(cuts[-1] / WINDOW_SECONDS) + 1,
+            int((mark - search_seconds) / WINDOW_SECONDS),
+        )
+        last = min(len(energies), int((mark + search_seconds) / WINDOW_SECONDS))
+        quietest = first + int(np.argmin(energies[first:last]))
+        # The middle of the window, to the millisecond
+        cuts.append(round((quietest + 0.5) * WINDOW_SECONDS, 3))
+    cuts.append(round(duration, 3))
+    return cuts
+
+
+def plan_chunks(cuts, overlap_seconds):
+    chunks = []
+    for index, (keep_from, keep_until) in enumerate(zip(cuts, cuts[1:])):
+        chunks.append(
+            {
+                "index": index,
+                "start": round(max(cuts[0], keep_from - overlap_seconds), 3),
+                "end": round(min(cuts[-1], keep_until + overlap_seconds), 3),
+                "keep_from": keep_from,
+                "keep_until": keep_until,
+            }
+        )
+    return chunks
+
+
+def write_chunk(wav, chunk, path):
+    rate = wav.getframerate()
+    first = int(round(chunk["start"] * rate))
+    remaining = min(wav.getnframes(), int(round(chunk["end"] * rate))) - first
+    block = rate * WINDOW_SECONDS * WINDOWS_PER_BLOCK
+
+    wav.setpos(first)
+    with wave.open(path, "wb") as target:
+        target.setparams(wav.getparams())
+        while remaining > 0:
+            data = wav.readframes(min(remaining, int(block)))
+            if not data:
+                break
+            target.writeframes(data)
+            remaining -= len(data) // (wav.getsampwidth() * wav.getnchannels())
@@ -0,0 +1,22 @@
+import metrics
+import manifest
+import logging
+import json
+import boto3
+import os
+
+
+s3_client = boto3.client("s3")
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+
+@metrics.instrument("CompactManifest")
+def lambda_handler(event, context):
+    bucket = os.environ.get("DOWNLOAD_BUCKET_NAME")
+    if not bucket:
+        raise Exception("Cannot find env DOWNLOAD_BUCKET_NAME")
+    with metrics.stage("Compact"):
+        result = manifest.compact(s3_client, bucket)
+    logger.info(json.dumps({"compact": result}))
+    return result
@@ -0,0 +1,102 @@
+"""Skip re-transcribing audio that has already been transcribed.
+
+An index entry, ``dedupe/<ETag>.json`` in the download bucket, maps an
+upload's ETag to the transcript made from it. Entries live under the same
+bucket lifecycle rule as the transcripts, so they expire along with them.
+
+ETags are content hashes for single-part uploads only, so identical audio
+uploaded in parts of different sizes is not recognised as a duplicate.
+
+The transcript key is per docket, so a later upload of the docket can
+overwrite the transcript with another call's. An entry also holds the name
+of the job that made the transcript, and the transcript is only reused
+while its ``jobName`` is still that job's.
+"""
+
+import json
+import re
+import zlib
+import metrics
+from botocore.exceptions import ClientError
+
+
+DEDUPE_PREFIX = "dedupe/"
+# Transcribe writes jobName first, the range only has to reach past it
+JOB_NAME_RANGE = "bytes=0-16383"
+JOB_NAME = re.compile(rb'"jobName"\s*:\s*"([^"]*)"')
+
+
+def index_key(etag):
+    return f"{DEDUPE_PREFIX}{etag.strip(chr(34))}.json"
+
+
+@metrics.stage("Dedupe")
+def find_transcript(s3_client, bucket, etag):
+    """Return the key of an existing transcript of this audio, or None"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=index_key(etag))
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    entry = json.loads(response["Body"].read())
+
+    # The job may still be running, may have failed or the transcript expired
+    try:
+        job_name = read_job_name(s3_client, bucket, entry["transcript_key"])
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "InvalidRange"):
+            return None
+        raise
+    # Overwritten since by a transcript of other audio
+    if job_name != entry["job_name"]:
+        return None
+    return entry["transcript_key"]
+
+
+def read_job_name(s3_client, bucket, key):
+    """The ``jobName`` at the start of a transcript, None when it has none"""
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=JOB_NAME_RANGE)
+    data = response["Body"].read()
+    # ConvertToDocx may have compressed it, the start decompresses on its own
+    encoding = response.get("ContentEncoding")
+    if encoding == "gzip":
+        data = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS).decompress(data)
+    elif encoding == "zstd":
+        import zstandard
+
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    match = JOB_NAME.search(data)
+    return match.group(1).decode() if match else None
+
+
+@metrics.stage("Dedupe")
+def record_transcript(s3_client, bucket, etag, transcript_key, job_name):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=index_key(etag),
+        Body=json.dumps({"transcript_key": transcript_key, "job_name": job_name}),
+        ContentType="application/json",
+    )
+
+
+@metrics.stage("Dedupe")
+def reuse_transcript(s3_client, bucket, source_key, target_key):
+    """Copy an existing transcript into place instead of transcribing again.
+
+    The copy happens even onto itself so that the new upload still triggers
+    ConvertToDocx.
+    """
+    # A transcript ConvertToDocx compressed keeps its encoding and the
+    # metadata that goes with it
+    head = s3_client.head_object(Bucket=bucket, Key=source_key)
+    encoding = {}
+    if head.get("ContentEncoding"):
+        encoding["ContentEncoding"] = head["ContentEncoding"]
+    s3_client.copy_object(
+        Bucket=bucket,
+        Key=target_key,
+        CopySource={"Bucket": bucket, "Key": source_key},
+        MetadataDirective="REPLACE",
+        ContentType="application/json",
+        Metadata={**head["Metadata"], "dedupe-source": source_key},
+        **encoding,
+    )
@@ -0,0 +1,255 @@
+"""Submit transcription jobs within the account's concurrent-job quota.
+
+``submit`` starts a job straight away, paced by a token bucket shared by the
+container's threads, and retries with exponential backoff and full jitter
+while Transcribe reports ``LimitExceededException``. A job that still
+cannot start is queued instead of failing its record, as
+``pending/<priority>/<docket>/<queued ms>-<job name>.json`` in the download
+bucket, and new jobs queue behind it so that earlier uploads go first.
+
+SubmitPendingJobs (``lambda_handler``) drains the queue every minute. It
+counts the jobs in flight and starts up to ``MAX_CONCURRENT_JOBS`` minus
+that many, by priority and then round robin over the dockets, oldest first,
+so one large batch cannot hold back every other docket.
+
+Priorities come from ``DOCKET_PRIORITIES``, comma separated
+``<docket prefix>=<priority>`` pairs where the first matching prefix wins.
+Lower priorities go first, unmatched dockets get ``DEFAULT_PRIORITY``.
+"""
+
+import metrics
+import manifest
+import logging
+import json
+import os
+import random
+import threading
+import time
+import boto3
+from collections import defaultdict, deque
+
+
+transcribe = boto3.client("transcribe")
+s3_client = boto3.client("s3")
+PENDING_PREFIX = "pending/"
+# Only jobs submitted by RunTranscriptionJob are counted
+JOB_NAME_PREFIX = "audiotojson-"
+ACTIVE_STATUSES = ("QUEUED", "IN_PROGRESS")
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", 100))
+# StartTranscriptionJob calls per second, and how many may go at once
+SUBMIT_RATE = float(os.environ.get("SUBMIT_RATE", 5))
+SUBMIT_BURST = int(os.environ.get("SUBMIT_BURST", 5))
+SUBMIT_ATTEMPTS = int(os.environ.get("SUBMIT_ATTEMPTS", 4))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_CAP_SECONDS = 8.0
+DEFAULT_PRIORITY = 5
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+
+class TokenBucket:
+    """Allow ``rate`` calls a second on average and ``burst`` at once"""
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = burst
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def take(self):
+        # Waiting under the lock keeps the threads in line
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                self.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+# Shared by every thread and warm invocation of the container
+pacer = TokenBucket(SUBMIT_RATE, SUBMIT_BURST)
+sleep = time.sleep
+jitter = random.Random()
+
+
+def backoff_delays(attempts, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_CAP_SECONDS):
+    """Full-jitter delays before each of ``attempts - 1`` retries"""
+    for attempt in range(attempts - 1):
+        yield jitter.uniform(0, min(cap, base * 2**attempt))
+
+
+def get_priority(docket, priorities=None):
+    if priorities is None:
+        priorities = os.environ.get("DOCKET_PRIORITIES", "")
+    for pair in filter(None, (pair.strip() for pair in priorities.split(","))):
+        prefix, _, priority = pair.partition("=")
+        if docket.upper().startswith(prefix.strip().upper()):
+            return int(priority)
+    return DEFAULT_PRIORITY
+
+
+@metrics.stage("StartJob")
+def start(transcribe, request):
+    """Start a job, False when it was started before.
+
+    Raises ``LimitExceededException`` once the attempts run out.
+    """
+    delays = backoff_delays(SUBMIT_ATTEMPTS)
+    while True:
+        pacer.take()
+        try:
+            transcribe.start_transcription_job(**request)
+            return True
+        except transcribe.exceptions.ConflictException:
+            return False
+        except transcribe.exceptions.LimitExceededException:
+            delay = next(delays, None)
+            if delay is None:
+                raise
+            logger.info(f"Transcribe limit reached, retrying in {delay:.1f}s")
+            sleep(delay)
+
+
+def submit(transcribe, s3_client, bucket, request, docket):
+    """Start the job, or queue it while the quota is used up.
+
+    Returns "started", "exists" for a job started before, or "queued".
+    """
+    if has_pending(s3_client, bucket):
+        enqueue(s3_client, bucket, request, docket)
+        return "queued"
+    try:
+        return "started" if start(transcribe, request) else "exists"
+    except transcribe.exceptions.LimitExceededException:
+        enqueue(s3_client, bucket, request, docket)
+        return "queued"
+
+
+@metrics.stage("Queue")
+def enqueue(s3_client, bucket, request, docket):
+    priority = get_priority(docket)
+    job_name = request["TranscriptionJobName"]
+    key = (
+        f"{PENDING_PREFIX}{priority:02d}/{docket}/"
+        f"{int(time.time() * 1000):013d}-{job_name}.json"
+    )
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(request).encode(),
+        ContentType="application/json",
+    )
+    logger.info(json.dumps({"queued": {"job_name": job_name, "priority": priority}}))
+    return key
+
+
+@metrics.stage("Queue")
+def has_pending(s3_client, bucket):
+    listing = s3_client.list_objects_v2(Bucket=bucket, Prefix=PENDING_PREFIX, MaxKeys=1)
+    return listing["KeyCount"] > 0
+
+
+def list_pending(s3_client, bucket):
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=PENDING_PREFIX):
+        keys.extend(entry["Key"] for entry in page.get("Contents", []))
+    return keys
+
+
+def fair_order(keys):
+    """Queued keys by priority, then round robin over dockets, oldest first"""
+    queues = defaultdict(lambda: defaultdict(list))
+    for key in sorted(keys):
+        priority, docket, _ = key[len(PENDING_PREFIX) :].split("/")
+        queues[priority][docket].append(key)
+
+    ordered = []
+    for priority in sorted(queues):
+        # Dockets take turns, the one waiting longest first
+        dockets = deque(
+            deque(docket_keys)
+            for docket_keys in sorted(
+                queues[priority].values(), key=lambda keys: _queued_at(keys[0])
+            )
+        )
+        while dockets:
+            docket_keys = dockets.popleft()
+            ordered.append(docket_keys.popleft())
+            if docket_keys:
+                dockets.append(docket_keys)
+    return ordered
+
+
+def _queued_at(key):
+    return key.rsplit("/", 1)[1].split("-", 1)[0]
+
+
+def count_in_flight(transcribe):
+    count = 0
+    for status in ACTIVE_STATUSES:
+        kwargs = {"Status": status, "JobNameContains": JOB_NAME_PREFIX}
+        while True:
+            response = transcribe.list_transcription_jobs(**kwargs)
+            count += len(response["TranscriptionJobSummaries"])
+            if "NextToken" not in response:
+                break
+            kwargs["NextToken"] = response["NextToken"]
+    return count
+
+
+def drain(transcribe, s3_client, bucket, limit=None):
+    """Start queued jobs while fewer than ``limit`` are in flight"""
+    limit = MAX_CONCURRENT_JOBS if limit is None else limit
+    with metrics.stage("List"):
+        capacity = max(0, limit - count_in_flight(transcribe))
+        keys = fair_order(list_pending(s3_client, bucket))
+
+    started = []
+    existed = 0
+    records = []
+    for key in keys:
+        if len(started) >= capacity:
+            break
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        request = json.loads(response["Body"].read())
+        try:
+            is_new = start(transcribe, request)
+        except transcribe.exceptions.LimitExceededException:
+            # Jobs outside this stack are using the quota, try again later
+            break
+        s3_client.delete_object(Bucket=bucket, Key=key)
+        if not is_new:
+            # Started before, already counted in flight and recorded
+            existed += 1
+            continue
+        started.append(request["TranscriptionJobName"])
+        records.append(
+            manifest.make_record(
+                key[len(PENDING_PREFIX) :].split("/")[1],
+                "submitted",
+                job_name=request["TranscriptionJobName"],
+                status="started",
+            )
+        )
+    if records and manifest.is_enabled():
+        manifest.append(s3_client, bucket, records)
+    return {"started": started, "pending": len(keys) - len(started) - existed}
+
+
+@metrics.instrument("SubmitPendingJobs")
+def lambda_handler(event, context):
+    bucket = os.environ.get("DOWNLOAD_BUCKET_NAME")
+    if not bucket:
+        raise Exception("Cannot find env DOWNLOAD_BUCKET_NAME")
+    result = drain(transcribe, s3_client, bucket)
+    logger.info(json.dumps({"drain": result}))
+    return result
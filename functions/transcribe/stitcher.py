@@ -0,0 +1,289 @@
+"""Stitch the transcripts of a split recording into one transcript.
+
+RunTranscriptionJob splits long WAV uploads into overlapping chunks (see
+``chunking``) under ``chunks/<job name>/`` in the download bucket, next to
+a ``manifest.json`` listing them. Every chunk transcript written there
+invokes this function, and the last one to arrive writes the stitched
+transcript to the manifest's ``output_key``, which ConvertToDocx picks up.
+
+Stitching shifts every chunk's times by the chunk's start, keeps each word
+only in the chunk that owns its start time and reconciles the speaker
+labels, which every chunk numbers on its own, through the words both
+chunks heard in their overlap.
+"""
+
+import metrics
+import logging
+import json
+import boto3
+from bisect import bisect_left
+from collections import Counter
+from decimal import Decimal
+from urllib.parse import unquote_plus
+
+
+s3_client = boto3.client("s3")
+# Written by RunTranscriptionJob next to the chunks
+MANIFEST_NAME = "manifest.json"
+# Seconds apart two chunks may place the same word in their overlap
+MATCH_SECONDS = 0.25
+MILLISECONDS = Decimal("0.001")
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+
+@metrics.instrument("StitchTranscripts")
+def lambda_handler(event, context):
+    stitched = []
+    for record in event["Records"]:
+        bucket = record["s3"]["bucket"]["name"]
+        key = unquote_plus(record["s3"]["object"]["key"])
+        output_key = stitch_chunks(bucket, key.rsplit("/", 1)[0] + "/")
+        if output_key:
+            stitched.append(output_key)
+    return {"stitched": stitched}
+
+
+def stitch_chunks(bucket, prefix):
+    """Stitch the chunks under ``prefix`` once all of them are transcribed.
+
+    Returns the key of the stitched transcript, or None while chunks are
+    still missing.
+    """
+    with metrics.stage("Check"):
+        try:
+            manifest = read_json(bucket, prefix + MANIFEST_NAME)
+        except s3_client.exceptions.NoSuchKey:
+            logger.warning(f"No manifest under {prefix}")
+            return None
+        existing = list_keys(bucket, prefix)
+    missing = [
+        chunk["transcript_key"]
+        for chunk in manifest["chunks"]
+        if chunk["transcript_key"] not in existing
+    ]
+    if missing:
+        logger.info(json.dumps({"stitch": {"prefix": prefix, "missing": missing}}))
+        return None
+
+    with metrics.stage("Download"):
+        transcripts = [
+            read_json(bucket, chunk["transcript_key"]) for chunk in manifest["chunks"]
+        ]
+    with metrics.stage("Stitch"):
+        data = stitch_transcripts(manifest, transcripts)
+    with metrics.stage("Upload"):
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=manifest["output_key"],
+            Body=json.dumps(data).encode(),
+            ContentType="application/json",
+        )
+    logger.info(f"Stitched {len(transcripts)} chunks into {manifest['output_key']}")
+    return manifest["output_key"]
+
+
+def read_json(bucket, key):
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    return json.loads(response["Body"].read())
+
+
+def list_keys(bucket, prefix):
+    keys = set()
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys.update(entry["Key"] for entry in page.get("Contents", []))
+    return keys
+
+
+def stitch_transcripts(manifest, transcripts):
+    """Merge chunk transcripts, in manifest order, into one transcript dict"""
+    items = []
+    segments = []
+    speakers = set()
+    previous = []
+    for chunk, data in zip(manifest["chunks"], transcripts):
+        if data.get("status") != "COMPLETED":
+            raise Exception(f"Chunk {chunk['index']} is not shown as completed")
+        results = data["results"]
+        offset = Decimal(str(chunk["start"]))
+        words = chunk_words(results, offset)
+
+        mapping = match_speakers(previous, words, speakers)
+        for word in words:
+            word["speaker"] = mapping.get(word["speaker"], word["speaker"])
+        kept = owned_words(chunk, words, previous)
+
+        items.extend(shift_items(results["items"], offset, kept, mapping))
+        for segment in results.get("speaker_labels", {}).get("segments", []):
+            segment = shift_segment(segment, offset, kept, mapping)
+            if segment:
+                segments.append(segment)
+        speakers.update(word["speaker"] for word in words if word["timing"] in kept)
+        previous = [dict(word, kept=word["timing"] in kept) for word in words]
+
+    results = {"transcripts": [{"transcript": transcript_text(items)}], "items": items}
+    if segments:
+        speakers.discard(None)
+        results["speaker_labels"] = {"speakers": len(speakers), "segments": segments}
+    return {"jobName": manifest["job_name"], "results": results, "status": "COMPLETED"}
+
+
+def shift(value, offset):
+    return str((Decimal(value) + offset).quantize(MILLISECONDS))
+
+
+def chunk_words(results, offset):
+    """The words of a chunk with their times in the whole recording"""
+    labels = {}
+    for segment in results.get("speaker_labels", {}).get("segments", []):
+        for item in segment["items"]:
+            labels[(item["start_time"], item["end_time"])] = item["speaker_label"]
+
+    words = []
+    for item in results["items"]:
+        if item["type"] != "pronunciation":
+            continue
+        timing = (item["start_time"], item["end_time"])
+        words.append(
+            {
+                "timing": timing,
+                "start": float(shift(item["start_time"], offset)),
+                "content": item["alternatives"][0]["content"].lower(),
+                "speaker": labels.get(timing, item.get("speaker_label")),
+            }
+        )
+    return words
+
+
+def matches(word, candidates, starts):
+    """Words of ``candidates``, sorted by start, heard as the same ``word``"""
+    first = bisect_left(starts, word["start"] - MATCH_SECONDS)
+    for candidate in candidates[first:]:
+        if candidate["start"] > word["start"] + MATCH_SECONDS:
+            break
+        if candidate["content"] == word["content"]:
+            yield candidate
+
+
+def match_speakers(previous, words, used=frozenset()):
+    """Map the speaker labels of ``words`` onto those of the previous chunk.
+
+    Labels vote for the label their words had in the previous chunk, and
+    are paired off by the most votes first. Transcribe numbers the labels of
+    every chunk on its own, so a label without a partner is a new speaker:
+    it keeps its own label only when no speaker of the stitch so far, in
+    ``used``, has it.
+    """
+    starts = [word["start"] for word in previous]
+    votes = Counter()
+    for word in words:
+        if word["speaker"] is None:
+            continue
+        for match in matches(word, previous, starts):
+            if match["speaker"] is not None:
+                votes[(word["speaker"], match["speaker"])] += 1
+
+    mapping = {}
+    for (label, previous_label), _ in votes.most_common():
+        if label not in mapping and previous_label not in mapping.values():
+            mapping[label] = previous_label
+
+    unmatched = sorted({word["speaker"] for word in words} - set(mapping) - {None})
+    in_use = set(used) | set(mapping.values())
+    taken = in_use | set(unmatched)
+    for label in unmatched:
+        if label in in_use:
+            mapping[label] = free_label(taken)
+            taken.add(mapping[label])
+        else:
+            mapping[label] = label
+    return mapping
+
+
+def free_label(taken):
+    number = 0
+    while f"spk_{number}" in taken:
+        number += 1
+    return f"spk_{number}"
+
+
+def owned_words(chunk, words, previous):
+    """Timings of the words this chunk keeps.
+
+    A word belongs to the chunk its start falls in. A word the previous chunk
+    already kept is dropped even when the two chunks placed it either side of
+    the cut.
+    """
+    kept_before = [word for word in previous if word["kept"]]
+    starts = [word["start"] for word in kept_before]
+    kept = set()
+    for word in words:
+        if not chunk["keep_from"] <= word["start"] < chunk["keep_until"]:
+            continue
+        if word["start"] < chunk["keep_from"] + MATCH_SECONDS and any(
+            matches(word, kept_before, starts)
+        ):
+            continue
+        kept.add(word["timing"])
+    return kept
+
+
+def shift_items(items, offset, kept, mapping):
+    """Kept items with shifted times, punctuation follows the word before it"""
+    shifted = []
+    keep = False
+    for item in items:
+        if item["type"] == "pronunciation":
+            keep = (item["start_time"], item["end_time"]) in kept
+            if keep:
+                item = dict(
+                    item,
+                    start_time=shift(item["start_time"], offset),
+                    end_time=shift(item["end_time"], offset),
+                )
+        if keep:
+            if "speaker_label" in item:
+                label = item["speaker_label"]
+                item = dict(item, speaker_label=mapping.get(label, label))
+            shifted.append(item)
+    return shifted
+
+
+def shift_segment(segment, offset, kept, mapping):
+    speaker = mapping.get(segment["speaker_label"], segment["speaker_label"])
+    items = [
+        dict(
+            item,
+            start_time=shift(item["start_time"], offset),
+            end_time=shift(item["end_time"], offset),
+            speaker_label=speaker,
+        )
+        for item in segment["items"]
+        if (item["start_time"], item["end_time"]) in kept
+    ]
+    if not items:
+        return None
+    if len(items) == len(segment["items"]):
+        start_time = shift(segment["start_time"], offset)
+        end_time = shift(segment["end_time"], offset)
+    else:
+        start_time = items[0]["start_time"]
+        end_time = items[-1]["end_time"]
+    return {
+        "start_time": start_time,
+        "speaker_label": speaker,
+        "end_time": end_time,
+        "items": items,
+    }
+
+
+def transcript_text(items):
+    text = []
+    for item in items:
+        content = item["alternatives"][0]["content"]
+        if item["type"] == "punctuation" or not text:
+            text.append(content)
+        else:
+            text.append(" " + content)
+    return "".join(text)
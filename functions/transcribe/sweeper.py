@@ -0,0 +1,56 @@
+import metrics
+import logging
+import json
+import boto3
+import os
+from datetime import datetime, timedelta, timezone
+
+
+transcribe = boto3.client("transcribe")
+# Only jobs submitted by RunTranscriptionJob are swept
+JOB_NAME_PREFIX = "audiotojson-"
+FINISHED_STATUSES = ("COMPLETED", "FAILED")
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+
+@metrics.instrument("SweepTranscriptionJobs")
+def lambda_handler(event, context):
+    sweep_after_days = int(os.environ.get("SWEEP_AFTER_DAYS", 5))
+    cutoff = datetime.now(timezone.utc) - timedelta(days=sweep_after_days)
+
+    deleted = []
+    # Collect first, deleting while paging can skip jobs
+    with metrics.stage("List"):
+        job_names = list(list_finished_jobs(cutoff))
+    for job_name in job_names:
+        try:
+            with metrics.stage("Delete"):
+                transcribe.delete_transcription_job(TranscriptionJobName=job_name)
+            deleted.append(job_name)
+        except transcribe.exceptions.BadRequestException:
+            # Already deleted by an overlapping sweep
+            pass
+
+    logger.info(
+        json.dumps({"sweep": {"cutoff": cutoff.isoformat(), "deleted": len(deleted)}})
+    )
+    return {"deleted": deleted}
+
+
+def list_finished_jobs(cutoff):
+    """Yield names of finished jobs created before ``cutoff``"""
+    for status in FINISHED_STATUSES:
+        kwargs = {"Status": status, "JobNameContains": JOB_NAME_PREFIX}
+        while True:
+            response = transcribe.list_transcription_jobs(**kwargs)
+            for job in response["TranscriptionJobSummaries"]:
+                created = job["CreationTime"]
+                if created.tzinfo is None:
+                    created = created.replace(tzinfo=timezone.utc)
+                name = job["TranscriptionJobName"]
+                if name.startswith(JOB_NAME_PREFIX) and created < cutoff:
+                    yield name
+            if "NextToken" not in response:
+                break
+            kwargs["NextToken"] = response["NextToken"]
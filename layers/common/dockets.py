@@ -0,0 +1,90 @@
+"""Docket numbers from upload and transcript filenames.
+
+Both functions name their outputs after the docket in the filename, so they
+must read it the same way: RunTranscriptionJob writes
+``transcribed/<docket>.json`` and ConvertToDocx finds the docket again in
+that key. The patterns are searched in order in the final path component,
+without its suffix, and the first match wins, upper-cased.
+
+``DOCKET_PATTERNS`` replaces the defaults with ``;`` separated regexes,
+compiled once per container. A filename without a docket gets a fallback
+name of its function's prefix and a digest of the filename, e.g.
+``Transcription-3f2a9c01b7e4``, so a retried record maps to the same key.
+"""
+
+import hashlib
+import logging
+import os
+import re
+from functools import lru_cache
+from pathlib import PurePosixPath
+
+
+DEFAULT_PATTERNS = (r"(?i)P\d+-\w{2}\d{0,2}", r"\w{3}-\d{3}\w{2}\d{2}")
+FALLBACK_PREFIXES = ("Transcription", "Conversion")
+FALLBACK_DIGEST_LENGTH = 12
+CACHE_SIZE = int(os.environ.get("DOCKET_CACHE_SIZE", 65536))
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+
+def compile_patterns(spec=None):
+    if not spec:
+        return tuple(re.compile(pattern) for pattern in DEFAULT_PATTERNS)
+    return tuple(
+        re.compile(pattern.strip()) for pattern in spec.split(";") if pattern.strip()
+    )
+
+
+PATTERNS = compile_patterns(os.environ.get("DOCKET_PATTERNS"))
+# A fallback name is never searched for a docket, its digest could look like one
+FALLBACK_NAME = re.compile(rf"(?:{'|'.join(FALLBACK_PREFIXES)})-[0-9a-f]+")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def find_docket(stem):
+    """The docket in a filename stem, None when there is none"""
+    if FALLBACK_NAME.fullmatch(stem):
+        return None
+    for pattern in PATTERNS:
+        match = pattern.search(stem)
+        if match:
+            return match.group(0).upper()
+    return None
+
+
+def fallback_name(filename, prefix):
+    digest = hashlib.sha1(filename.encode()).hexdigest()[:FALLBACK_DIGEST_LENGTH]
+    return f"{prefix}-{digest}"
+
+
+def get_docket(filename, prefix):
+    """The docket of ``filename``, else ``prefix`` and a digest of it"""
+    stem = PurePosixPath(filename).stem
+    docket = find_docket(stem)
+    if docket is None:
+        logger.warning(f"Docket not found in filename: {stem}")
+        return fallback_name(filename, prefix)
+    return docket
+
+
+def get_dockets(filenames, prefix):
+    """Dockets of many filenames, e.g. a listing page, by filename.
+
+    Logs one warning for all the filenames without a docket.
+    """
+    dockets = {}
+    missing = []
+    for filename in filenames:
+        if filename in dockets:
+            continue
+        docket = find_docket(PurePosixPath(filename).stem)
+        if docket is None:
+            missing.append(filename)
+            docket = fallback_name(filename, prefix)
+        dockets[filename] = docket
+    if missing:
+        logger.warning(
+            f"Docket not found in {len(missing)} filenames, e.g.: {missing[0]}"
+        )
+    return dockets
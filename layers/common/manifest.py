@@ -0,0 +1,259 @@
+"""A manifest of where every docket is in the pipeline, in the download bucket.
+
+Not the chunk manifest of a split recording. With ``STATUS_MANIFEST`` on,
+the functions append status records as they go: RunTranscriptionJob
+``uploaded`` and ``submitted``, SubmitPendingJobs ``submitted`` for the jobs
+it starts from the queue, and ConvertToDocx ``transcribed`` and
+``converted``. A record has an id, the docket, the stage, the UTC time it was
+recorded and, where there is one, the key and size of the object.
+
+Appending never reads, so writers cannot race: every append is a part of its
+own, ``manifest/parts/<date>/<time>-<id>.jsonl``. CompactManifest merges the
+parts, one compaction at a time, into
+
+* ``manifest/dockets/<docket>.json``, every record of a docket and the
+  latest of each stage, so the state of a docket is one GET
+* ``manifest/days/<date>.jsonl.gz``, the records of a day in time order, so
+  a date range is one GET a day
+
+and then deletes them, ``COMPACT_BATCH`` parts at a time, so a compaction
+holds one batch in memory however far behind it is. Records are merged by id, so a part merged again
+after a compaction stopped half way is only kept once. Both views are as
+fresh as the last compaction.
+"""
+
+import gzip
+import json
+import logging
+import os
+import uuid
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+
+
+SCHEMA_VERSION = 1
+PARTS_PREFIX = "manifest/parts/"
+DOCKETS_PREFIX = "manifest/dockets/"
+DAYS_PREFIX = "manifest/days/"
+STAGES = ("uploaded", "submitted", "transcribed", "converted")
+# Parts merged at a time, each batch deleted once written
+COMPACT_BATCH = 1000
+# Keys deleted by one DeleteObjects call
+DELETE_BATCH = 1000
+logger = logging.getLogger()
+logger.setLevel("INFO")
+
+
+def is_enabled():
+    return os.environ.get("STATUS_MANIFEST", "false") == "true"
+
+
+def make_record(docket, stage, key=None, size=None, time=None, **details):
+    """A status record, ``details`` such as the job name are kept as given"""
+    if stage not in STAGES:
+        raise Exception(f"Unknown manifest stage: {stage}")
+    time = time or datetime.now(timezone.utc)
+    record = {
+        "id": uuid.uuid4().hex,
+        "docket": docket,
+        "stage": stage,
+        "time": time.astimezone(timezone.utc).isoformat(timespec="milliseconds"),
+    }
+    if key is not None:
+        record["key"] = key
+    if size is not None:
+        record["size"] = size
+    record.update(details)
+    return record
+
+
+def part_key(record):
+    day, _, clock = record["time"].partition("T")
+    clock = clock[:12].replace(":", "").replace(".", "")
+    return f"{PARTS_PREFIX}{day}/{clock}-{record['id']}.jsonl"
+
+
+def docket_key(docket):
+    return f"{DOCKETS_PREFIX}{docket}.json"
+
+
+def day_key(day):
+    return f"{DAYS_PREFIX}{day}.jsonl.gz"
+
+
+def append(s3_client, bucket, records):
+    """Write ``records`` as a new part, the key or None when that failed.
+
+    The manifest is bookkeeping, so failing to write it is logged rather than
+    failing the record that was processed.
+    """
+    if not records:
+        return None
+    key = part_key(records[0])
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=_dumps_lines(records),
+            ContentType="application/x-ndjson",
+        )
+    except ClientError:
+        logger.exception(f"Failed to append to the manifest: {key}")
+        return None
+    return key
+
+
+def _dumps_lines(records):
+    return "".join(json.dumps(record) + "\n" for record in records).encode()
+
+
+def _loads_lines(data):
+    return [json.loads(line) for line in data.decode().splitlines() if line]
+
+
+def _get(s3_client, bucket, key):
+    """The object's bytes, None when there is no such object"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
+    with closing(response["Body"]) as body:
+        return body.read()
+
+
+def read_docket(s3_client, bucket, docket):
+    """The compacted status of ``docket``, None when it has no records"""
+    data = _get(s3_client, bucket, docket_key(docket))
+    return None if data is None else json.loads(data)
+
+
+def read_day(s3_client, bucket, day):
+    """The compacted records of ``day``, a ``YYYY-MM-DD`` string"""
+    data = _get(s3_client, bucket, day_key(day))
+    return [] if data is None else _loads_lines(gzip.decompress(data))
+
+
+def days_between(start, end):
+    """Every date from ``start`` to ``end``, both included, as strings"""
+    day = start
+    while day <= end:
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+
+def records_between(s3_client, bucket, start, end, stage=None):
+    """Records of the dates from ``start`` to ``end``, in time order"""
+    records = []
+    for day in days_between(start, end):
+        records.extend(
+            record
+            for record in read_day(s3_client, bucket, day)
+            if stage is None or record["stage"] == stage
+        )
+    return records
+
+
+def merge(records, new_records):
+    """Both lists of records, once each by id, in time order.
+
+    Records of the same millisecond are in pipeline order, and in the order
+    they were appended within a stage.
+    """
+    merged = {record["id"]: record for record in records}
+    merged.update((record["id"], record) for record in new_records)
+    return sorted(
+        merged.values(),
+        key=lambda record: (record["time"], STAGES.index(record["stage"])),
+    )
+
+
+def docket_status(docket, records):
+    """The manifest object of a docket with ``records``, in time order"""
+    return {
+        "version": SCHEMA_VERSION,
+        "docket": docket,
+        "stage": records[-1]["stage"],
+        "updated": records[-1]["time"],
+        "latest": {record["stage"]: record for record in records},
+        "records": records,
+    }
+
+
+def list_parts(s3_client, bucket):
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=PARTS_PREFIX):
+        keys.extend(entry["Key"] for entry in page.get("Contents", []))
+    return keys
+
+
+def compact(s3_client, bucket, workers=8):
+    """Merge every part into the docket and day objects, then delete them.
+
+    Must not run twice at once, two compactions would overwrite each
+    other's docket and day objects.
+    """
+    keys = list_parts(s3_client, bucket)
+    records = 0
+    dockets = set()
+    days = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(keys), COMPACT_BATCH):
+            batch = keys[start : start + COMPACT_BATCH]
+            parts = executor.map(lambda key: _get(s3_client, bucket, key) or b"", batch)
+            by_docket = {}
+            by_day = {}
+            for part in parts:
+                for record in _loads_lines(part):
+                    by_docket.setdefault(record["docket"], []).append(record)
+                    by_day.setdefault(record["time"][:10], []).append(record)
+                    records += 1
+
+            def write_docket(docket):
+                existing = read_docket(s3_client, bucket, docket)
+                merged = merge(
+                    existing["records"] if existing else [], by_docket[docket]
+                )
+                s3_client.put_object(
+                    Bucket=bucket,
+                    Key=docket_key(docket),
+                    Body=json.dumps(docket_status(docket, merged)).encode(),
+                    ContentType="application/json",
+                )
+
+            def write_day(day):
+                merged = merge(read_day(s3_client, bucket, day), by_day[day])
+                s3_client.put_object(
+                    Bucket=bucket,
+                    Key=day_key(day),
+                    Body=gzip.compress(_dumps_lines(merged), mtime=0),
+                    ContentType="application/x-ndjson",
+                    ContentEncoding="gzip",
+                )
+
+            # Raises before the batch is deleted, so a failed compaction is retried
+            list(executor.map(write_docket, by_docket))
+            list(executor.map(write_day, by_day))
+            for offset in range(0, len(batch), DELETE_BATCH):
+                s3_client.delete_objects(
+                    Bucket=bucket,
+                    Delete={
+                        "Objects": [
+                            {"Key": key}
+                            for key in batch[offset : offset + DELETE_BATCH]
+                        ],
+                        "Quiet": True,
+                    },
+                )
+            dockets.update(by_docket)
+            days.update(by_day)
+    return {
+        "parts": len(keys),
+        "records": records,
+        "dockets": len(dockets),
+        "days": len(days),
+    }
@@ -0,0 +1,160 @@
+"""Per-invocation stage timings and peak memory as CloudWatch embedded metrics.
+
+Wrap a handler with ``instrument`` and time its stages with ``stage``::
+
+    @metrics.instrument("ConvertToDocx")
+    def lambda_handler(event, context):
+        with metrics.stage("download"):
+            ...
+
+Each invocation prints one JSON record in the embedded metric format, which
+CloudWatch turns into metrics without any API calls. Stages are timed with a
+monotonic clock and summed over every record of the event, including records
+handled on other threads.
+"""
+
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Measured from the first import, so import this before anything heavy
+INIT_STARTED = time.perf_counter()
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "sam-transcribe")
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+_cold_start = True
+_current = None
+
+
+class Invocation:
+    """Timings of one handler invocation"""
+
+    def __init__(self, function_name, cold_start, init_ms=None):
+        self.function_name = function_name
+        self.cold_start = cold_start
+        self.init_ms = init_ms
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record(self):
+        """The embedded metric format record of this invocation"""
+        values = {
+            "Duration": (self.elapsed_ms(), "Milliseconds"),
+            "ColdStart": (int(self.cold_start), "Count"),
+            "PeakMemory": (round(peak_memory_mb(), 1), "Megabytes"),
+        }
+        if self.init_ms is not None:
+            values["InitDuration"] = (round(self.init_ms, 3), "Milliseconds")
+        for name, seconds in self.stages.items():
+            values[f"{name}Duration"] = (round(seconds * 1000, 3), "Milliseconds")
+        for name, count in self.counts.items():
+            values[name] = (count, "Count")
+
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": NAMESPACE,
+                        "Dimensions": [["FunctionName"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (_, unit) in values.items()
+                        ],
+                    }
+                ],
+            },
+            "FunctionName": self.function_name,
+            **{name: value for name, (value, _) in values.items()},
+        }
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 3)
+
+
+def instrument(function_name):
+    """Emit one metrics record for every call of the wrapped handler"""
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(event, context):
+            invocation = start_invocation(function_name)
+            records = len(event.get("Records", []))
+            # Until the handler returns, every record counts as failed
+            invocation.counts.update(Records=records, FailedRecords=records)
+            try:
+                response = handler(event, context)
+                failures = []
+                if isinstance(response, dict):
+                    failures = response.get("batchItemFailures", [])
+                invocation.counts["FailedRecords"] = len(failures)
+                return response
+            finally:
+                emit(invocation)
+
+        return wrapper
+
+    return decorator
+
+
+def start_invocation(function_name):
+    global _cold_start, _current
+    init_ms = None
+    if _cold_start:
+        init_ms = (time.perf_counter() - INIT_STARTED) * 1000
+    _current = Invocation(function_name, _cold_start, init_ms)
+    _cold_start = False
+    reset_peak_memory()
+    return _current
+
+
+def emit(invocation):
+    global _current
+    # Printed rather than logged, CloudWatch only parses bare JSON lines
+    print(json.dumps(invocation.record()), flush=True)
+    _current = None
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as ``name``, a no-op outside an invocation"""
+    invocation = _current
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if invocation is not None:
+            invocation.add_stage(name, time.perf_counter() - started)
+
+
+def reset_peak_memory():
+    """Reset the kernel's high-water mark so peaks are per invocation"""
+    try:
+        with open(PROC_CLEAR_REFS, "w") as fp:
+            fp.write("5")
+    except OSError:
+        pass
+
+
+def peak_memory_mb():
+    try:
+        with open(PROC_STATUS) as fp:
+            for line in fp:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak of the whole process, where the high-water mark cannot be read
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,144 @@
+from functions.convert import app
+from tools import backfill
+import exporters
+import json
+import pytest
+
+
+DOCKETS = ["P10001-US01", "P10002-US01", "P10003-US01", "P10004-US01"]
+
+
+@pytest.fixture
+def transcripts(mock_s3_client, mock_download_bucket, transcript_data, monkeypatch):
+    monkeypatch.setattr(app, "s3_client", mock_s3_client)
+    for docket in DOCKETS:
+        mock_s3_client.put_object(
+            Bucket=mock_download_bucket.base,
+            Key=f"transcribed/{docket}.json",
+            Body=json.dumps(transcript_data),
+        )
+    return mock_download_bucket.base
+
+
+def converted_keys(s3_client, bucket):
+    listing = s3_client.list_objects_v2(Bucket=bucket, Prefix="converted/")
+    return [obj["Key"] for obj in listing.get("Contents", [])]
+
+
+def test_renders_every_transcript(transcripts, mock_s3_client):
+    report = backfill.backfill(transcripts, "New Name", processes=2)
+
+    assert report["converted"] == len(DOCKETS)
+    assert report["failed"] == []
+    assert report["docs_per_second"] > 0
+    assert converted_keys(mock_s3_client, transcripts) == [
+        f"converted/{docket} New Name.docx" for docket in DOCKETS
+    ]
+
+
+def test_skips_outputs_that_are_up_to_date(transcripts):
+    backfill.backfill(transcripts, "New Name", processes=1)
+    report = backfill.backfill(transcripts, "New Name", processes=1)
+    assert report["converted"] == 0
+    assert report["skipped"] == len(DOCKETS)
+
+    report = backfill.backfill(transcripts, "New Name", processes=1, force=True)
+    assert report["converted"] == len(DOCKETS)
+
+
+def test_reports_failures_and_carries_on(transcripts, mock_s3_client):
+    mock_s3_client.put_object(
+        Bucket=transcripts, Key="transcribed/P10000-US01.json", Body=b"not json"
+    )
+    report = backfill.backfill(transcripts, "New Name", processes=1)
+
+    assert report["converted"] == len(DOCKETS)
+    assert [failure["key"] for failure in report["failed"]] == [
+        "transcribed/P10000-US01.json"
+    ]
+
+
+def test_resumes_from_checkpoint(transcripts, mock_s3_client, tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(
+        json.dumps({"start_after": "transcribed/P10002-US01.json", "failed": []})
+    )
+    report = backfill.backfill(
+        transcripts, "New Name", checkpoint_path=checkpoint, processes=1, page_size=1
+    )
+
+    assert report["converted"] == 2
+    assert converted_keys(mock_s3_client, transcripts) == [
+        "converted/P10003-US01 New Name.docx",
+        "converted/P10004-US01 New Name.docx",
+    ]
+    assert json.loads(checkpoint.read_text())["start_after"] == (
+        "transcribed/P10004-US01.json"
+    )
+
+
+def test_retries_failed_keys_first_on_resume(transcripts, mock_s3_client, tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(
+        json.dumps(
+            {
+                "start_after": "transcribed/P10004-US01.json",
+                "failed": [
+                    "transcribed/P10001-US01.json",
+                    "transcribed/P10002-US01.json",
+                    "transcribed/P10009-US01.json",
+                ],
+            }
+        )
+    )
+    mock_s3_client.put_object(
+        Bucket=transcripts, Key="transcribed/P10002-US01.json", Body=b"not json"
+    )
+    report = backfill.backfill(
+        transcripts, "New Name", checkpoint_path=checkpoint, processes=1
+    )
+
+    assert report["converted"] == 1
+    assert [failure["key"] for failure in report["failed"]] == [
+        "transcribed/P10002-US01.json"
+    ]
+    assert converted_keys(mock_s3_client, transcripts) == [
+        "converted/P10001-US01 New Name.docx"
+    ]
+    # Removed transcripts are dropped too
+    assert json.loads(checkpoint.read_text())["failed"] == [
+        "transcribed/P10002-US01.json"
+    ]
+
+
+def test_holds_at_most_a_window_of_transcripts(transcripts, monkeypatch):
+    fetch = backfill.fetch
+    upload = backfill.upload
+    held = []
+    most = []
+
+    def fetch_and_count(*args):
+        held.append(True)
+        most.append(len(held))
+        return fetch(*args)
+
+    def upload_and_count(*args):
+        upload(*args)
+        held.pop()
+
+    monkeypatch.setattr(backfill, "fetch", fetch_and_count)
+    monkeypatch.setattr(backfill, "upload", upload_and_count)
+    report = backfill.backfill(transcripts, "New Name", processes=1, window=2)
+
+    assert report["converted"] == len(DOCKETS)
+    assert max(most) <= 2
+
+
+def test_renders_with_the_docx_backend(monkeypatch, transcript_data):
+    def fake_backend(transcript, save_as):
+        save_as.write(b"ooxml")
+
+    monkeypatch.setitem(exporters.DOCX_BACKENDS, "ooxml", fake_backend)
+    monkeypatch.setenv("DOCX_BACKEND", "ooxml")
+
+    assert backfill.render(json.dumps(transcript_data).encode()) == b"ooxml"
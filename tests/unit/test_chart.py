@@ -0,0 +1,58 @@
+import functions
+import chart
+from transcript import ConfidenceStats, parse_transcript
+from PIL import Image
+from io import BytesIO
+import subprocess
+import sys
+import pytest
+
+
+@pytest.fixture
+def stats(transcript_data):
+    return parse_transcript(transcript_data).stats
+
+
+def open_png(data):
+    image = Image.open(BytesIO(data))
+    image.load()
+    return image.convert("RGB")
+
+
+@pytest.mark.parametrize("mode", ["fast", "matplotlib"])
+def test_charts_are_pngs_of_the_same_size(stats, mode):
+    assert open_png(chart.make_chart(stats, mode)).size == chart.CHART_SIZE
+
+
+def test_fast_chart_plots_every_word_and_the_mean(stats):
+    image = open_png(chart.make_chart(stats, "fast"))
+    colors = set(image.getdata())
+    assert chart.WORD in colors
+    assert chart.MEAN in colors
+
+
+def test_fast_chart_does_not_import_matplotlib(transcript_file):
+    probe = (
+        "import functions, json, sys\n"
+        "from transcript import load_transcript, parse_transcript\n"
+        "from chart import make_chart\n"
+        f"data = load_transcript({str(transcript_file)!r})\n"
+        "make_chart(parse_transcript(data).stats, 'fast')\n"
+        "print('matplotlib' in sys.modules)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", probe], check=True, capture_output=True, text=True
+    ).stdout
+    assert output.strip() == "False"
+
+
+def test_no_chart_when_off_or_without_words(stats, monkeypatch):
+    monkeypatch.delenv("CHART_MODE", raising=False)
+    assert chart.make_chart(stats) is None
+    assert chart.make_chart(ConfidenceStats(), "fast") is None
+
+
+def test_raises_for_unknown_chart_mode(monkeypatch):
+    monkeypatch.setenv("CHART_MODE", "plotly")
+    with pytest.raises(Exception, match="Unknown chart mode"):
+        chart.get_chart_mode()
@@ -0,0 +1,89 @@
+import functions
+import chunking
+import wave
+import pytest
+from benchmarks.synthetic import make_speech_wav
+
+
+@pytest.fixture
+def speech(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunking, "SEARCH_SECONDS", 20)
+    path = tmp_path / "call.wav"
+    silences = make_speech_wav(path, seconds=600)
+    return path, silences
+
+
+def test_cuts_fall_in_silences(speech, tmp_path):
+    path, silences = speech
+    chunks = list(
+        chunking.split_wav(path, tmp_path, chunk_seconds=120, overlap_seconds=5)
+    )
+
+    assert len(chunks) >= 4
+    for chunk in chunks[1:]:
+        cut = chunk["keep_from"]
+        assert any(start <= cut <= end for start, end in silences), cut
+
+
+def test_chunks_cover_the_recording_and_overlap(speech, tmp_path):
+    path, _ = speech
+    chunks = list(
+        chunking.split_wav(path, tmp_path, chunk_seconds=120, overlap_seconds=5)
+    )
+    with wave.open(str(path)) as wav:
+        duration = wav.getnframes() / wav.getframerate()
+
+    assert chunks[0]["keep_from"] == 0
+    assert chunks[-1]["keep_until"] == round(duration, 3)
+    for before, after in zip(chunks, chunks[1:]):
+        assert before["keep_until"] == after["keep_from"]
+        assert after["start"] == pytest.approx(after["keep_from"] - 5)
+        assert before["end"] == pytest.approx(before["keep_until"] + 5)
+
+
+def test_chunks_hold_the_source_frames(speech, tmp_path):
+    path, _ = speech
+    chunks = list(
+        chunking.split_wav(path, tmp_path, chunk_seconds=120, overlap_seconds=5)
+    )
+
+    with wave.open(str(path)) as source:
+        rate = source.getframerate()
+        for chunk in chunks:
+            with wave.open(chunk["path"]) as part:
+                assert part.getparams()[:3] == source.getparams()[:3]
+                source.setpos(int(round(chunk["start"] * rate)))
+                frames = part.readframes(part.getnframes())
+                assert frames == source.readframes(part.getnframes())
+                # Chunk bounds are kept to the millisecond
+                assert part.getnframes() == pytest.approx(
+                    (chunk["end"] - chunk["start"]) * rate, abs=rate / 1000
+                )
+
+
+def test_short_recording_is_one_chunk(tmp_path):
+    path = tmp_path / "call.wav"
+    make_speech_wav(path, seconds=60)
+    chunks = list(chunking.split_wav(path, tmp_path, chunk_seconds=120))
+
+    assert len(chunks) == 1
+    assert chunks[0]["start"] == 0
+
+
+def test_reads_duration_from_header(mock_s3_client, mock_upload_bucket, tmp_path):
+    path = tmp_path / "call.wav"
+    make_speech_wav(path, seconds=60)
+    mock_s3_client.upload_file(str(path), mock_upload_bucket.base, "call.wav")
+    mock_s3_client.put_object(
+        Bucket=mock_upload_bucket.base, Key="call.mp3", Body=b"ID3" + bytes(1000)
+    )
+
+    with wave.open(str(path)) as wav:
+        duration = wav.getnframes() / wav.getframerate()
+    assert chunking.read_duration(
+        mock_s3_client, mock_upload_bucket.base, "call.wav"
+    ) == pytest.approx(duration)
+    assert (
+        chunking.read_duration(mock_s3_client, mock_upload_bucket.base, "call.mp3")
+        is None
+    )
@@ -0,0 +1,210 @@
+from functions.convert import app
+from tools import backfill
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+import compression
+from contextlib import closing
+import gzip
+import io
+import json
+import random
+import pytest
+
+
+KEY = "transcribed/P12345-US01.json"
+DOCX_KEY = "converted/P12345-US01 Disclosure Call.docx"
+
+
+@pytest.fixture
+def bucket(mock_s3_client, mock_download_bucket, monkeypatch):
+    monkeypatch.setattr(app, "s3_client", mock_s3_client)
+    monkeypatch.setenv("COMMON_FILENAME", "Disclosure Call")
+    return mock_download_bucket.base
+
+
+def put(s3_client, bucket, key, data, encoding="identity", metadata=None):
+    body = json.dumps(data).encode()
+    extra = {}
+    if encoding != "identity":
+        body = compression.compress(body, encoding)
+        extra["ContentEncoding"] = encoding
+    return s3_client.put_object(
+        Bucket=bucket, Key=key, Body=body, Metadata=metadata or {}, **extra
+    )["ETag"].strip('"')
+
+
+@pytest.mark.parametrize("encoding", ["identity", "gzip", "zstd"])
+def test_reads_decompressed_in_small_pieces(
+    encoding, bucket, mock_s3_client, transcript_data
+):
+    put(mock_s3_client, bucket, KEY, transcript_data, encoding)
+    response = mock_s3_client.get_object(Bucket=bucket, Key=KEY)
+    closed = []
+    close = response["Body"].close
+    response["Body"].close = lambda: closed.append(True) or close()
+
+    with closing(compression.open_body(response)) as body:
+        pieces = iter(lambda: body.read(1000), b"")
+        assert json.loads(b"".join(pieces)) == transcript_data
+    assert closed
+
+
+def test_reads_concatenated_gzip_members(bucket, mock_s3_client):
+    mock_s3_client.put_object(
+        Bucket=bucket,
+        Key=KEY,
+        Body=gzip.compress(b'{"a": ') + gzip.compress(b"1}"),
+        ContentEncoding="gzip",
+    )
+    response = mock_s3_client.get_object(Bucket=bucket, Key=KEY)
+    assert json.load(compression.open_body(response)) == {"a": 1}
+
+
+def test_raises_for_unknown_encoding(monkeypatch):
+    monkeypatch.setenv("TRANSCRIPT_ENCODING", "brotli")
+    with pytest.raises(Exception, match="Unknown transcript encoding: brotli"):
+        compression.get_encoding()
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_compresses_transcript_once_after_converting(
+    encoding, bucket, mock_s3_client, transcript_data, s3_event, monkeypatch
+):
+    monkeypatch.setenv("TRANSCRIPT_ENCODING", encoding)
+    put(mock_s3_client, bucket, KEY, transcript_data)
+    event = s3_event(bucket, KEY)
+    app.lambda_handler(event, {})
+
+    response = mock_s3_client.get_object(Bucket=bucket, Key=KEY)
+    assert response["ContentEncoding"] == encoding
+    assert response["Metadata"] == {"logical-etag": "0123456789abcdef0123456789abcdef"}
+    assert json.load(compression.open_body(response)) == transcript_data
+
+    # The rewrite's own event finds the outputs up to date and leaves it be
+    event["Records"][0]["s3"]["object"]["eTag"] = response["ETag"].strip('"')
+    monkeypatch.setattr(app, "make_export_buffer", fail_to_render)
+    assert app.lambda_handler(event, {}) == {"batchItemFailures": []}
+    head = mock_s3_client.head_object(Bucket=bucket, Key=KEY)
+    assert head["ETag"] == response["ETag"]
+
+
+def fail_to_render(*args):
+    raise AssertionError("rendered again")
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_compresses_as_it_is_read(encoding, bucket, mock_s3_client):
+    data = json.dumps([{"content": str(n)} for n in range(100000)]).encode()
+    mock_s3_client.put_object(Bucket=bucket, Key=KEY, Body=data)
+    response = mock_s3_client.get_object(Bucket=bucket, Key=KEY)
+    sizes = []
+    read = response["Body"].read
+    response["Body"].read = lambda size=None: sizes.append(size) or read(size)
+
+    with closing(compression.open_encoded(response["Body"], encoding)) as body:
+        compressed = b"".join(iter(lambda: body.read(1000), b""))
+
+    decoded = compression.open_body(
+        {"Body": io.BytesIO(compressed), "ContentEncoding": encoding}
+    )
+    assert decoded.read() == data
+    assert len(data) > compression.CHUNK_SIZE
+    assert set(sizes) == {compression.CHUNK_SIZE}
+
+
+def enforce_if_match(s3_client, monkeypatch, name):
+    """Fail ``name`` as S3 does when the object no longer has its IfMatch ETag"""
+    call = getattr(s3_client, name)
+
+    def conditional(**kwargs):
+        if "IfMatch" in kwargs:
+            head = s3_client.head_object(Bucket=kwargs["Bucket"], Key=kwargs["Key"])
+            if head["ETag"] != kwargs["IfMatch"]:
+                raise ClientError({"Error": {"Code": "PreconditionFailed"}}, name)
+        return call(**kwargs)
+
+    monkeypatch.setattr(s3_client, name, conditional)
+
+
+@pytest.mark.parametrize("part_size", [8 * 1024 * 1024, 1024])
+def test_leaves_a_transcript_written_again_while_compressing(
+    part_size, bucket, mock_s3_client, transcript_data, monkeypatch, caplog
+):
+    monkeypatch.setenv("TRANSCRIPT_ENCODING", "gzip")
+    monkeypatch.setattr(
+        app, "transfer_config", TransferConfig(multipart_chunksize=part_size)
+    )
+    put(mock_s3_client, bucket, KEY, transcript_data)
+    head = mock_s3_client.head_object(Bucket=bucket, Key=KEY)
+    get_object = mock_s3_client.get_object
+
+    def write_again_after_reading(**kwargs):
+        response = get_object(**kwargs)
+        put(mock_s3_client, bucket, KEY, {"written": "again"})
+        return response
+
+    monkeypatch.setattr(mock_s3_client, "get_object", write_again_after_reading)
+    enforce_if_match(mock_s3_client, monkeypatch, "put_object")
+    enforce_if_match(mock_s3_client, monkeypatch, "complete_multipart_upload")
+    app.compress_transcript(bucket, KEY, head, "logical")
+
+    response = get_object(Bucket=bucket, Key=KEY)
+    assert "ContentEncoding" not in response
+    assert json.load(response["Body"]) == {"written": "again"}
+    assert "Uploads" not in mock_s3_client.list_multipart_uploads(Bucket=bucket)
+    assert any("written again" in message for message in caplog.messages)
+
+
+def test_compresses_a_large_transcript_in_parts(bucket, mock_s3_client, monkeypatch):
+    monkeypatch.setenv("TRANSCRIPT_ENCODING", "gzip")
+    part_size = 5 * 1024 * 1024
+    monkeypatch.setattr(
+        app, "transfer_config", TransferConfig(multipart_chunksize=part_size)
+    )
+    # Random hex only compresses by half, so it takes more than one part
+    data = {"results": random.Random(0).randbytes(part_size).hex()}
+    put(mock_s3_client, bucket, KEY, data)
+    head = mock_s3_client.head_object(Bucket=bucket, Key=KEY)
+    enforce_if_match(mock_s3_client, monkeypatch, "complete_multipart_upload")
+    app.compress_transcript(bucket, KEY, head, "logical")
+
+    response = mock_s3_client.get_object(Bucket=bucket, Key=KEY)
+    assert response["ETag"].strip('"').endswith("-2")
+    assert response["Metadata"] == {"logical-etag": "logical"}
+    assert json.load(compression.open_body(response)) == data
+
+
+@pytest.mark.parametrize("mode", ["memory", "stream", "disk"])
+def test_converts_compressed_transcript(
+    mode, bucket, mock_s3_client, transcript_data, s3_event, monkeypatch
+):
+    monkeypatch.setenv("CONVERT_MODE", mode)
+    monkeypatch.setenv("TRANSCRIPT_ENCODING", "gzip")
+    put(mock_s3_client, bucket, KEY, transcript_data, "gzip", {"logical-etag": "e1"})
+
+    app.lambda_handler(s3_event(bucket, KEY), {})
+
+    head = mock_s3_client.head_object(Bucket=bucket, Key=DOCX_KEY)
+    assert head["Metadata"]["source-etag"] == "e1"
+
+
+def test_stays_uncompressed_by_default(
+    bucket, mock_s3_client, transcript_data, s3_event
+):
+    put(mock_s3_client, bucket, KEY, transcript_data)
+    app.lambda_handler(s3_event(bucket, KEY), {})
+
+    head = mock_s3_client.head_object(Bucket=bucket, Key=KEY)
+    assert "ContentEncoding" not in head
+
+
+def test_backfill_reads_compressed_transcripts(bucket, mock_s3_client, transcript_data):
+    put(mock_s3_client, bucket, KEY, transcript_data, "zstd", {"logical-etag": "e1"})
+
+    report = backfill.backfill(bucket, "Disclosure Call", processes=1)
+    assert report["converted"] == 1
+    head = mock_s3_client.head_object(Bucket=bucket, Key=DOCX_KEY)
+    assert head["Metadata"]["source-etag"] == "e1"
+
+    report = backfill.backfill(bucket, "Disclosure Call", processes=1)
+    assert report["skipped"] == 1
@@ -1,4 +1,15 @@
 from functions.convert import app
+import workspace
+from boto3.s3.transfer import TransferConfig
+from docx import Document
+from docx.shared import RGBColor
+from docx_renderer import new_document, template, write_docx
+from transcript import parse_transcript
+from exporters import save_docx
+from io import BytesIO
+from time import sleep
+import docx_renderer
+import json
 import pytest
 
 
@@ -25,3 +36,398 @@ def test_raises_without_common_filename_env():
     with pytest.raises(Exception) as err:
         app.lambda_handler({}, {})
     assert "COMMON_FILENAME" in str(err.value)
+
+
+def transcript_rows(docx_path):
+    table = Document(str(docx_path)).tables[-1]
+    return [tuple(cell.text for cell in row.cells) for row in table.rows]
+
+
+def test_native_docx_has_a_row_per_speaker_turn(transcript_file, tmp_path):
+    upload_path = tmp_path / "converted.docx"
+    result = app.make_docx_file(transcript_file, upload_path)
+    assert "written in" in result
+
+    rows = transcript_rows(upload_path)
+    assert rows[0] == ("Time", "Speaker", "Content")
+    assert rows[1][0] == "00:00:00"
+    assert rows[1][1].startswith("spk_")
+    assert rows[1][2].startswith(" ")
+
+
+def test_native_docx_matches_tscribe(transcript_file, tmp_path, monkeypatch):
+    monkeypatch.setenv("MPLCONFIGDIR", str(tmp_path / "matplotlib"))
+    native_path = tmp_path / "native.docx"
+    tscribe_path = tmp_path / "tscribe.docx"
+    app.make_docx_file(transcript_file, native_path, renderer="native")
+    app.make_docx_file(transcript_file, tscribe_path, renderer="tscribe")
+
+    assert transcript_rows(native_path) == transcript_rows(tscribe_path)
+
+
+def test_greys_out_low_confidence_words(transcript_data, tmp_path):
+    items = transcript_data["results"]["items"]
+    items[0]["alternatives"][0]["confidence"] = "0.5"
+    items[1]["alternatives"][0]["confidence"] = "0.99"
+    upload_path = tmp_path / "converted.docx"
+    write_docx(transcript_data, upload_path)
+
+    runs = Document(str(upload_path)).tables[-1].rows[1].cells[2].paragraphs[0].runs
+    assert runs[0].font.color.rgb == RGBColor(204, 204, 204)
+    assert runs[1].font.color.rgb is None
+
+
+def test_raises_for_unknown_renderer(transcript_file, tmp_path):
+    with pytest.raises(Exception) as err:
+        app.make_docx_file(transcript_file, tmp_path / "out.docx", renderer="other")
+    assert "Unknown docx renderer" in str(err.value)
+
+
+def test_raises_for_incomplete_transcript(transcript_data, tmp_path):
+    transcript_data["status"] = "IN_PROGRESS"
+    path = tmp_path / "incomplete.json"
+    path.write_text(json.dumps(transcript_data))
+    with pytest.raises(Exception) as err:
+        app.make_docx_file(path, tmp_path / "out.docx")
+    assert "Failed to create docx" in str(err.value)
+
+
+@pytest.fixture
+def transcribed_bucket(
+    mock_s3_client, mock_download_bucket, transcript_data, monkeypatch
+):
+    monkeypatch.setattr(app, "s3_client", mock_s3_client)
+    monkeypatch.setenv("COMMON_FILENAME", "Disclosure Call")
+    mock_s3_client.put_object(
+        Bucket=mock_download_bucket.base,
+        Key="transcribed/P12345-US01.json",
+        Body=json.dumps(transcript_data),
+    )
+    return mock_download_bucket.base
+
+
+def converted_keys(s3_client, bucket):
+    listing = s3_client.list_objects_v2(Bucket=bucket, Prefix="converted/")
+    return [obj["Key"] for obj in listing.get("Contents", [])]
+
+
+def get_docx(s3_client, bucket, key):
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    return Document(BytesIO(body))
+
+
+@pytest.mark.parametrize("mode", ["memory", "disk"])
+def test_converts_transcript_between_buckets(
+    mode, transcribed_bucket, mock_s3_client, s3_event, monkeypatch
+):
+    monkeypatch.setenv("CONVERT_MODE", mode)
+    app.lambda_handler(s3_event(transcribed_bucket, "transcribed/P12345-US01.json"), {})
+
+    document = get_docx(
+        mock_s3_client, transcribed_bucket, "converted/P12345-US01 Disclosure Call.docx"
+    )
+    assert document.tables[-1].rows[0].cells[2].text == "Content"
+
+
+def test_in_memory_mode_does_not_use_tmp(transcribed_bucket, s3_event, monkeypatch):
+    monkeypatch.setenv("CONVERT_MODE", "memory")
+
+    def fail(*args):
+        raise AssertionError("touched local disk")
+
+    monkeypatch.setattr(app, "download_file", fail)
+    monkeypatch.setattr(app, "upload_file", fail)
+    app.lambda_handler(s3_event(transcribed_bucket, "transcribed/P12345-US01.json"), {})
+
+
+def test_large_outputs_use_multipart_upload(
+    transcribed_bucket, mock_s3_client, s3_event, monkeypatch
+):
+    monkeypatch.setattr(
+        app, "transfer_config", TransferConfig(multipart_threshold=1024)
+    )
+    app.lambda_handler(s3_event(transcribed_bucket, "transcribed/P12345-US01.json"), {})
+
+    head = mock_s3_client.head_object(
+        Bucket=transcribed_bucket, Key="converted/P12345-US01 Disclosure Call.docx"
+    )
+    # Multipart ETags end with the number of parts
+    assert head["ETag"].strip('"').endswith("-1")
+
+
+def test_converts_every_record_in_event(
+    transcribed_bucket, mock_s3_client, transcript_data, s3_event
+):
+    mock_s3_client.put_object(
+        Bucket=transcribed_bucket,
+        Key="transcribed/P12345-US02.json",
+        Body=json.dumps(transcript_data),
+    )
+    report = app.lambda_handler(
+        s3_event(
+            transcribed_bucket,
+            "transcribed/P12345-US01.json",
+            "transcribed/P12345-US02.json",
+        ),
+        {},
+    )
+
+    assert report == {"batchItemFailures": []}
+    assert converted_keys(mock_s3_client, transcribed_bucket) == [
+        "converted/P12345-US01 Disclosure Call.docx",
+        "converted/P12345-US02 Disclosure Call.docx",
+    ]
+
+
+def test_raises_when_any_record_fails(transcribed_bucket, mock_s3_client, s3_event):
+    with pytest.raises(Exception) as err:
+        app.lambda_handler(
+            s3_event(
+                transcribed_bucket,
+                "transcribed/P12345-US01.json",
+                "transcribed/P99999-US09.json",
+            ),
+            {},
+        )
+
+    assert str(err.value) == (
+        "Failed to process 1 of 2 record(s): transcribed/P99999-US09.json"
+    )
+    mock_s3_client.head_object(
+        Bucket=transcribed_bucket, Key="converted/P12345-US01 Disclosure Call.docx"
+    )
+
+
+def test_raises_when_every_record_fails(transcribed_bucket, s3_event):
+    with pytest.raises(Exception) as err:
+        app.lambda_handler(s3_event(transcribed_bucket, "transcribed/missing.json"), {})
+    assert "Failed to process 1 of 1 record(s)" in str(err.value)
+
+
+def converted_head(s3_client, bucket):
+    return s3_client.head_object(
+        Bucket=bucket, Key="converted/P12345-US01 Disclosure Call.docx"
+    )
+
+
+def fail_to_render(*args):
+    raise AssertionError("rendered again")
+
+
+def test_stamps_output_with_source_etag_and_renderer_version(
+    transcribed_bucket, mock_s3_client, s3_event
+):
+    app.lambda_handler(s3_event(transcribed_bucket, "transcribed/P12345-US01.json"), {})
+
+    metadata = converted_head(mock_s3_client, transcribed_bucket)["Metadata"]
+    assert metadata == {
+        "source-etag": "0123456789abcdef0123456789abcdef",
+        "renderer-version": app.RENDERER_VERSION,
+    }
+
+
+def test_skips_render_when_output_is_up_to_date(
+    transcribed_bucket, s3_event, monkeypatch
+):
+    event = s3_event(transcribed_bucket, "transcribed/P12345-US01.json")
+    app.lambda_handler(event, {})
+
+    monkeypatch.setattr(app, "make_export_buffer", fail_to_render)
+    monkeypatch.setattr(app, "read_transcript", fail_to_render)
+    report = app.lambda_handler(event, {})
+    assert report == {"batchItemFailures": []}
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        {"force": True},
+        {"etag": "fedcba9876543210fedcba9876543210"},
+        {"renderer_version": "native-0"},
+    ],
+)
+def test_renders_again_when_stamps_differ_or_forced(
+    change, transcribed_bucket, mock_s3_client, s3_event, monkeypatch
+):
+    event = s3_event(transcribed_bucket, "transcribed/P12345-US01.json")
+    app.lambda_handler(event, {})
+
+    if "force" in change:
+        event["force"] = True
+    if "etag" in change:
+        event["Records"][0]["s3"]["object"]["eTag"] = change["etag"]
+    if "renderer_version" in change:
+        monkeypatch.setattr(app, "RENDERER_VERSION", change["renderer_version"])
+    rendered = []
+    make_export_buffer = app.make_export_buffer
+    monkeypatch.setattr(
+        app,
+        "make_export_buffer",
+        lambda *args: rendered.append(args) or make_export_buffer(*args),
+    )
+    app.lambda_handler(event, {})
+
+    assert len(rendered) == 1
+
+
+def test_exports_every_configured_format_from_one_parse(
+    transcribed_bucket, mock_s3_client, s3_event, monkeypatch
+):
+    monkeypatch.setenv("EXPORT_FORMATS", "docx, srt,vtt,csv,txt")
+    parses = []
+    parse_transcript = app.parse_transcript
+    monkeypatch.setattr(
+        app,
+        "parse_transcript",
+        lambda data: parses.append(data) or parse_transcript(data),
+    )
+    app.lambda_handler(s3_event(transcribed_bucket, "transcribed/P12345-US01.json"), {})
+
+    assert len(parses) == 1
+    assert converted_keys(mock_s3_client, transcribed_bucket) == [
+        "converted/P12345-US01 Disclosure Call.csv",
+        "converted/P12345-US01 Disclosure Call.docx",
+        "converted/P12345-US01 Disclosure Call.srt",
+        "converted/P12345-US01 Disclosure Call.txt",
+        "converted/P12345-US01 Disclosure Call.vtt",
+    ]
+
+
+def test_renders_only_formats_that_are_out_of_date(
+    transcribed_bucket, mock_s3_client, s3_event, monkeypatch
+):
+    event = s3_event(transcribed_bucket, "transcribed/P12345-US01.json")
+    app.lambda_handler(event, {})
+
+    monkeypatch.setenv("EXPORT_FORMATS", "docx,txt")
+    rendered = []
+    make_export_buffer = app.make_export_buffer
+    monkeypatch.setattr(
+        app,
+        "make_export_buffer",
+        lambda *args: rendered.append(args[1]) or make_export_buffer(*args),
+    )
+    app.lambda_handler(event, {})
+
+    assert rendered == ["txt"]
+
+
+def test_raises_for_unknown_export_format(transcribed_bucket, s3_event, monkeypatch):
+    monkeypatch.setenv("EXPORT_FORMATS", "docx,pdf")
+    with pytest.raises(Exception) as err:
+        app.lambda_handler(
+            s3_event(transcribed_bucket, "transcribed/P12345-US01.json"), {}
+        )
+    assert "Failed to process 1 of 1 record(s)" in str(err.value)
+
+
+def test_emits_stage_metrics_instead_of_event(
+    transcribed_bucket, s3_event, capsys, caplog
+):
+    app.lambda_handler(s3_event(transcribed_bucket, "transcribed/P12345-US01.json"), {})
+
+    (record,) = [
+        json.loads(line)
+        for line in capsys.readouterr().out.splitlines()
+        if line.startswith('{"_aws"')
+    ]
+    assert record["FunctionName"] == "ConvertToDocx"
+    for stage in ("Check", "Download", "Parse", "Render", "Upload"):
+        assert record[f"{stage}Duration"] > 0
+    assert "## EVENT" not in caplog.text
+
+
+def test_stream_mode_times_the_render(
+    transcribed_bucket, s3_event, capsys, monkeypatch
+):
+    monkeypatch.setenv("CONVERT_MODE", "stream")
+    write_docx_stream = app.write_docx_stream
+
+    def slow_render(*args):
+        sleep(0.05)
+        write_docx_stream(*args)
+
+    monkeypatch.setattr(app, "write_docx_stream", slow_render)
+    app.lambda_handler(s3_event(transcribed_bucket, "transcribed/P12345-US01.json"), {})
+
+    (record,) = [
+        json.loads(line)
+        for line in capsys.readouterr().out.splitlines()
+        if line.startswith('{"_aws"')
+    ]
+    assert record["RenderDuration"] >= 50
+
+
+def test_disk_usage_stays_flat_across_warm_invocations(s3_event, tmp_path, monkeypatch):
+    root = tmp_path / "workspaces"
+    monkeypatch.setattr(workspace, "WORKSPACE_ROOT", root)
+    monkeypatch.setenv("COMMON_FILENAME", "Disclosure Call")
+    monkeypatch.setenv("CONVERT_MODE", "disk")
+    monkeypatch.setattr(app, "get_source_etag", lambda *args: "etag")
+    monkeypatch.setattr(app, "is_up_to_date", lambda *args: False)
+    monkeypatch.setattr(app, "upload_file", lambda *args: None)
+
+    def download_file(download_bucket, key, download_path):
+        with open(download_path, "wb") as fp:
+            fp.write(b"x" * 64 * 1024)
+
+    def make_docx_file(download_path, upload_path, renderer=None):
+        with open(upload_path, "wb") as fp:
+            fp.write(b"x" * 32 * 1024)
+        if len(calls) % 10 == 0:
+            raise Exception("Failed to create docx")
+        return upload_path
+
+    calls = []
+    monkeypatch.setattr(app, "download_file", download_file)
+    monkeypatch.setattr(
+        app, "make_docx_file", lambda *args: calls.append(1) or make_docx_file(*args)
+    )
+
+    event = s3_event("bucket", "transcribed/P12345-US01.json")
+    for _ in range(2000):
+        try:
+            app.lambda_handler(event, {})
+        except Exception:
+            pass
+        assert workspace.usage(root) == 0
+    assert len(calls) == 2000
+    assert list(root.iterdir()) == []
+
+
+@pytest.mark.parametrize("backend", ["python-docx", "ooxml"])
+def test_warm_invocations_reuse_the_loaded_template(
+    backend, transcript_data, tmp_path, monkeypatch
+):
+    app.warm_up()
+
+    def parse_template():
+        raise AssertionError("parsed the default template again")
+
+    monkeypatch.setattr(docx_renderer, "Document", parse_template)
+    target = tmp_path / "converted.docx"
+    save_docx(parse_transcript(transcript_data), str(target), backend)
+    assert transcript_rows(target)[0] == ("Time", "Speaker", "Content")
+
+
+def test_new_documents_are_independent_clones_of_the_template():
+    first, second = new_document(), new_document()
+    first.add_paragraph("only in the first")
+
+    assert second.paragraphs == []
+    assert template().paragraphs == []
+    assert second.styles["Normal"].font.name == "Calibri"
+
+
+def test_chart_mode_is_part_of_the_renderer_version(
+    transcribed_bucket, mock_s3_client, s3_event, monkeypatch
+):
+    monkeypatch.setenv("CHART_MODE", "fast")
+    app.lambda_handler(s3_event(transcribed_bucket, "transcribed/P12345-US01.json"), {})
+
+    head = converted_head(mock_s3_client, transcribed_bucket)
+    assert head["Metadata"]["renderer-version"] == "native-1+chart-fast"
+    document = get_docx(
+        mock_s3_client, transcribed_bucket, "converted/P12345-US01 Disclosure Call.docx"
+    )
+    assert len(document.inline_shapes) == 1
@@ -0,0 +1,78 @@
+from functions.convert import app as convert
+from functions.transcribe import app as transcribe
+import dockets
+from hypothesis import given, strategies as st
+
+
+ASCII = st.text("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 _-.")
+DOCKETS = st.one_of(
+    st.from_regex(r"[Pp]\d{1,6}-[A-Za-z]{2}\d{0,2}", fullmatch=True),
+    st.from_regex(r"[A-Za-z]{3}-\d{3}[A-Za-z]{2}\d{2}", fullmatch=True),
+)
+UPLOADS = st.builds(
+    lambda before, docket, after, suffix: f"{before}{docket}{after}.{suffix}",
+    ASCII,
+    st.one_of(DOCKETS, st.just("")),
+    ASCII,
+    st.sampled_from(["m4a", "mp3", "wav"]),
+)
+
+
+@given(UPLOADS)
+def test_convert_finds_the_docket_transcribe_named_the_transcript(upload):
+    docket = transcribe.get_docket(upload)
+    transcript_key = f"transcribed/{docket}.json"
+    if docket.startswith("Transcription-"):
+        assert convert.get_docket(transcript_key).startswith("Conversion-")
+    else:
+        assert convert.get_docket(transcript_key) == docket
+
+
+@given(DOCKETS, ASCII)
+def test_finds_docket_anywhere_in_the_name(docket, before):
+    assert transcribe.get_docket(f"uploads/{before} {docket}.m4a") == docket.upper()
+
+
+@given(st.lists(UPLOADS, max_size=50))
+def test_batch_matches_single_lookups(uploads):
+    resolved = dockets.get_dockets(uploads, "Transcription")
+    assert resolved == {upload: transcribe.get_docket(upload) for upload in uploads}
+
+
+def test_fallback_name_is_the_same_on_retries():
+    first = transcribe.get_docket("uploads/recording.m4a")
+    assert first == transcribe.get_docket("uploads/recording.m4a")
+    assert first != transcribe.get_docket("uploads/other recording.m4a")
+    assert first.startswith("Transcription-")
+
+
+def test_fallback_name_is_not_read_as_a_docket():
+    # The digest holds what the second pattern would take for a docket
+    assert dockets.find_docket("Transcription-0123ab45cdef") is None
+    assert convert.get_docket("transcribed/Transcription-0123ab45cdef.json") == (
+        dockets.fallback_name(
+            "transcribed/Transcription-0123ab45cdef.json", "Conversion"
+        )
+    )
+
+
+def test_patterns_from_environment(monkeypatch):
+    monkeypatch.setattr(
+        dockets, "PATTERNS", dockets.compile_patterns(r"CASE\d{4} ; (?i)p\d+-\w{2}")
+    )
+    dockets.find_docket.cache_clear()
+    try:
+        assert dockets.find_docket("Hearing case1234") is None
+        assert dockets.find_docket("Hearing CASE1234") == "CASE1234"
+        assert dockets.find_docket("Call p12-us") == "P12-US"
+    finally:
+        dockets.find_docket.cache_clear()
+
+
+def test_batch_logs_one_warning(caplog):
+    resolved = dockets.get_dockets(
+        ["a.json", "b.json", "P1-US01.json", "a.json"], "Conversion"
+    )
+    assert len(resolved) == 3
+    warnings = [m for m in caplog.messages if "Docket not found" in m]
+    assert warnings == ["Docket not found in 2 filenames, e.g.: a.json"]
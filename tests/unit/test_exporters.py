@@ -0,0 +1,129 @@
+import functions
+from exporters import EXPORTERS, export_csv, export_srt, export_txt, export_vtt
+from transcript import ConfidenceStats, Transcript, Turn
+import csv
+import io
+import pytest
+
+
+@pytest.fixture
+def transcript():
+    return Transcript(
+        job_name="audiotojson-P12345-US01",
+        stats=ConfidenceStats(),
+        turns=[
+            Turn(
+                1.25,
+                3.5,
+                "spk_0",
+                [
+                    (" Hello", 0.99, 1.25, 1.8),
+                    (",", None, None, None),
+                    (" there", 0.9, 2.0, 3.5),
+                ],
+            ),
+            Turn(
+                3661.0,
+                3662.004,
+                "spk_1",
+                [(" Yes", 0.99, 3661.0, 3662.004), (".", None, None, None)],
+            ),
+        ],
+    )
+
+
+def test_srt_has_numbered_cues_with_speakers(transcript):
+    assert export_srt(transcript).decode() == (
+        "1\n00:00:01,250 --> 00:00:03,500\nspk_0: Hello, there\n\n"
+        "2\n01:01:01,000 --> 01:01:02,004\nspk_1: Yes.\n"
+    )
+
+
+def test_vtt_uses_voice_tags(transcript):
+    assert export_vtt(transcript).decode() == (
+        "WEBVTT\n\n"
+        "00:00:01.250 --> 00:00:03.500\n<v spk_0>Hello, there\n\n"
+        "01:01:01.000 --> 01:01:02.004\n<v spk_1>Yes.\n"
+    )
+
+
+def long_turn(words, seconds_per_word):
+    """A turn of ``words`` numbered words, said ``seconds_per_word`` apart"""
+    runs = []
+    for index in range(words):
+        start = 10.0 + index * seconds_per_word
+        runs.append((f" word{index}", 0.99, start, start + seconds_per_word * 0.8))
+        if index % 10 == 9:
+            runs.append((".", None, None, None))
+    return Turn(10.0, runs[-2][3] + 0.5, "spk_0", runs)
+
+
+def cue_words(cue):
+    return [word.strip(".") for word in cue["text"].replace("spk_0: ", "").split()]
+
+
+def parse_srt(data):
+    cues = []
+    for block in data.decode().split("\n\n"):
+        number, timing, *lines = block.strip().split("\n")
+        start, end = timing.split(" --> ")
+        cues.append(
+            {"start": start, "end": end, "lines": lines, "text": " ".join(lines)}
+        )
+    return cues
+
+
+def seconds(timestamp):
+    clock, millis = timestamp.split(",")
+    hours, minutes, secs = clock.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(secs) + int(millis) / 1000
+
+
+def test_long_turns_are_split_into_two_line_cues(transcript):
+    transcript.turns = [long_turn(words=60, seconds_per_word=0.1)]
+    cues = parse_srt(export_srt(transcript))
+
+    assert len(cues) > 1
+    assert all(len(cue["lines"]) <= 2 for cue in cues)
+    assert all(len(line) <= 80 for cue in cues for line in cue["lines"])
+    assert all(cue["text"].startswith("spk_0: ") for cue in cues)
+    assert [word for cue in cues for word in cue_words(cue)] == [
+        f"word{index}" for index in range(60)
+    ]
+    # Each cue is timed by its words, the first and last by the turn
+    assert cues[0]["start"] == "00:00:10,000"
+    assert seconds(cues[1]["start"]) == pytest.approx(
+        10.0 + len(cue_words(cues[0])) * 0.1
+    )
+    assert cues[-1]["end"] == "00:00:16,480"
+
+
+def test_slow_turns_are_split_into_short_cues(transcript):
+    transcript.turns = [long_turn(words=12, seconds_per_word=2.0)]
+    cues = parse_srt(export_srt(transcript))
+
+    assert [len(cue_words(cue)) for cue in cues] == [3, 3, 3, 3]
+    assert all(seconds(cue["end"]) - seconds(cue["start"]) <= 7.0 for cue in cues[:-1])
+    vtt = export_vtt(transcript).decode().split("\n\n")
+    assert len(vtt) == 1 + len(cues)
+    assert all(cue.startswith("00:") for cue in vtt[1:])
+
+
+def test_csv_has_a_row_per_turn(transcript):
+    rows = list(csv.reader(io.StringIO(export_csv(transcript).decode())))
+    assert rows == [
+        ["start_time", "end_time", "speaker", "comment"],
+        ["00:00:01", "00:00:03", "spk_0", "Hello, there"],
+        ["01:01:01", "01:01:02", "spk_1", "Yes."],
+    ]
+
+
+def test_txt_has_a_line_per_turn(transcript):
+    assert export_txt(transcript).decode() == (
+        "[00:00:01] spk_0: Hello, there\n[01:01:01] spk_1: Yes.\n"
+    )
+
+
+def test_every_exporter_returns_bytes(transcript):
+    for exporter in EXPORTERS.values():
+        assert isinstance(exporter(transcript), bytes)
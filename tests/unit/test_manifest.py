@@ -0,0 +1,228 @@
+from functions.convert import app as convert_app
+from functions.transcribe import app as transcribe_app
+from tools import manifest as manifest_tool
+from datetime import date, datetime, timezone
+from benchmarks.fake_transcribe import FakeClock, FakeTranscribe
+import manifest
+import scheduler
+import boto3
+import json
+import pytest
+
+
+def at(day, hour=12):
+    return datetime(2026, 10, day, hour, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def bucket(mock_s3_client, mock_download_bucket, monkeypatch):
+    monkeypatch.setenv("STATUS_MANIFEST", "true")
+    return mock_download_bucket.base
+
+
+def test_rejects_unknown_stages():
+    with pytest.raises(Exception) as err:
+        manifest.make_record("P12345-US01", "rendered")
+    assert "Unknown manifest stage" in str(err.value)
+
+
+def test_parts_are_named_after_their_day_and_time():
+    record = manifest.make_record("P12345-US01", "uploaded", time=at(3, 9))
+
+    assert record["time"] == "2026-10-03T09:00:00.000+00:00"
+    assert manifest.part_key(record) == (
+        f"manifest/parts/2026-10-03/090000000-{record['id']}.jsonl"
+    )
+
+
+def test_compacts_parts_into_docket_and_day_objects(mock_s3_client, bucket):
+    manifest.append(
+        mock_s3_client,
+        bucket,
+        [
+            manifest.make_record("P1-US01", "uploaded", key="a.m4a", time=at(3)),
+            manifest.make_record("P1-US01", "submitted", job_name="j", time=at(3)),
+        ],
+    )
+    manifest.append(
+        mock_s3_client,
+        bucket,
+        [manifest.make_record("P1-US01", "converted", size=10, time=at(4))],
+    )
+    manifest.append(
+        mock_s3_client,
+        bucket,
+        [manifest.make_record("P2-US01", "uploaded", time=at(4, 13))],
+    )
+
+    result = manifest.compact(mock_s3_client, bucket)
+
+    assert result == {"parts": 3, "records": 4, "dockets": 2, "days": 2}
+    assert manifest.list_parts(mock_s3_client, bucket) == []
+    status = manifest.read_docket(mock_s3_client, bucket, "P1-US01")
+    assert status["stage"] == "converted"
+    assert status["latest"]["uploaded"]["key"] == "a.m4a"
+    assert [r["stage"] for r in status["records"]] == [
+        "uploaded",
+        "submitted",
+        "converted",
+    ]
+    assert [
+        r["docket"] for r in manifest.read_day(mock_s3_client, bucket, "2026-10-04")
+    ] == ["P1-US01", "P2-US01"]
+
+
+def test_merges_a_part_compacted_twice_once(mock_s3_client, bucket):
+    records = [manifest.make_record("P1-US01", "uploaded", time=at(3))]
+    manifest.append(mock_s3_client, bucket, records)
+    manifest.compact(mock_s3_client, bucket)
+    # As if the last compaction stopped before deleting it
+    manifest.append(mock_s3_client, bucket, records)
+    manifest.compact(mock_s3_client, bucket)
+
+    assert len(manifest.read_docket(mock_s3_client, bucket, "P1-US01")["records"]) == 1
+    assert len(manifest.read_day(mock_s3_client, bucket, "2026-10-03")) == 1
+
+
+def test_compacts_in_batches_deleting_each_once_written(
+    mock_s3_client, bucket, monkeypatch
+):
+    monkeypatch.setattr(manifest, "COMPACT_BATCH", 2)
+    for day, stage in ((3, "uploaded"), (3, "submitted"), (4, "converted")):
+        manifest.append(
+            mock_s3_client,
+            bucket,
+            [manifest.make_record("P1-US01", stage, time=at(day))],
+        )
+    put_object = mock_s3_client.put_object
+
+    def fail_second_day(**kwargs):
+        if kwargs["Key"] == manifest.day_key("2026-10-04"):
+            raise Exception("put failed")
+        return put_object(**kwargs)
+
+    monkeypatch.setattr(mock_s3_client, "put_object", fail_second_day)
+    with pytest.raises(Exception):
+        manifest.compact(mock_s3_client, bucket)
+
+    # Only the batch that failed is left for the next compaction
+    [left] = manifest.list_parts(mock_s3_client, bucket)
+    assert left.startswith("manifest/parts/2026-10-04/")
+    monkeypatch.setattr(mock_s3_client, "put_object", put_object)
+    assert manifest.compact(mock_s3_client, bucket) == {
+        "parts": 1,
+        "records": 1,
+        "dockets": 1,
+        "days": 1,
+    }
+    assert [
+        r["stage"]
+        for r in manifest.read_docket(mock_s3_client, bucket, "P1-US01")["records"]
+    ] == ["uploaded", "submitted", "converted"]
+
+
+def test_reads_a_date_range_a_day_at_a_time(mock_s3_client, bucket, monkeypatch):
+    for day in (2, 3, 5):
+        manifest.append(
+            mock_s3_client,
+            bucket,
+            [
+                manifest.make_record("P1-US01", "uploaded", time=at(day, 8)),
+                manifest.make_record("P1-US01", "converted", time=at(day, 9)),
+            ],
+        )
+    manifest.compact(mock_s3_client, bucket)
+    read = []
+    read_day = manifest.read_day
+    monkeypatch.setattr(
+        manifest, "read_day", lambda *args: read.append(args[2]) or read_day(*args)
+    )
+
+    records = manifest.records_between(
+        mock_s3_client, bucket, date(2026, 10, 3), date(2026, 10, 5), "converted"
+    )
+
+    assert read == ["2026-10-03", "2026-10-04", "2026-10-05"]
+    assert [record["time"][:10] for record in records] == ["2026-10-03", "2026-10-05"]
+
+
+def test_failing_to_append_does_not_raise(mock_s3_client, caplog):
+    record = manifest.make_record("P1-US01", "uploaded")
+
+    assert manifest.append(mock_s3_client, "missing-bucket", [record]) is None
+    assert any("Failed to append" in message for message in caplog.messages)
+
+
+def test_drained_jobs_are_recorded_as_submitted(mock_s3_client, bucket):
+    clock = FakeClock()
+    request = {
+        "TranscriptionJobName": "audiotojson-P1-US01-00",
+        "LanguageCode": "en-US",
+        "MediaFormat": "wav",
+        "Media": {"MediaFileUri": "s3://upload/P1-US01.wav"},
+        "OutputBucketName": bucket,
+        "OutputKey": "transcribed/P1-US01.json",
+    }
+    scheduler.enqueue(mock_s3_client, bucket, request, "P1-US01")
+    scheduler.drain(FakeTranscribe(clock), mock_s3_client, bucket, limit=1)
+    manifest.compact(mock_s3_client, bucket)
+
+    status = manifest.read_docket(mock_s3_client, bucket, "P1-US01")
+    assert status["latest"]["submitted"]["job_name"] == "audiotojson-P1-US01-00"
+
+
+def test_records_a_docket_through_the_pipeline(
+    mock_s3_client,
+    mock_upload_bucket,
+    bucket,
+    transcript_data,
+    s3_event,
+    monkeypatch,
+    capsys,
+):
+    monkeypatch.setattr(
+        transcribe_app,
+        "transcribe",
+        boto3.client("transcribe", region_name="us-east-1"),
+    )
+    monkeypatch.setattr(transcribe_app, "s3_client", mock_s3_client)
+    monkeypatch.setattr(convert_app, "s3_client", mock_s3_client)
+    monkeypatch.setenv("MAX_SPEAKERS", "5")
+    monkeypatch.setenv("DOWNLOAD_BUCKET_NAME", bucket)
+    monkeypatch.setenv("COMMON_FILENAME", "Disclosure Call")
+
+    upload = s3_event(mock_upload_bucket.base, "Call P12345-US01.m4a")
+    upload["Records"][0]["s3"]["object"]["size"] = 2048
+    transcribe_app.lambda_handler(upload, {})
+    body = json.dumps(transcript_data).encode()
+    mock_s3_client.put_object(
+        Bucket=bucket, Key="transcribed/P12345-US01.json", Body=body
+    )
+    transcribed = s3_event(bucket, "transcribed/P12345-US01.json")
+    transcribed["Records"][0]["s3"]["object"]["size"] = len(body)
+    convert_app.lambda_handler(transcribed, {})
+
+    assert manifest_tool.main(["--bucket", bucket, "compact"]) == 0
+    status = manifest.read_docket(mock_s3_client, bucket, "P12345-US01")
+    assert [record["stage"] for record in status["records"]] == [
+        "uploaded",
+        "submitted",
+        "transcribed",
+        "converted",
+    ]
+    assert status["latest"]["uploaded"]["size"] == 2048
+    assert status["latest"]["submitted"]["status"] == "started"
+    assert status["latest"]["transcribed"]["size"] == len(body)
+    converted = status["latest"]["converted"]
+    assert converted["key"] == "converted/P12345-US01 Disclosure Call.docx"
+    assert (
+        converted["size"]
+        == mock_s3_client.head_object(Bucket=bucket, Key=converted["key"])[
+            "ContentLength"
+        ]
+    )
+
+    capsys.readouterr()
+    assert manifest_tool.main(["--bucket", bucket, "status", "P12345-US01"]) == 0
+    assert capsys.readouterr().out.startswith("P12345-US01: converted at ")
+    assert manifest_tool.main(["--bucket", bucket, "status", "P99999-US09"]) == 1
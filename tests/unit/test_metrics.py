@@ -0,0 +1,98 @@
+import functions
+import metrics
+from concurrent.futures import ThreadPoolExecutor
+import json
+import pytest
+import time
+
+
+@pytest.fixture
+def emitted(capsys):
+    def read():
+        lines = capsys.readouterr().out.strip().splitlines()
+        return [json.loads(line) for line in lines]
+
+    return read
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.setattr(metrics, "_cold_start", True)
+
+    @metrics.instrument("TestFunction")
+    def lambda_handler(event, context):
+        with metrics.stage("Render"):
+            time.sleep(0.01)
+        if event.get("fail"):
+            raise Exception("Failed to process 2 record(s)")
+        return {"batchItemFailures": [{"itemIdentifier": "b"}]}
+
+    return lambda_handler
+
+
+def test_emits_one_embedded_metric_record_per_invocation(handler, emitted):
+    handler({"Records": [{}, {}]}, {})
+
+    (record,) = emitted()
+    (directive,) = record["_aws"]["CloudWatchMetrics"]
+    assert directive["Namespace"] == metrics.NAMESPACE
+    assert directive["Dimensions"] == [["FunctionName"]]
+    names = {metric["Name"] for metric in directive["Metrics"]}
+    assert names == {
+        "Duration",
+        "ColdStart",
+        "PeakMemory",
+        "InitDuration",
+        "RenderDuration",
+        "Records",
+        "FailedRecords",
+    }
+    # Every metric is a top-level member of the record
+    assert names <= set(record)
+    assert record["FunctionName"] == "TestFunction"
+    assert record["Records"] == 2
+    assert record["FailedRecords"] == 1
+    assert record["RenderDuration"] >= 10
+    assert record["Duration"] >= record["RenderDuration"]
+    assert record["PeakMemory"] > 0
+
+
+def test_flags_cold_start_only_once(handler, emitted):
+    handler({"Records": []}, {})
+    handler({"Records": []}, {})
+
+    cold, warm = emitted()
+    assert cold["ColdStart"] == 1
+    assert cold["InitDuration"] > 0
+    assert warm["ColdStart"] == 0
+    assert "InitDuration" not in warm
+
+
+def test_counts_every_record_failed_when_handler_raises(handler, emitted):
+    with pytest.raises(Exception):
+        handler({"Records": [{}, {}], "fail": True}, {})
+
+    (record,) = emitted()
+    assert record["FailedRecords"] == 2
+
+
+def test_sums_stages_across_threads(monkeypatch):
+    monkeypatch.setattr(metrics, "_current", None)
+    invocation = metrics.start_invocation("TestFunction")
+
+    def work(_):
+        with metrics.stage("Upload"):
+            time.sleep(0.02)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(work, range(4)))
+
+    assert invocation.stages["Upload"] >= 0.08
+
+
+def test_stage_is_a_no_op_outside_an_invocation():
+    @metrics.stage("Download")
+    def download():
+        return "downloaded"
+
+    assert download() == "downloaded"
@@ -0,0 +1,75 @@
+import functions
+import docx_renderer
+import ooxml
+from exporters import save_docx
+from docx import Document
+from docx.shared import RGBColor
+from lxml import etree
+from transcript import parse_transcript
+import zipfile
+import pytest
+
+
+@pytest.fixture
+def transcript(transcript_data, monkeypatch):
+    produced = "Document produced on Monday 01 January 2024 at 12:00:00."
+    monkeypatch.setattr(docx_renderer, "produced_on", lambda: produced)
+    monkeypatch.setattr(ooxml, "produced_on", lambda: produced)
+    return parse_transcript(transcript_data)
+
+
+def read_parts(path):
+    with zipfile.ZipFile(path) as package:
+        return {name: package.read(name) for name in package.namelist()}
+
+
+def canonical(xml):
+    return etree.tostring(etree.fromstring(xml), method="c14n")
+
+
+@pytest.mark.parametrize("chart_mode", ["off", "fast"])
+def test_ooxml_docx_matches_python_docx(transcript, tmp_path, chart_mode, monkeypatch):
+    monkeypatch.setenv("CHART_MODE", chart_mode)
+    native_path = tmp_path / "native.docx"
+    ooxml_path = tmp_path / "ooxml.docx"
+    save_docx(transcript, str(native_path), backend="python-docx")
+    save_docx(transcript, str(ooxml_path), backend="ooxml")
+
+    native, written = read_parts(native_path), read_parts(ooxml_path)
+    assert written.keys() == native.keys()
+    for name, data in native.items():
+        if name == ooxml.DOCUMENT_PART:
+            assert canonical(written[name]) == canonical(data)
+        else:
+            assert written[name] == data
+
+
+def test_ooxml_fills_summary_per_document(transcript, tmp_path):
+    first, second = tmp_path / "first.docx", tmp_path / "second.docx"
+    ooxml.render_docx(transcript, str(first))
+    transcript.job_name = "audiotojson-P99999-US09"
+    transcript.stats.counts[0] += 1
+    transcript.stats.total += 1
+    ooxml.render_docx(transcript, str(second))
+
+    assert Document(str(first)).paragraphs[0].text.endswith("P12345-US01")
+    document = Document(str(second))
+    assert document.paragraphs[0].text == "Transcription of audiotojson-P99999-US09"
+    assert "{" not in "".join(
+        cell.text for row in document.tables[0].rows for cell in row.cells
+    )
+
+
+def test_ooxml_greys_out_low_confidence_words(transcript_data, tmp_path):
+    transcript_data["results"]["items"][0]["alternatives"][0]["confidence"] = "0.5"
+    target = tmp_path / "ooxml.docx"
+    ooxml.render_docx(parse_transcript(transcript_data), str(target))
+
+    runs = Document(str(target)).tables[-1].rows[1].cells[2].paragraphs[0].runs
+    assert runs[0].font.color.rgb == RGBColor(204, 204, 204)
+    assert runs[0].text.startswith(" ")
+
+
+def test_raises_for_unknown_docx_backend(transcript, tmp_path):
+    with pytest.raises(Exception, match="Unknown docx backend"):
+        save_docx(transcript, str(tmp_path / "out.docx"), backend="other")
@@ -0,0 +1,152 @@
+from functions.convert import app
+import boto3
+import json
+import pytest
+
+
+@pytest.fixture
+def convert_queue(mock_s3_client, mock_download_bucket, monkeypatch):
+    """The download bucket notifying a queue of new transcripts, as deployed"""
+    monkeypatch.setattr(app, "s3_client", mock_s3_client)
+    monkeypatch.setenv("COMMON_FILENAME", "Disclosure Call")
+    sqs_client = boto3.client("sqs", region_name="us-east-1")
+    queue_url = sqs_client.create_queue(QueueName="convert-queue")["QueueUrl"]
+    queue_arn = sqs_client.get_queue_attributes(
+        QueueUrl=queue_url, AttributeNames=["QueueArn"]
+    )["Attributes"]["QueueArn"]
+    mock_s3_client.put_bucket_notification_configuration(
+        Bucket=mock_download_bucket.base,
+        NotificationConfiguration={
+            "QueueConfigurations": [
+                {
+                    "QueueArn": queue_arn,
+                    "Events": ["s3:ObjectCreated:*"],
+                    "Filter": {
+                        "Key": {
+                            "FilterRules": [
+                                {"Name": "prefix", "Value": "transcribed/"},
+                                {"Name": "suffix", "Value": ".json"},
+                            ]
+                        }
+                    },
+                }
+            ]
+        },
+    )
+    return sqs_client, queue_url
+
+
+def receive_event(sqs_client, queue_url):
+    """Every message on the queue as Lambda's SQS event"""
+    messages = sqs_client.receive_message(
+        QueueUrl=queue_url, MaxNumberOfMessages=10
+    ).get("Messages", [])
+    return {
+        "Records": [
+            {
+                "messageId": message["MessageId"],
+                "receiptHandle": message["ReceiptHandle"],
+                "body": message["Body"],
+                "eventSource": "aws:sqs",
+            }
+            for message in messages
+        ]
+    }
+
+
+def converted_keys(s3_client, bucket):
+    listing = s3_client.list_objects_v2(Bucket=bucket, Prefix="converted/")
+    return [obj["Key"] for obj in listing.get("Contents", [])]
+
+
+def test_converts_queued_transcripts_in_one_batch(
+    convert_queue, mock_s3_client, mock_download_bucket, transcript_data
+):
+    sqs_client, queue_url = convert_queue
+    for docket in ("P12345-US01", "P12345-US02"):
+        mock_s3_client.put_object(
+            Bucket=mock_download_bucket.base,
+            Key=f"transcribed/{docket}.json",
+            Body=json.dumps(transcript_data),
+        )
+    event = receive_event(sqs_client, queue_url)
+    # S3's test event is delivered first and holds no records
+    assert len(event["Records"]) == 3
+
+    assert app.lambda_handler(event, {}) == {"batchItemFailures": []}
+    assert converted_keys(mock_s3_client, mock_download_bucket.base) == [
+        "converted/P12345-US01 Disclosure Call.docx",
+        "converted/P12345-US02 Disclosure Call.docx",
+    ]
+
+
+def test_reports_only_failed_messages(
+    convert_queue, mock_s3_client, mock_download_bucket, transcript_data
+):
+    sqs_client, queue_url = convert_queue
+    mock_s3_client.put_object(
+        Bucket=mock_download_bucket.base,
+        Key="transcribed/P12345-US01.json",
+        Body=json.dumps(transcript_data),
+    )
+    mock_s3_client.put_object(
+        Bucket=mock_download_bucket.base,
+        Key="transcribed/P99999-US09.json",
+        Body=b"{not json",
+    )
+    event = receive_event(sqs_client, queue_url)
+    bad = [
+        record["messageId"]
+        for record in event["Records"]
+        if "P99999-US09" in record["body"]
+    ]
+
+    report = app.lambda_handler(event, {})
+
+    assert report == {"batchItemFailures": [{"itemIdentifier": bad[0]}]}
+    assert converted_keys(mock_s3_client, mock_download_bucket.base) == [
+        "converted/P12345-US01 Disclosure Call.docx"
+    ]
+
+
+def test_converts_a_record_queued_twice_once(
+    convert_queue, mock_s3_client, mock_download_bucket, transcript_data, monkeypatch
+):
+    sqs_client, queue_url = convert_queue
+    mock_s3_client.put_object(
+        Bucket=mock_download_bucket.base,
+        Key="transcribed/P12345-US01.json",
+        Body=json.dumps(transcript_data),
+    )
+    event = receive_event(sqs_client, queue_url)
+    message = event["Records"][-1]
+    event["Records"].append({**message, "messageId": "redelivered"})
+    converted = []
+    convert_record = app.convert_record
+    monkeypatch.setattr(
+        app,
+        "convert_record",
+        lambda record, *args: converted.append(record) or convert_record(record, *args),
+    )
+
+    assert app.lambda_handler(event, {}) == {"batchItemFailures": []}
+    assert len(converted) == 1
+
+
+def test_reports_unreadable_messages(
+    convert_queue, mock_s3_client, mock_download_bucket, transcript_data
+):
+    sqs_client, queue_url = convert_queue
+    mock_s3_client.put_object(
+        Bucket=mock_download_bucket.base,
+        Key="transcribed/P12345-US01.json",
+        Body=json.dumps(transcript_data),
+    )
+    event = receive_event(sqs_client, queue_url)
+    event["Records"].append(
+        {"messageId": "garbled", "body": "not json", "eventSource": "aws:sqs"}
+    )
+
+    report = app.lambda_handler(event, {})
+
+    assert report == {"batchItemFailures": [{"itemIdentifier": "garbled"}]}
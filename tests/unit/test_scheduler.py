@@ -0,0 +1,212 @@
+from functions.transcribe import app
+import scheduler
+import manifest
+import random
+import pytest
+from collections import Counter
+from benchmarks.fake_transcribe import FakeClock, FakeTranscribe
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(
+        scheduler, "pacer", scheduler.TokenBucket(5, 5, clock.time, clock.sleep)
+    )
+    monkeypatch.setattr(scheduler, "sleep", clock.sleep)
+    monkeypatch.setattr(scheduler, "jitter", random.Random(0))
+    return clock
+
+
+@pytest.fixture
+def bucket(mock_s3_client, mock_download_bucket):
+    return mock_download_bucket.base
+
+
+def request(name, docket="P10001-US01"):
+    return {
+        "TranscriptionJobName": f"audiotojson-{docket}-{name}",
+        "LanguageCode": "en-US",
+        "MediaFormat": "wav",
+        "Media": {"MediaFileUri": f"s3://upload/{docket}.wav"},
+        "OutputKey": f"transcribed/{docket}.json",
+    }
+
+
+def pending(s3_client, bucket):
+    return scheduler.list_pending(s3_client, bucket)
+
+
+def test_token_bucket_paces_calls():
+    clock = FakeClock()
+    bucket = scheduler.TokenBucket(2, 2, clock.time, clock.sleep)
+    for _ in range(10):
+        bucket.take()
+    # Two go at once, the other eight at two a second
+    assert clock.now == pytest.approx(4.0)
+
+
+def test_backoff_delays_grow_with_full_jitter(clock):
+    delays = list(scheduler.backoff_delays(6, base=1, cap=8))
+    assert len(delays) == 5
+    for attempt, delay in enumerate(delays):
+        assert 0 <= delay <= min(8, 2**attempt)
+
+
+def test_priority_by_docket_prefix():
+    assert scheduler.get_priority("P12345-US01", "P1=1, P=2") == 1
+    assert scheduler.get_priority("P22345-US01", "P1=1, P=2") == 2
+    assert scheduler.get_priority("ABC-123DE45", "P1=1") == scheduler.DEFAULT_PRIORITY
+
+
+def test_retries_until_quota_frees(clock, mock_s3_client, bucket, monkeypatch):
+    monkeypatch.setattr(scheduler, "SUBMIT_ATTEMPTS", 8)
+    transcribe = FakeTranscribe(clock, max_concurrent=1, job_seconds=1)
+
+    for name in ("first", "second"):
+        status = scheduler.submit(
+            transcribe, mock_s3_client, bucket, request(name), "P10001-US01"
+        )
+        assert status == "started"
+    assert transcribe.rejected >= 1
+    assert transcribe.peak_in_flight == 1
+
+
+def test_queues_job_instead_of_failing(clock, mock_s3_client, bucket):
+    transcribe = FakeTranscribe(clock, max_concurrent=1, job_seconds=3600)
+
+    statuses = [
+        scheduler.submit(transcribe, mock_s3_client, bucket, request(name), "P1")
+        for name in ("first", "second", "third")
+    ]
+
+    assert statuses == ["started", "queued", "queued"]
+    assert len(pending(mock_s3_client, bucket)) == 2
+    # The third queued behind the second without asking Transcribe
+    assert transcribe.rejected == scheduler.SUBMIT_ATTEMPTS
+
+
+def test_retried_job_is_not_started_twice(clock, mock_s3_client, bucket):
+    transcribe = FakeTranscribe(clock)
+    job = request("first")
+
+    assert scheduler.submit(transcribe, mock_s3_client, bucket, job, "P1") == "started"
+    assert scheduler.submit(transcribe, mock_s3_client, bucket, job, "P1") == "exists"
+
+
+def test_drain_starts_by_priority_then_docket_turns(
+    clock, mock_s3_client, bucket, monkeypatch
+):
+    monkeypatch.setenv("DOCKET_PRIORITIES", "P3=1")
+    transcribe = FakeTranscribe(clock)
+    for index in range(4):
+        job = request(f"{index:02d}", "P10001-US01")
+        scheduler.enqueue(mock_s3_client, bucket, job, "P10001-US01")
+    for index in range(2):
+        job = request(f"{index:02d}", "P20001-US01")
+        scheduler.enqueue(mock_s3_client, bucket, job, "P20001-US01")
+    scheduler.enqueue(
+        mock_s3_client, bucket, request("00", "P30001-US01"), "P30001-US01"
+    )
+
+    result = scheduler.drain(transcribe, mock_s3_client, bucket, limit=4)
+
+    assert result == {
+        "started": [
+            "audiotojson-P30001-US01-00",
+            "audiotojson-P10001-US01-00",
+            "audiotojson-P20001-US01-00",
+            "audiotojson-P10001-US01-01",
+        ],
+        "pending": 3,
+    }
+    assert len(pending(mock_s3_client, bucket)) == 3
+
+
+def test_drain_drops_jobs_started_before_without_using_capacity(
+    clock, mock_s3_client, bucket, monkeypatch
+):
+    monkeypatch.setenv("STATUS_MANIFEST", "true")
+    transcribe = FakeTranscribe(clock)
+    transcribe.start_transcription_job(**request("00"))
+    for index in range(3):
+        scheduler.enqueue(
+            mock_s3_client, bucket, request(f"{index:02d}"), "P10001-US01"
+        )
+
+    result = scheduler.drain(transcribe, mock_s3_client, bucket, limit=3)
+
+    assert result == {
+        "started": ["audiotojson-P10001-US01-01", "audiotojson-P10001-US01-02"],
+        "pending": 0,
+    }
+    assert pending(mock_s3_client, bucket) == []
+    manifest.compact(mock_s3_client, bucket)
+    records = manifest.read_docket(mock_s3_client, bucket, "P10001-US01")["records"]
+    assert [record["job_name"] for record in records] == result["started"]
+
+
+def test_drain_leaves_queue_while_quota_is_used(clock, mock_s3_client, bucket):
+    transcribe = FakeTranscribe(clock, job_seconds=3600)
+    transcribe.start_transcription_job(**request("running"))
+    scheduler.enqueue(mock_s3_client, bucket, request("waiting"), "P10001-US01")
+
+    result = scheduler.drain(transcribe, mock_s3_client, bucket, limit=1)
+
+    assert result == {"started": [], "pending": 1}
+
+
+def test_batch_finishes_within_quota_and_shares_it(clock, mock_s3_client, bucket):
+    transcribe = FakeTranscribe(clock, max_concurrent=10, max_rate=5, job_seconds=300)
+    dockets = [f"P{number}-US01" for number in range(10001, 10005)]
+    # One docket uploads a large batch just ahead of the others
+    uploads = [(dockets[0], index) for index in range(25)] + [
+        (docket, index) for docket in dockets[1:] for index in range(5)
+    ]
+    for docket, index in uploads:
+        scheduler.submit(
+            transcribe, mock_s3_client, bucket, request(f"{index:02d}", docket), docket
+        )
+
+    while pending(mock_s3_client, bucket):
+        clock.sleep(60)
+        scheduler.drain(transcribe, mock_s3_client, bucket, limit=10)
+
+    assert sorted(transcribe.started) == sorted(
+        request(f"{index:02d}", docket)["TranscriptionJobName"]
+        for docket, index in uploads
+    )
+    assert transcribe.peak_in_flight <= 10
+    # Once queued, the small dockets were not held back behind the large one
+    first_drained = transcribe.started[10:20]
+    assert Counter(name.split("-")[1] for name in first_drained)["P10001"] <= 4
+
+
+def test_limited_record_is_queued_not_failed(
+    clock, mock_s3_client, bucket, upload_bucket, s3_event, monkeypatch
+):
+    transcribe = FakeTranscribe(clock, max_concurrent=0)
+    monkeypatch.setattr(app, "transcribe", transcribe)
+    monkeypatch.setattr(app, "s3_client", mock_s3_client)
+    monkeypatch.setenv("MAX_SPEAKERS", "5")
+    monkeypatch.setenv("DOWNLOAD_BUCKET_NAME", bucket)
+
+    report = app.lambda_handler(
+        s3_event(upload_bucket.base, "Call P12345-US01.m4a"), {}
+    )
+
+    assert report == {"batchItemFailures": []}
+    (key,) = pending(mock_s3_client, bucket)
+    assert key.startswith("pending/05/P12345-US01/")
+
+
+def test_handler_drains_queue(clock, mock_s3_client, bucket, monkeypatch):
+    transcribe = FakeTranscribe(clock)
+    monkeypatch.setattr(scheduler, "transcribe", transcribe)
+    monkeypatch.setattr(scheduler, "s3_client", mock_s3_client)
+    monkeypatch.setenv("DOWNLOAD_BUCKET_NAME", bucket)
+    scheduler.enqueue(mock_s3_client, bucket, request("waiting"), "P10001-US01")
+
+    result = scheduler.lambda_handler({}, {})
+
+    assert result == {"started": ["audiotojson-P10001-US01-waiting"], "pending": 0}
@@ -0,0 +1,353 @@
+from functions.convert import app, merger
+from tools import search as search_tool
+from transcript import ConfidenceStats, Transcript, Turn
+from botocore.exceptions import ClientError
+import search
+import json
+import pytest
+
+
+def make_transcript(*turns):
+    """A transcript of (speaker, start_time, text) turns"""
+    return Transcript(
+        job_name="search",
+        stats=ConfidenceStats(),
+        turns=[
+            Turn(
+                start_time=start_time,
+                end_time=start_time + 1,
+                speaker=speaker,
+                runs=[
+                    (f" {word}", 0.9, start_time, start_time + 1)
+                    for word in text.split()
+                ],
+            )
+            for speaker, start_time, text in turns
+        ],
+    )
+
+
+def make_partitions(dockets, partitions=("",)):
+    """``partitions`` of ``dockets``, a transcript by docket"""
+    merged = {}
+    for docket, transcript in dockets.items():
+        terms = search.postings(transcript.turns)
+        for partition, partition_terms in search.by_partition(
+            terms, partitions
+        ).items():
+            merged.setdefault(partition, {})[docket] = partition_terms
+    return {
+        partition: search.merge(search.empty_partition(), merged.get(partition, {}))
+        for partition in partitions
+    }
+
+
+def split_partitions():
+    """The partitions after the first partition and then "e" are split"""
+    first = search.split_partition("", search.empty_partition())
+    return [partition for partition in first if partition != "e"] + list(
+        search.split_partition("e", search.empty_partition())
+    )
+
+
+def test_tokenizes_words_lower_cased():
+    assert search.tokenize("Don’t call—Docket P12345-US01, ok?") == [
+        "don't",
+        "call",
+        "docket",
+        "p12345",
+        "us01",
+        "ok",
+    ]
+
+
+def test_partitions_terms_by_their_start():
+    partitions = split_partitions()
+
+    assert search.partition_of("refund", [""]) == ""
+    assert search.partition_of("refund", partitions) == "r"
+    assert search.partition_of("escalate", partitions) == "es"
+    assert search.partition_of("e", partitions) == "e_"
+    assert search.partition_of("été", partitions) == "_"
+    assert search.partition_key("") == "index/partitions/-.json"
+    assert search.partition_key("es") == "index/partitions/es.json"
+
+
+def test_postings_are_per_turn_without_stop_words():
+    transcript = make_transcript(
+        ("spk_0", 0.0, "the refund and the refund"), ("spk_1", 4.5, "no refund")
+    )
+
+    terms = search.postings(transcript.turns)
+
+    assert terms == {"refund": [["spk_0", 0.0, 2], ["spk_1", 4.5, 1]]}
+
+
+def test_merge_replaces_only_the_dockets_postings():
+    partition = search.empty_partition()
+    partition = search.merge(partition, {"A": {"refund": [["spk_0", 1.0, 1]]}})
+    partition = search.merge(
+        partition, {"B": {"refund": [["spk_1", 2.0, 1]], "red": []}}
+    )
+    partition = search.merge(partition, {"B": {"receipt": [["spk_1", 3.0, 1]]}})
+
+    assert partition["terms"] == {
+        "refund": {"A": [["spk_0", 1.0, 1]]},
+        "receipt": {"B": [["spk_1", 3.0, 1]]},
+    }
+
+
+def test_ranks_dockets_matching_more_terms_first():
+    partitions = make_partitions(
+        {
+            "ONE": make_transcript(("spk_0", 0.0, "refund refund refund")),
+            "BOTH": make_transcript(("spk_0", 9.0, "policy"), ("spk_1", 2.0, "refund")),
+        }
+    )
+
+    hits = search.search(partitions, "The refund policy")
+
+    assert [hit["docket"] for hit in hits] == ["BOTH", "ONE"]
+    assert [match["start_time"] for match in hits[0]["matches"]] == [2.0, 9.0]
+
+
+def test_prefix_queries_match_every_term_they_start():
+    partitions = make_partitions(
+        {"A": make_transcript(("spk_0", 0.0, "escalate escalated escort"))},
+        split_partitions(),
+    )
+
+    hits = search.search(partitions, "escal*")
+
+    assert {match["term"] for match in hits[0]["matches"]} == {
+        "escalate",
+        "escalated",
+    }
+    assert search.query_partitions("escal*", partitions) == ["es"]
+    assert search.query_partitions("e* refund", partitions) == sorted(
+        ["r"] + [partition for partition in partitions if partition.startswith("e")]
+    )
+
+
+@pytest.fixture
+def index_bucket(mock_s3_client, mock_download_bucket, monkeypatch):
+    monkeypatch.setattr(app, "s3_client", mock_s3_client)
+    monkeypatch.setattr(merger, "s3_client", mock_s3_client)
+    monkeypatch.setenv("COMMON_FILENAME", "Disclosure Call")
+    monkeypatch.setenv("SEARCH_INDEX", "true")
+    monkeypatch.setenv("DOWNLOAD_BUCKET_NAME", mock_download_bucket.base)
+    return mock_download_bucket.base
+
+
+def test_indexes_converted_transcripts_once_merged(
+    index_bucket, mock_s3_client, transcript_data, s3_event, monkeypatch
+):
+    keys = ["transcribed/P12345-US01.json", "transcribed/P12345-US02.json"]
+    for key in keys:
+        mock_s3_client.put_object(
+            Bucket=index_bucket, Key=key, Body=json.dumps(transcript_data)
+        )
+    app.lambda_handler(s3_event(index_bucket, *keys), {})
+
+    assert search_tool.query(index_bucket, "disclosure") == []
+    assert merger.lambda_handler({}, {}) == {"pending": 2, "dockets": 2}
+    assert search.list_pending(mock_s3_client, index_bucket) == []
+
+    read = []
+    read_partition = search.read_partition
+    monkeypatch.setattr(
+        search,
+        "read_partition",
+        lambda *args: read.append(args[2]) or read_partition(*args),
+    )
+    hits = search_tool.query(index_bucket, "disclosure")
+
+    assert read == [""]
+    assert [hit["docket"] for hit in hits] == ["P12345-US01", "P12345-US02"]
+    assert all(match["term"] == "disclosure" for match in hits[0]["matches"])
+
+
+def test_stream_mode_indexes_the_streamed_turns(
+    index_bucket, mock_s3_client, transcript_data, s3_event, monkeypatch
+):
+    monkeypatch.setenv("CONVERT_MODE", "stream")
+    monkeypatch.setattr(app, "get_transcript", fail_to_load)
+    mock_s3_client.put_object(
+        Bucket=index_bucket,
+        Key="transcribed/P12345-US01.json",
+        Body=json.dumps(transcript_data),
+    )
+    event = s3_event(index_bucket, "transcribed/P12345-US01.json")
+    app.lambda_handler(event, {})
+    streamed = search.read_docket(mock_s3_client, index_bucket, "P12345-US01")
+    # Converted already, so only indexed, from the transcript streamed again
+    mock_s3_client.delete_object(
+        Bucket=index_bucket, Key=search.docket_key("P12345-US01")
+    )
+    app.lambda_handler(event, {})
+
+    assert "disclosure" in streamed["terms"]
+    assert search.read_docket(mock_s3_client, index_bucket, "P12345-US01") == streamed
+
+
+def fail_to_load(*args):
+    raise AssertionError("loaded in full")
+
+
+def test_skips_transcripts_already_indexed(
+    index_bucket, mock_s3_client, transcript_data, s3_event, monkeypatch
+):
+    mock_s3_client.put_object(
+        Bucket=index_bucket,
+        Key="transcribed/P12345-US01.json",
+        Body=json.dumps(transcript_data),
+    )
+    event = s3_event(index_bucket, "transcribed/P12345-US01.json")
+    app.lambda_handler(event, {})
+
+    def fail_to_index(*args):
+        raise AssertionError("indexed again")
+
+    monkeypatch.setattr(app, "update_index", fail_to_index)
+    app.lambda_handler({**event, "force": True}, {})
+    app.lambda_handler(event, {})
+
+
+def test_failing_to_index_does_not_fail_the_conversion(
+    index_bucket, mock_s3_client, transcript_data, s3_event, monkeypatch, caplog
+):
+    mock_s3_client.put_object(
+        Bucket=index_bucket,
+        Key="transcribed/P12345-US01.json",
+        Body=json.dumps(transcript_data),
+    )
+    put_object = mock_s3_client.put_object
+
+    def fail_index_puts(**kwargs):
+        if kwargs["Key"].startswith("index/"):
+            raise ClientError({"Error": {"Code": "SlowDown"}}, "PutObject")
+        return put_object(**kwargs)
+
+    monkeypatch.setattr(mock_s3_client, "put_object", fail_index_puts)
+    app.lambda_handler(s3_event(index_bucket, "transcribed/P12345-US01.json"), {})
+
+    mock_s3_client.head_object(
+        Bucket=index_bucket, Key="converted/P12345-US01 Disclosure Call.docx"
+    )
+    assert any("Failed to index" in message for message in caplog.messages)
+
+
+def test_merging_again_removes_old_postings(index_bucket, mock_s3_client):
+    for etag, text in (("etag-1", "alpha beta"), ("etag-2", "gamma")):
+        app.update_index(
+            index_bucket,
+            "transcribed/A.json",
+            "A",
+            etag,
+            search.postings(make_transcript(("spk_0", 0.0, text)).turns),
+        )
+        search.merge_pending(mock_s3_client, index_bucket)
+
+    assert search_tool.query(index_bucket, "alpha beta") == []
+    assert [hit["docket"] for hit in search_tool.query(index_bucket, "gamma")] == ["A"]
+    assert search.read_entry(mock_s3_client, index_bucket, "A") == {
+        "etag": "etag-2",
+        "version": search.SCHEMA_VERSION,
+    }
+
+
+def test_keeps_dockets_indexed_during_a_merge_pending(
+    index_bucket, mock_s3_client, monkeypatch
+):
+    index(index_bucket, "A", "alpha")
+    read_docket = search.read_docket
+
+    def index_during_the_merge(s3_client, bucket, docket):
+        content = read_docket(s3_client, bucket, docket)
+        monkeypatch.setattr(search, "read_docket", read_docket)
+        index(index_bucket, "A", "beta")
+        return content
+
+    monkeypatch.setattr(search, "read_docket", index_during_the_merge)
+    search.merge_pending(mock_s3_client, index_bucket)
+
+    assert len(search.list_pending(mock_s3_client, index_bucket)) == 1
+    search.merge_pending(mock_s3_client, index_bucket)
+    assert search_tool.query(index_bucket, "alpha") == []
+    assert [hit["docket"] for hit in search_tool.query(index_bucket, "beta")] == ["A"]
+
+
+def test_cli_merges_and_prints_time_offsets(index_bucket, capsys):
+    app.update_index(
+        index_bucket,
+        "transcribed/A.json",
+        "A",
+        "etag",
+        search.postings(make_transcript(("spk_0", 75.5, "refund please")).turns),
+    )
+
+    assert search_tool.main(["--bucket", index_bucket, "--merge", "refund"]) == 0
+    assert (
+        capsys.readouterr().out
+        == "A: 1 term(s), 1 mention(s)\n  00:01:15 spk_0 refund\n"
+    )
+
+
+def index(bucket, docket, text):
+    terms = search.postings(make_transcript(("spk_0", 0.0, text)).turns)
+    app.update_index(bucket, f"transcribed/{docket}.json", docket, "etag", terms)
+
+
+def partition_objects(s3_client, bucket):
+    response = s3_client.list_objects_v2(Bucket=bucket, Prefix=search.PARTITIONS_PREFIX)
+    return sorted(entry["Key"] for entry in response.get("Contents", []))
+
+
+def test_splits_a_large_partition_by_the_next_character(
+    index_bucket, mock_s3_client, monkeypatch
+):
+    monkeypatch.setattr(search, "PARTITION_BYTES", 100)
+    index(index_bucket, "A", "alpha beta gamma delta epsilon zeta theta")
+    index(index_bucket, "B", "alpha omega")
+    search.merge_pending(mock_s3_client, index_bucket)
+
+    layout = search.read_layout(mock_s3_client, index_bucket)
+    assert len(layout["partitions"]) == len(search.PARTITION_CHARACTERS)
+    assert layout["split"] == [""]
+    assert [hit["docket"] for hit in search_tool.query(index_bucket, "alpha")] == [
+        "A",
+        "B",
+    ]
+    assert [hit["docket"] for hit in search_tool.query(index_bucket, "om*")] == ["B"]
+
+    # Deleted once no query can be reading it any more
+    search.merge_pending(mock_s3_client, index_bucket)
+    assert search.partition_key("") not in partition_objects(
+        mock_s3_client, index_bucket
+    )
+    assert search.read_layout(mock_s3_client, index_bucket)["split"] == []
+
+
+def test_merges_only_the_partitions_of_new_and_old_terms(
+    index_bucket, mock_s3_client, monkeypatch
+):
+    monkeypatch.setattr(search, "PARTITION_BYTES", 100)
+    index(index_bucket, "A", "alpha beta gamma delta epsilon zeta theta")
+    search.merge_pending(mock_s3_client, index_bucket)
+    search.merge_pending(mock_s3_client, index_bucket)
+    written = []
+    put_object = mock_s3_client.put_object
+
+    def record_puts(**kwargs):
+        written.append(kwargs["Key"])
+        return put_object(**kwargs)
+
+    index(index_bucket, "A", "alpha refund")
+    monkeypatch.setattr(mock_s3_client, "put_object", record_puts)
+    search.merge_pending(mock_s3_client, index_bucket)
+
+    assert sorted(written) == [
+        search.partition_key(partition) for partition in "abdegrtz"
+    ]
+    assert search_tool.query(index_bucket, "beta") == []
+    assert [hit["docket"] for hit in search_tool.query(index_bucket, "refund")] == ["A"]
@@ -0,0 +1,139 @@
+from functions.convert import app
+from transcript import parse_transcript
+from tests.unit.test_turns import as_channels, unlabelled
+import sidecar
+import json
+import pytest
+
+
+ETAG = "0123456789abcdef0123456789abcdef"
+
+
+def assert_same(loaded, parsed):
+    assert loaded.job_name == parsed.job_name
+    assert loaded.turns == parsed.turns
+    assert vars(loaded.stats) == vars(parsed.stats)
+
+
+@pytest.mark.parametrize("label", [lambda data: data, as_channels, unlabelled])
+def test_round_trips_parsed_transcript(transcript_data, label):
+    data = label(transcript_data)
+    parsed = parse_transcript(data)
+
+    buffer = sidecar.dumps(parsed, data["results"]["items"], ETAG)
+
+    assert_same(sidecar.loads(buffer, ETAG), parsed)
+
+
+def test_columns_are_aligned_views(transcript_data):
+    parsed = parse_transcript(transcript_data)
+    buffer = sidecar.dumps(parsed, transcript_data["results"]["items"], ETAG)
+
+    header, base = sidecar.read_header(buffer)
+    columns = sidecar.columns(buffer, header, base)
+
+    words = [
+        item
+        for item in transcript_data["results"]["items"]
+        if item["type"] == "pronunciation"
+    ]
+    assert base % sidecar.ALIGNMENT == 0
+    assert columns["word_ends"].tolist() == [float(w["end_time"]) for w in words]
+    assert not columns["word_starts"].flags.owndata
+    assert len(header["speakers"]) == len({turn.speaker for turn in parsed.turns})
+
+
+def test_loads_through_memory_map(transcript_data, tmp_path):
+    parsed = parse_transcript(transcript_data)
+    path = tmp_path / "transcript.turns.bin"
+    path.write_bytes(sidecar.dumps(parsed, transcript_data["results"]["items"], ETAG))
+
+    assert_same(sidecar.load(path, ETAG), parsed)
+
+
+def test_rejects_stale_sidecar(transcript_data, monkeypatch):
+    parsed = parse_transcript(transcript_data)
+    buffer = sidecar.dumps(parsed, transcript_data["results"]["items"], ETAG)
+
+    assert sidecar.loads(buffer, "fedcba9876543210fedcba9876543210") is None
+    monkeypatch.setattr(sidecar, "SCHEMA_VERSION", sidecar.SCHEMA_VERSION + 1)
+    assert sidecar.loads(buffer, ETAG) is None
+
+
+def test_raises_for_other_files(transcript_data):
+    with pytest.raises(Exception, match="Not a transcript sidecar"):
+        sidecar.loads(json.dumps(transcript_data).encode())
+
+
+def test_sidecar_key():
+    assert sidecar.sidecar_key("transcribed/P12345-US01.json") == (
+        "transcribed/P12345-US01.turns.bin"
+    )
+
+
+@pytest.fixture
+def transcribed_bucket(
+    mock_s3_client, mock_download_bucket, transcript_data, monkeypatch
+):
+    monkeypatch.setattr(app, "s3_client", mock_s3_client)
+    monkeypatch.setenv("COMMON_FILENAME", "Disclosure Call")
+    mock_s3_client.put_object(
+        Bucket=mock_download_bucket.base,
+        Key="transcribed/P12345-US01.json",
+        Body=json.dumps(transcript_data),
+    )
+    return mock_download_bucket.base
+
+
+def counting(monkeypatch, name):
+    calls = []
+    function = getattr(app, name)
+    monkeypatch.setattr(app, name, lambda *args: calls.append(args) or function(*args))
+    return calls
+
+
+def test_later_conversions_load_the_sidecar(
+    transcribed_bucket, mock_s3_client, s3_event, monkeypatch
+):
+    event = s3_event(transcribed_bucket, "transcribed/P12345-US01.json")
+    app.lambda_handler(event, {})
+    head = mock_s3_client.head_object(
+        Bucket=transcribed_bucket, Key="transcribed/P12345-US01.turns.bin"
+    )
+    assert head["Metadata"]["source-etag"] == ETAG
+
+    reads = counting(monkeypatch, "read_transcript")
+    event["force"] = True
+    assert app.lambda_handler(event, {}) == {"batchItemFailures": []}
+    assert reads == []
+
+
+def test_new_transcript_replaces_stale_sidecar(
+    transcribed_bucket, mock_s3_client, s3_event, monkeypatch
+):
+    event = s3_event(transcribed_bucket, "transcribed/P12345-US01.json")
+    app.lambda_handler(event, {})
+
+    reads = counting(monkeypatch, "read_transcript")
+    event["Records"][0]["s3"]["object"]["eTag"] = "fedcba9876543210fedcba9876543210"
+    app.lambda_handler(event, {})
+
+    assert len(reads) == 1
+    body = mock_s3_client.get_object(
+        Bucket=transcribed_bucket, Key="transcribed/P12345-US01.turns.bin"
+    )["Body"].read()
+    assert sidecar.read_header(body)[0]["etag"] == "fedcba9876543210fedcba9876543210"
+
+
+def test_sidecar_can_be_turned_off(
+    transcribed_bucket, mock_s3_client, s3_event, monkeypatch
+):
+    monkeypatch.setenv("TRANSCRIPT_SIDECAR", "false")
+    app.lambda_handler(s3_event(transcribed_bucket, "transcribed/P12345-US01.json"), {})
+
+    listing = mock_s3_client.list_objects_v2(
+        Bucket=transcribed_bucket, Prefix="transcribed/"
+    )
+    assert [obj["Key"] for obj in listing["Contents"]] == [
+        "transcribed/P12345-US01.json"
+    ]
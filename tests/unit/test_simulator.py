@@ -0,0 +1,47 @@
+from functions.transcribe import app
+from tools import simulator
+import pytest
+
+
+@pytest.fixture(scope="module")
+def report():
+    return simulator.Simulator(uploads=6, words=200, max_concurrent_jobs=2).run()
+
+
+def simulated(report):
+    return {
+        "simulated_seconds": report["simulated_seconds"],
+        "transcribe": report["transcribe"],
+    }
+
+
+def test_routes_follow_template():
+    functions = simulator.load_functions()
+
+    assert functions["ConvertToDocx"]["module"] == "functions.convert.app"
+    assert functions["ConvertToDocx"]["events"][0]["rules"] == {
+        "prefix": "transcribed/",
+        "suffix": ".json",
+    }
+    assert functions["StitchTranscripts"]["module"] == "functions.transcribe.stitcher"
+    assert functions["RunTranscriptionJob"]["events"][0]["bucket"] == "UploadBucket"
+
+
+def test_every_upload_is_converted(report):
+    assert report["converted"] == 6
+    assert report["transcribe"]["jobs"] == 6
+    assert report["transcribe"]["peak_in_flight"] == 2
+    assert report["functions"]["RunTranscriptionJob"]["Duration"]["count"] == 6
+    assert report["functions"]["ConvertToDocx"]["RenderDuration"]["count"] == 6
+    # Uploads beyond the quota waited for SubmitPendingJobs
+    assert report["transcribe"]["wait_seconds"]["max"] >= 120
+    assert "SubmitPendingJobs" in report["functions"]
+
+
+def test_simulated_times_are_deterministic(report):
+    again = simulator.Simulator(uploads=6, words=200, max_concurrent_jobs=2).run()
+    assert simulated(again) == simulated(report)
+
+
+def test_clients_are_restored_after_run(report):
+    assert not hasattr(app.transcribe, "clock")
@@ -0,0 +1,299 @@
+from functions.transcribe import stitcher
+import chunking
+import transcript
+import copy
+import json
+import pytest
+from decimal import Decimal
+from benchmarks.synthetic import make_transcript
+
+
+def plan(data, cuts, overlap=10):
+    duration = float(data["results"]["items"][-2]["end_time"]) + 1
+    return {
+        "job_name": "audiotojson-P12345-US01-0123456789ab",
+        "output_key": "transcribed/P12345-US01.json",
+        "chunks": [
+            dict(chunk, transcript_key=f"chunks/job/{chunk['index']:03d}.json")
+            for chunk in chunking.plan_chunks([0.0, *cuts, duration], overlap)
+        ],
+    }
+
+
+def slice_transcript(data, chunk, labels):
+    """What Transcribe would make of one chunk, ``labels`` renames speakers"""
+    offset = Decimal(str(chunk["start"]))
+
+    def local(value):
+        return str((Decimal(value) - offset).quantize(Decimal("0.001")))
+
+    def heard(item):
+        return chunk["start"] <= float(item["start_time"]) < chunk["end"]
+
+    items = []
+    keep = False
+    for item in data["results"]["items"]:
+        if item["type"] == "pronunciation":
+            keep = heard(item)
+            if keep:
+                item = dict(
+                    item,
+                    start_time=local(item["start_time"]),
+                    end_time=local(item["end_time"]),
+                )
+        if keep:
+            items.append(item)
+
+    segments = []
+    for segment in data["results"]["speaker_labels"]["segments"]:
+        segment_items = [
+            dict(
+                item,
+                start_time=local(item["start_time"]),
+                end_time=local(item["end_time"]),
+                speaker_label=labels[item["speaker_label"]],
+            )
+            for item in segment["items"]
+            if heard(item)
+        ]
+        if segment_items:
+            segments.append(
+                {
+                    "start_time": segment_items[0]["start_time"],
+                    "speaker_label": labels[segment["speaker_label"]],
+                    "end_time": segment_items[-1]["end_time"],
+                    "items": segment_items,
+                }
+            )
+    return {
+        "jobName": "chunk",
+        "results": {
+            "transcripts": [{"transcript": ""}],
+            "speaker_labels": {"speakers": len(labels), "segments": segments},
+            "items": items,
+        },
+        "status": "COMPLETED",
+    }
+
+
+# Every chunk numbers the speakers its own way
+RELABELLINGS = [
+    {"spk_0": "spk_0", "spk_1": "spk_1", "spk_2": "spk_2"},
+    {"spk_0": "spk_2", "spk_1": "spk_0", "spk_2": "spk_1"},
+    {"spk_0": "spk_1", "spk_1": "spk_2", "spk_2": "spk_0"},
+]
+
+
+@pytest.fixture
+def recording():
+    # Every speaker talks in both overlaps, so every label can be matched
+    data = make_transcript(words=900, speakers=3, seed=2)
+    manifest = plan(data, [120.0, 240.0], overlap=20)
+    chunks = [
+        slice_transcript(data, chunk, labels)
+        for chunk, labels in zip(manifest["chunks"], RELABELLINGS)
+    ]
+    return data, manifest, chunks
+
+
+def word_speakers(data):
+    labels = {}
+    for segment in data["results"]["speaker_labels"]["segments"]:
+        for item in segment["items"]:
+            labels[item["start_time"]] = item["speaker_label"]
+    return [
+        (
+            item["start_time"],
+            item["alternatives"][0]["content"],
+            labels[item["start_time"]],
+        )
+        for item in data["results"]["items"]
+        if item["type"] == "pronunciation"
+    ]
+
+
+def test_stitches_chunks_back_into_the_recording(recording):
+    data, manifest, chunks = recording
+    stitched = stitcher.stitch_transcripts(manifest, chunks)
+
+    assert stitched["jobName"] == manifest["job_name"]
+    assert stitched["results"]["items"] == data["results"]["items"]
+    assert word_speakers(stitched) == word_speakers(data)
+    assert stitched["results"]["speaker_labels"]["speakers"] == 3
+
+
+def test_drops_overlap_word_placed_across_the_cut(recording):
+    data, manifest, chunks = recording
+    cut = manifest["chunks"][1]["keep_from"]
+    second = chunks[1]
+    offset = manifest["chunks"][1]["start"]
+    # The last word the first chunk keeps, heard just after the cut instead
+    word = max(
+        (
+            item
+            for item in second["results"]["items"]
+            if item["type"] == "pronunciation"
+            and float(item["start_time"]) + offset < cut
+        ),
+        key=lambda item: float(item["start_time"]),
+    )
+    late = f"{cut - offset + 0.01:.3f}"
+    timing = (word["start_time"], word["end_time"])
+    for item in [word] + [
+        item
+        for segment in second["results"]["speaker_labels"]["segments"]
+        for item in segment["items"]
+        if (item["start_time"], item["end_time"]) == timing
+    ]:
+        item["start_time"] = late
+
+    stitched = stitcher.stitch_transcripts(manifest, chunks)
+
+    assert word_speakers(stitched) == word_speakers(data)
+
+
+def test_unmatched_speaker_keeps_a_distinct_label():
+    previous = [
+        {"start": 1.0, "content": "yes", "speaker": "spk_0", "kept": True},
+        {"start": 2.0, "content": "no", "speaker": "spk_1", "kept": True},
+    ]
+    words = [
+        {"start": 1.05, "content": "yes", "speaker": "spk_1"},
+        {"start": 2.1, "content": "no", "speaker": "spk_0"},
+        {"start": 30.0, "content": "hello", "speaker": "spk_2"},
+        {"start": 31.0, "content": "hi", "speaker": "spk_3"},
+    ]
+
+    mapping = stitcher.match_speakers(previous, words)
+
+    assert mapping["spk_1"] == "spk_0"
+    assert mapping["spk_0"] == "spk_1"
+    assert mapping["spk_2"] == "spk_2"
+    assert mapping["spk_3"] == "spk_3"
+
+
+def spoken_chunk(chunk, words):
+    """A chunk transcript of the (start, content, label) ``words`` it heard"""
+    offset = Decimal(str(chunk["start"]))
+    items = []
+    segments = []
+    for start, content, label in words:
+        if not chunk["start"] <= start < chunk["end"]:
+            continue
+        local = (Decimal(str(start)) - offset).quantize(Decimal("0.001"))
+        item = {
+            "start_time": str(local),
+            "end_time": str(local + Decimal("0.5")),
+            "alternatives": [{"confidence": "0.9", "content": content}],
+            "type": "pronunciation",
+        }
+        items.append(item)
+        segments.append(
+            {
+                "start_time": item["start_time"],
+                "speaker_label": label,
+                "end_time": item["end_time"],
+                "items": [dict(item, speaker_label=label)],
+            }
+        )
+    return {
+        "jobName": "chunk",
+        "results": {
+            "transcripts": [{"transcript": ""}],
+            "speaker_labels": {"speakers": 2, "segments": segments},
+            "items": items,
+        },
+        "status": "COMPLETED",
+    }
+
+
+def test_new_speaker_does_not_take_the_label_of_an_earlier_one():
+    manifest = {
+        "job_name": "job",
+        "output_key": "transcribed/P12345-US01.json",
+        "chunks": chunking.plan_chunks([0.0, 100.0, 200.0, 300.0], 10),
+    }
+    # Alice and Bob, then only Alice in the last overlap, then Carol. Every
+    # chunk labels its speakers in the order they are first heard
+    said = [
+        (10.0, "alpha", "alice"),
+        (50.0, "bravo", "bob"),
+        (95.0, "bingo", "bob"),
+        (105.0, "apple", "alice"),
+        (150.0, "avocado", "alice"),
+        (195.0, "almond", "alice"),
+        (205.0, "apricot", "alice"),
+        (250.0, "cherry", "carol"),
+    ]
+    chunks = []
+    for chunk in manifest["chunks"]:
+        heard = [word for word in said if chunk["start"] <= word[0] < chunk["end"]]
+        labels = {}
+        for _, _, person in heard:
+            labels.setdefault(person, f"spk_{len(labels)}")
+        chunks.append(
+            spoken_chunk(chunk, [(start, word, labels[p]) for start, word, p in heard])
+        )
+
+    stitched = stitcher.stitch_transcripts(manifest, chunks)
+
+    speakers = {content: label for _, content, label in word_speakers(stitched)}
+    assert [content for _, content, _ in word_speakers(stitched)] == [
+        content for _, content, _ in said
+    ]
+    assert speakers["apple"] == speakers["alpha"] == speakers["almond"]
+    assert speakers["bingo"] == speakers["bravo"]
+    assert speakers["cherry"] not in (speakers["alpha"], speakers["bravo"])
+    assert stitched["results"]["speaker_labels"]["speakers"] == 3
+
+
+def test_raises_for_incomplete_chunk(recording):
+    _, manifest, chunks = recording
+    chunks[2]["status"] = "FAILED"
+    with pytest.raises(Exception, match="Chunk 2 is not shown as completed"):
+        stitcher.stitch_transcripts(manifest, chunks)
+
+
+def test_waits_for_every_chunk_then_writes_transcript(
+    recording, mock_s3_client, mock_download_bucket, monkeypatch
+):
+    monkeypatch.setattr(stitcher, "s3_client", mock_s3_client)
+    data, manifest, chunks = recording
+    bucket = mock_download_bucket.base
+
+    def put(key, body):
+        mock_s3_client.put_object(Bucket=bucket, Key=key, Body=json.dumps(body))
+
+    def event(key):
+        return {
+            "Records": [{"s3": {"bucket": {"name": bucket}, "object": {"key": key}}}]
+        }
+
+    put("chunks/job/manifest.json", manifest)
+    for chunk, body in zip(manifest["chunks"][:2], chunks):
+        put(chunk["transcript_key"], body)
+        assert stitcher.lambda_handler(event(chunk["transcript_key"]), {}) == {
+            "stitched": []
+        }
+
+    last = manifest["chunks"][2]["transcript_key"]
+    put(last, chunks[2])
+    assert stitcher.lambda_handler(event(last), {}) == {
+        "stitched": ["transcribed/P12345-US01.json"]
+    }
+
+    response = mock_s3_client.get_object(
+        Bucket=bucket, Key="transcribed/P12345-US01.json"
+    )
+    stitched = json.loads(response["Body"].read())
+    assert stitched == stitcher.stitch_transcripts(manifest, copy.deepcopy(chunks))
+    # ConvertToDocx reads the same speakers and words as without splitting
+    assert spoken(stitched) == spoken(data)
+
+
+def spoken(data):
+    return [
+        (turn.speaker, run)
+        for turn in transcript.decode_turns(data)
+        for run in turn.runs
+    ]
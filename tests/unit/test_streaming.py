@@ -0,0 +1,136 @@
+from functions.convert import app
+from benchmarks.synthetic import make_transcript
+from docx import Document
+from docx.shared import RGBColor
+from docx_renderer import write_docx
+from pathlib import Path
+from streaming import write_docx_stream
+import json
+import subprocess
+import sys
+import pytest
+
+
+MB = 1024 * 1024
+ROOT = Path(__file__).parent.parent.parent
+# Words in a ten hour call at 150 words a minute
+TEN_HOURS = 90_000
+# ru_maxrss survives exec, so read the high-water mark of the new image
+PEAK_RSS_PROBE = """
+import re, sys
+import functions
+from streaming import write_docx_stream
+source, target = sys.argv[1:]
+write_docx_stream(lambda: open(source, "rb"), target)
+with open("/proc/self/status") as status:
+    print(int(re.search(r"VmHWM:\\s+(\\d+) kB", status.read()).group(1)) * 1024)
+"""
+
+
+def transcript_rows(docx_path):
+    table = Document(str(docx_path)).tables[-1]
+    return [tuple(cell.text for cell in row.cells) for row in table.rows]
+
+
+def test_streamed_docx_matches_native(transcript_data, transcript_file, tmp_path):
+    native_path = tmp_path / "native.docx"
+    streamed_path = tmp_path / "streamed.docx"
+    write_docx(transcript_data, native_path)
+    write_docx_stream(lambda: transcript_file.open("rb"), streamed_path)
+
+    assert transcript_rows(streamed_path) == transcript_rows(native_path)
+    native, streamed = Document(str(native_path)), Document(str(streamed_path))
+    assert [p.text for p in streamed.paragraphs[:2]] == [
+        p.text for p in native.paragraphs[:2]
+    ]
+    assert transcript_rows(streamed_path)[0] == ("Time", "Speaker", "Content")
+
+
+def test_streamed_docx_greys_out_low_confidence_words(transcript_data, tmp_path):
+    transcript_data["results"]["items"][0]["alternatives"][0]["confidence"] = "0.5"
+    source = tmp_path / "transcript.json"
+    source.write_text(json.dumps(transcript_data))
+    target = tmp_path / "streamed.docx"
+    write_docx_stream(lambda: source.open("rb"), target)
+
+    runs = Document(str(target)).tables[-1].rows[1].cells[2].paragraphs[0].runs
+    assert runs[0].font.color.rgb == RGBColor(204, 204, 204)
+    assert runs[0].text.startswith(" ")
+
+
+def test_reads_the_transcript_three_times(transcript_file, tmp_path):
+    opened = []
+
+    def open_stream():
+        opened.append(True)
+        return transcript_file.open("rb")
+
+    write_docx_stream(open_stream, tmp_path / "streamed.docx")
+
+    assert len(opened) == 3
+
+
+def test_streaming_requires_speaker_labels(transcript_data, tmp_path):
+    del transcript_data["results"]["speaker_labels"]
+    source = tmp_path / "transcript.json"
+    source.write_text(json.dumps(transcript_data))
+    with pytest.raises(Exception) as err:
+        write_docx_stream(lambda: source.open("rb"), tmp_path / "streamed.docx")
+    assert "speaker labels" in str(err.value)
+
+
+def test_streaming_rejects_incomplete_transcript(transcript_data, tmp_path):
+    transcript_data["status"] = "FAILED"
+    source = tmp_path / "transcript.json"
+    source.write_text(json.dumps(transcript_data))
+    with pytest.raises(Exception) as err:
+        write_docx_stream(lambda: source.open("rb"), tmp_path / "streamed.docx")
+    assert "not shown as completed" in str(err.value)
+
+
+def peak_rss(source, target):
+    # A fresh interpreter so the high-water mark belongs to this conversion
+    output = subprocess.run(
+        [sys.executable, "-c", PEAK_RSS_PROBE, str(source), str(target)],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return int(output.strip().splitlines()[-1])
+
+
+@pytest.mark.skipif(not Path("/proc/self/status").exists(), reason="needs Linux procfs")
+def test_ten_hour_transcript_streams_within_memory_budget(tmp_path):
+    short = tmp_path / "one-hour.json"
+    short.write_text(json.dumps(make_transcript(words=TEN_HOURS // 10, speakers=4)))
+    long = tmp_path / "ten-hours.json"
+    long.write_text(json.dumps(make_transcript(words=TEN_HOURS, speakers=4)))
+
+    short_peak = peak_rss(short, tmp_path / "one-hour.docx")
+    long_peak = peak_rss(long, tmp_path / "ten-hours.docx")
+
+    assert long_peak < 64 * MB
+    # Ten times the transcript, roughly the same memory
+    assert long_peak - short_peak < 8 * MB
+    assert len(transcript_rows(tmp_path / "ten-hours.docx")) > 1000
+
+
+def test_stream_mode_converts_between_buckets(
+    mock_s3_client, mock_download_bucket, transcript_data, s3_event, monkeypatch
+):
+    monkeypatch.setattr(app, "s3_client", mock_s3_client)
+    monkeypatch.setenv("COMMON_FILENAME", "Disclosure Call")
+    monkeypatch.setenv("CONVERT_MODE", "stream")
+    bucket = mock_download_bucket.base
+    mock_s3_client.put_object(
+        Bucket=bucket,
+        Key="transcribed/P12345-US01.json",
+        Body=json.dumps(transcript_data),
+    )
+    app.lambda_handler(s3_event(bucket, "transcribed/P12345-US01.json"), {})
+
+    head = mock_s3_client.head_object(
+        Bucket=bucket, Key="converted/P12345-US01 Disclosure Call.docx"
+    )
+    assert head["ContentLength"] > 0
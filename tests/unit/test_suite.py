@@ -0,0 +1,37 @@
+from benchmarks import suite
+
+
+BASELINE = {
+    "make_docx_file[1000]": {"seconds": 0.2, "peak_mb": 6.0},
+    "make_docx_file[50000]": {"seconds": 10.0, "peak_mb": 60.0},
+}
+
+
+def test_within_threshold_passes():
+    results = {
+        "make_docx_file[1000]": {"seconds": 0.24, "peak_mb": 7.5},
+        "make_docx_file[50000]": {"seconds": 9.0, "peak_mb": 70.0},
+        "new case": {"seconds": 100.0, "peak_mb": 100.0},
+    }
+    assert suite.compare(results, BASELINE, threshold=0.25) == []
+
+
+def test_regressions_fail():
+    results = {
+        "make_docx_file[1000]": {"seconds": 0.3, "peak_mb": 9.0},
+        "make_docx_file[50000]": {"seconds": 10.0, "peak_mb": 80.0},
+    }
+    assert suite.compare(results, BASELINE, threshold=0.25) == [
+        ("make_docx_file[1000]", "seconds", 0.2, 0.3),
+        ("make_docx_file[1000]", "peak_mb", 6.0, 9.0),
+        ("make_docx_file[50000]", "peak_mb", 60.0, 80.0),
+    ]
+
+
+def test_filenames_are_fixed_and_mostly_dockets():
+    from functions.transcribe import app
+
+    names = suite.make_filenames(1000)
+    assert names == suite.make_filenames(1000)
+    dockets = [app.get_docket(name) for name in names]
+    assert 0.85 < sum(not d.startswith("Transcription") for d in dockets) / 1000 < 0.95
@@ -0,0 +1,68 @@
+from benchmarks.synthetic import make_transcript
+import statistics
+import pytest
+
+
+def pronunciations(data):
+    return [
+        item for item in data["results"]["items"] if item["type"] == "pronunciation"
+    ]
+
+
+def last_end(data):
+    return float(pronunciations(data)[-1]["end_time"])
+
+
+def test_same_seed_makes_same_transcript():
+    assert make_transcript(words=500, seed=7) == make_transcript(words=500, seed=7)
+    assert make_transcript(words=500, seed=7) != make_transcript(words=500, seed=8)
+
+
+def test_word_count_and_speakers():
+    data = make_transcript(words=800, speakers=4)
+    labels = {
+        segment["speaker_label"]
+        for segment in data["results"]["speaker_labels"]["segments"]
+    }
+    assert len(pronunciations(data)) == 800
+    assert labels == {"spk_0", "spk_1", "spk_2", "spk_3"}
+
+
+def test_duration_sets_length():
+    data = make_transcript(duration=1800)
+    assert 1800 <= last_end(data) < 1801
+
+
+@pytest.mark.parametrize("words_per_minute", [60, 115, 200])
+def test_words_per_minute(words_per_minute):
+    data = make_transcript(duration=3600, words_per_minute=words_per_minute)
+    pace = len(pronunciations(data)) / (last_end(data) / 60)
+    assert pace == pytest.approx(words_per_minute, rel=0.1)
+
+
+def test_punctuation_density():
+    def commas(data):
+        return sum(
+            item["alternatives"][0]["content"] == ","
+            for item in data["results"]["items"]
+        )
+
+    assert commas(make_transcript(words=5000, punctuation=0)) == 0
+    assert commas(make_transcript(words=5000, punctuation=0.5)) == pytest.approx(
+        2500, rel=0.1
+    )
+
+
+def test_confidence_distribution():
+    def confidences(data):
+        return [
+            float(item["alternatives"][0]["confidence"])
+            for item in pronunciations(data)
+        ]
+
+    high = confidences(make_transcript(words=5000))
+    low = confidences(make_transcript(words=5000, confidence=(2, 2)))
+    fixed = confidences(make_transcript(words=100, confidence=lambda rng: 0.5))
+    assert statistics.mean(high) == pytest.approx(8 / 9, abs=0.01)
+    assert statistics.mean(low) == pytest.approx(0.5, abs=0.02)
+    assert set(fixed) == {0.5}
@@ -1,5 +1,11 @@
-from functions.transcribe import app
+from functions.transcribe import app, sweeper
+import chunking
+import boto3
+import gzip
+import json
+import os
 import pytest
+from benchmarks.synthetic import make_speech_wav
 
 
 @pytest.mark.parametrize("event", ["audio_uploaded"], indirect=True)
@@ -39,3 +45,318 @@ def test_raises_without_max_speakers_env():
     with pytest.raises(Exception) as err:
         app.lambda_handler({}, {})
     assert "MAX_SPEAKERS" in str(err.value)
+
+
+@pytest.fixture
+def mock_transcribe(
+    mock_s3_client, mock_upload_bucket, mock_download_bucket, monkeypatch
+):
+    client = boto3.client("transcribe", region_name="us-east-1")
+    monkeypatch.setattr(app, "transcribe", client)
+    monkeypatch.setattr(app, "s3_client", mock_s3_client)
+    monkeypatch.setenv("MAX_SPEAKERS", "5")
+    monkeypatch.setenv("DOWNLOAD_BUCKET_NAME", mock_download_bucket.base)
+    return client
+
+
+def complete_job(client, name):
+    # moto moves a job along one status per describe
+    while True:
+        job = client.get_transcription_job(TranscriptionJobName=name)
+        if job["TranscriptionJob"]["TranscriptionJobStatus"] == "COMPLETED":
+            return job["TranscriptionJob"]
+
+
+def test_submits_a_job_for_every_record(mock_transcribe, upload_bucket, s3_event):
+    report = app.lambda_handler(
+        s3_event(upload_bucket.base, "Call P12345-US01.m4a", "Call P12345-US02.mp3"),
+        {},
+    )
+
+    assert report == {"batchItemFailures": []}
+    jobs = mock_transcribe.list_transcription_jobs()["TranscriptionJobSummaries"]
+    names = sorted(job["TranscriptionJobName"] for job in jobs)
+    assert names[0].startswith("audiotojson-P12345-US01-")
+    assert names[1].startswith("audiotojson-P12345-US02-")
+
+
+def test_raises_when_any_record_fails(mock_transcribe, upload_bucket, s3_event):
+    with pytest.raises(Exception) as err:
+        app.lambda_handler(
+            s3_event(upload_bucket.base, "Call P12345-US01.m4a", "no suffix"), {}
+        )
+
+    assert str(err.value) == "Failed to process 1 of 2 record(s): no suffix"
+    assert (
+        len(mock_transcribe.list_transcription_jobs()["TranscriptionJobSummaries"]) == 1
+    )
+
+
+def test_job_output_stays_docket_based(mock_transcribe, upload_bucket, s3_event):
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US01.m4a"), {})
+
+    name = mock_transcribe.list_transcription_jobs()["TranscriptionJobSummaries"][0][
+        "TranscriptionJobName"
+    ]
+    job = complete_job(mock_transcribe, name)
+    uri = job["Transcript"]["TranscriptFileUri"]
+    assert uri.endswith("transcribed/P12345-US01.json")
+
+
+def test_reuploads_get_their_own_job(s3_event):
+    first = s3_event("bucket", "Call P12345-US01.m4a")["Records"][0]
+    second = dict(first, s3={**first["s3"], "object": {**first["s3"]["object"]}})
+    second["s3"]["object"]["sequencer"] = "0A1B2C3D4E5F6789FF"
+
+    assert app.make_job_name("P12345-US01", first) != app.make_job_name(
+        "P12345-US01", second
+    )
+    # Retries of one event map to the one job
+    assert app.make_job_name("P12345-US01", first) == app.make_job_name(
+        "P12345-US01", first
+    )
+
+
+def test_retried_event_does_not_fail_on_existing_job(
+    mock_transcribe, upload_bucket, s3_event
+):
+    event = s3_event(upload_bucket.base, "Call P12345-US01.m4a")
+    app.lambda_handler(event, {})
+    report = app.lambda_handler(event, {})
+
+    assert report == {"batchItemFailures": []}
+    jobs = mock_transcribe.list_transcription_jobs()["TranscriptionJobSummaries"]
+    assert len(jobs) == 1
+
+
+def test_sweeper_deletes_only_old_finished_jobs(
+    mock_transcribe, upload_bucket, s3_event, monkeypatch
+):
+    monkeypatch.setattr(sweeper, "transcribe", mock_transcribe)
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US01.m4a"), {})
+    name = mock_transcribe.list_transcription_jobs()["TranscriptionJobSummaries"][0][
+        "TranscriptionJobName"
+    ]
+    complete_job(mock_transcribe, name)
+
+    monkeypatch.setenv("SWEEP_AFTER_DAYS", "5")
+    assert sweeper.lambda_handler({}, {}) == {"deleted": []}
+
+    monkeypatch.setenv("SWEEP_AFTER_DAYS", "-1")
+    assert sweeper.lambda_handler({}, {}) == {"deleted": [name]}
+
+
+def job_names(client):
+    jobs = client.list_transcription_jobs()["TranscriptionJobSummaries"]
+    return [job["TranscriptionJobName"] for job in jobs]
+
+
+def finished_transcript(job_name):
+    """What Transcribe writes, starting with the job's name"""
+    return json.dumps({"jobName": job_name, "results": {}}).encode()
+
+
+def test_records_transcribed_audio_in_dedupe_index(
+    mock_transcribe, mock_s3_client, download_bucket, upload_bucket, s3_event
+):
+    event = s3_event(upload_bucket.base, "Call P12345-US01.m4a")
+    app.lambda_handler(event, {})
+
+    etag = event["Records"][0]["s3"]["object"]["eTag"]
+    entry = mock_s3_client.get_object(
+        Bucket=download_bucket.base, Key=f"dedupe/{etag}.json"
+    )
+    assert json.loads(entry["Body"].read())["transcript_key"] == (
+        "transcribed/P12345-US01.json"
+    )
+
+
+def test_reuses_transcript_of_identical_audio(
+    mock_transcribe, mock_s3_client, download_bucket, upload_bucket, s3_event
+):
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US01.m4a"), {})
+    # Transcribe finished the first job
+    transcript = finished_transcript(job_names(mock_transcribe)[0])
+    mock_s3_client.put_object(
+        Bucket=download_bucket.base,
+        Key="transcribed/P12345-US01.json",
+        Body=transcript,
+    )
+
+    # Same audio (same ETag) uploaded again under another docket
+    report = app.lambda_handler(
+        s3_event(upload_bucket.base, "Call P12345-US02.m4a"), {}
+    )
+
+    assert report == {"batchItemFailures": []}
+    assert len(job_names(mock_transcribe)) == 1
+    copied = mock_s3_client.get_object(
+        Bucket=download_bucket.base, Key="transcribed/P12345-US02.json"
+    )
+    assert copied["Body"].read() == transcript
+
+
+def test_does_not_reuse_a_transcript_overwritten_by_other_audio(
+    mock_transcribe, mock_s3_client, download_bucket, upload_bucket, s3_event
+):
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US01.m4a"), {})
+    # A later upload of the docket, of other audio, wrote its transcript
+    mock_s3_client.put_object(
+        Bucket=download_bucket.base,
+        Key="transcribed/P12345-US01.json",
+        Body=finished_transcript("audiotojson-P12345-US01-otheraudio00"),
+    )
+
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US02.m4a"), {})
+
+    assert len(job_names(mock_transcribe)) == 2
+    listing = mock_s3_client.list_objects_v2(
+        Bucket=download_bucket.base, Prefix="transcribed/P12345-US02"
+    )
+    assert listing["KeyCount"] == 0
+
+
+def test_reupload_of_same_docket_rewrites_transcript_in_place(
+    mock_transcribe, mock_s3_client, download_bucket, upload_bucket, s3_event
+):
+    event = s3_event(upload_bucket.base, "Call P12345-US01.m4a")
+    app.lambda_handler(event, {})
+    mock_s3_client.put_object(
+        Bucket=download_bucket.base,
+        Key="transcribed/P12345-US01.json",
+        Body=finished_transcript(job_names(mock_transcribe)[0]),
+    )
+    event["Records"][0]["s3"]["object"]["sequencer"] = "0A1B2C3D4E5F6789FF"
+    app.lambda_handler(event, {})
+
+    assert len(job_names(mock_transcribe)) == 1
+    head = mock_s3_client.head_object(
+        Bucket=download_bucket.base, Key="transcribed/P12345-US01.json"
+    )
+    assert head["Metadata"]["dedupe-source"] == "transcribed/P12345-US01.json"
+
+
+def test_transcribes_again_while_first_transcript_is_missing(
+    mock_transcribe, upload_bucket, s3_event
+):
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US01.m4a"), {})
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US02.m4a"), {})
+
+    assert len(job_names(mock_transcribe)) == 2
+
+
+def test_dedupe_can_be_turned_off(
+    mock_transcribe,
+    mock_s3_client,
+    download_bucket,
+    upload_bucket,
+    s3_event,
+    monkeypatch,
+):
+    monkeypatch.setenv("DEDUPE_TRANSCRIPTS", "false")
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US01.m4a"), {})
+
+    listing = mock_s3_client.list_objects_v2(
+        Bucket=download_bucket.base, Prefix="dedupe/"
+    )
+    assert listing["KeyCount"] == 0
+
+
+@pytest.fixture
+def long_wav(mock_s3_client, upload_bucket, tmp_path, monkeypatch):
+    monkeypatch.setenv("SPLIT_AUDIO", "true")
+    monkeypatch.setenv("SPLIT_MIN_SECONDS", "200")
+    monkeypatch.setattr(chunking, "CHUNK_SECONDS", 120)
+    monkeypatch.setattr(chunking, "SEARCH_SECONDS", 20)
+
+    def upload(key, seconds):
+        path = tmp_path / "call.wav"
+        make_speech_wav(path, seconds=seconds)
+        mock_s3_client.upload_file(str(path), upload_bucket.base, key)
+
+    return upload
+
+
+def test_splits_long_wav_into_chunk_jobs(
+    mock_transcribe, mock_s3_client, download_bucket, upload_bucket, s3_event, long_wav
+):
+    long_wav("Call P12345-US01.wav", seconds=400)
+    report = app.lambda_handler(
+        s3_event(upload_bucket.base, "Call P12345-US01.wav"), {}
+    )
+
+    assert report == {"batchItemFailures": []}
+    names = sorted(job_names(mock_transcribe))
+    job_name = names[0].rsplit("-", 1)[0]
+    manifest = json.loads(
+        mock_s3_client.get_object(
+            Bucket=download_bucket.base, Key=f"chunks/{job_name}/manifest.json"
+        )["Body"].read()
+    )
+    assert manifest["output_key"] == "transcribed/P12345-US01.json"
+    assert len(manifest["chunks"]) == len(names) > 1
+    for name, chunk in zip(names, manifest["chunks"]):
+        assert name == f"{job_name}-{chunk['index']:03d}"
+        mock_s3_client.head_object(Bucket=download_bucket.base, Key=chunk["audio_key"])
+        uri = complete_job(mock_transcribe, name)["Transcript"]["TranscriptFileUri"]
+        assert uri.endswith(chunk["transcript_key"])
+
+
+def test_uploads_each_chunk_before_writing_the_next(
+    mock_transcribe, mock_s3_client, upload_bucket, s3_event, long_wav, monkeypatch
+):
+    long_wav("Call P12345-US01.wav", seconds=400)
+    upload_file = mock_s3_client.upload_file
+    on_disk = []
+
+    def upload_and_list(path, *args, **kwargs):
+        if path.endswith(".wav") and not path.endswith("source.wav"):
+            workdir = os.path.dirname(path)
+            on_disk.append(sorted(os.listdir(workdir)))
+        return upload_file(path, *args, **kwargs)
+
+    monkeypatch.setattr(mock_s3_client, "upload_file", upload_and_list)
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US01.wav"), {})
+
+    assert len(on_disk) > 1
+    assert all(len(names) == 2 and "source.wav" in names for names in on_disk)
+
+
+def test_short_wav_is_transcribed_whole(
+    mock_transcribe, upload_bucket, s3_event, long_wav
+):
+    long_wav("Call P12345-US01.wav", seconds=100)
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US01.wav"), {})
+
+    names = job_names(mock_transcribe)
+    assert len(names) == 1
+    assert complete_job(mock_transcribe, names[0])["Transcript"][
+        "TranscriptFileUri"
+    ].endswith("transcribed/P12345-US01.json")
+
+
+def test_reused_compressed_transcript_stays_readable(
+    mock_transcribe, mock_s3_client, download_bucket, upload_bucket, s3_event
+):
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US01.m4a"), {})
+    # ConvertToDocx compressed the finished transcript
+    transcript = finished_transcript(job_names(mock_transcribe)[0])
+    mock_s3_client.put_object(
+        Bucket=download_bucket.base,
+        Key="transcribed/P12345-US01.json",
+        Body=gzip.compress(transcript),
+        ContentEncoding="gzip",
+        Metadata={"logical-etag": "e1"},
+    )
+
+    app.lambda_handler(s3_event(upload_bucket.base, "Call P12345-US02.m4a"), {})
+
+    copied = mock_s3_client.get_object(
+        Bucket=download_bucket.base, Key="transcribed/P12345-US02.json"
+    )
+    assert copied["ContentEncoding"] == "gzip"
+    assert copied["Metadata"] == {
+        "logical-etag": "e1",
+        "dedupe-source": "transcribed/P12345-US01.json",
+    }
+    assert gzip.decompress(copied["Body"].read()) == transcript
@@ -0,0 +1,60 @@
+import functions
+from transcript import decode_turns
+import copy
+import pytest
+import sys
+
+
+def as_channels(data):
+    """The same transcript labelled by channel instead of speaker"""
+    data = copy.deepcopy(data)
+    channels = {}
+    for segment in data["results"].pop("speaker_labels")["segments"]:
+        channel = channels.setdefault(
+            segment["speaker_label"],
+            {"channel_label": f"ch_{len(channels)}", "items": []},
+        )
+        channel["items"].extend(segment["items"])
+    data["results"]["channel_labels"] = {"channels": list(channels.values())}
+    return data
+
+
+def unlabelled(data):
+    data = copy.deepcopy(data)
+    del data["results"]["speaker_labels"]
+    return data
+
+
+@pytest.mark.parametrize("label", [lambda data: data, as_channels, unlabelled])
+def test_numpy_engine_matches_python_engine(transcript_data, label):
+    data = label(transcript_data)
+    assert decode_turns(data, "numpy") == decode_turns(data, "python")
+
+
+def test_engines_agree_on_best_alternative(transcript_data):
+    item = transcript_data["results"]["items"][0]
+    item["alternatives"] = [
+        {"confidence": "0.5", "content": "maybe"},
+        {"confidence": "0.9", "content": "surely"},
+    ]
+    turns = decode_turns(transcript_data, "numpy")
+    assert turns == decode_turns(transcript_data, "python")
+    assert turns[0].runs[0][:2] == (" surely", 0.9)
+
+
+def test_engine_defaults_to_python(transcript_data, monkeypatch):
+    monkeypatch.delenv("TURN_ENGINE", raising=False)
+    monkeypatch.setitem(sys.modules, "turns", None)
+    assert decode_turns(transcript_data) == decode_turns(transcript_data, "python")
+
+
+def test_raises_for_segment_word_without_item(transcript_data):
+    segment = transcript_data["results"]["speaker_labels"]["segments"][0]
+    segment["items"][0]["start_time"] = "99999.000"
+    with pytest.raises(Exception, match="No word found at 99999.000"):
+        decode_turns(transcript_data, "numpy")
+
+
+def test_raises_for_unknown_turn_engine(transcript_data):
+    with pytest.raises(Exception, match="Unknown turn engine"):
+        decode_turns(transcript_data, "pandas")
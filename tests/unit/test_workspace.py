@@ -0,0 +1,52 @@
+import functions
+import workspace
+import os
+import pytest
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    root = tmp_path / "workspaces"
+    monkeypatch.setattr(workspace, "WORKSPACE_ROOT", root)
+    return root
+
+
+def test_workspace_is_removed_when_block_exits(root):
+    with workspace.allocate() as scratch:
+        with open(scratch.file("transcript.json"), "w") as fp:
+            fp.write("{}")
+        assert scratch.path.parent == root
+    assert not scratch.path.exists()
+
+
+def test_workspace_is_removed_when_block_raises(root):
+    with pytest.raises(Exception, match="Failed to create docx"):
+        with workspace.allocate() as scratch:
+            with open(scratch.file("converted.docx"), "wb") as fp:
+                fp.write(b"x" * 1024)
+            raise Exception("Failed to create docx")
+    assert list(root.iterdir()) == []
+
+
+def test_raises_once_budget_is_exceeded(root):
+    with pytest.raises(Exception, match="Workspace budget of 1 MB exceeded"):
+        with workspace.allocate(budget_mb=1) as scratch:
+            with open(scratch.file("transcript.json"), "wb") as fp:
+                fp.write(b"x" * (2 * workspace.MB))
+            scratch.check_budget()
+    assert list(root.iterdir()) == []
+
+
+def test_evicts_stale_workspaces_but_not_active_ones(root):
+    (root / "crashed").mkdir(parents=True)
+    (root / "crashed" / "converted.docx").write_bytes(b"x" * 1024)
+    (root / "leftover.json").write_text("{}")
+
+    with workspace.allocate() as scratch:
+        assert workspace.evict_stale() == 2
+        assert list(root.iterdir()) == [scratch.path]
+
+
+def test_matplotlib_cache_is_shared_outside_workspaces():
+    cache = os.environ["MPLCONFIGDIR"]
+    assert not cache.startswith(str(workspace.WORKSPACE_ROOT))
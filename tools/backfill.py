@@ -0,0 +1,239 @@
+"""Re-render the docx of every transcript under transcribed/.
+
+Reuses the ConvertToDocx pipeline: transcripts are fetched on a thread
+pool, rendered on a process pool and uploaded, each as soon as it is ready,
+with a bounded number in flight.
+Progress is checkpointed after every listing page, so an interrupted run
+picks up where it stopped, after retrying the transcripts that failed:
+
+    python -m tools.backfill --bucket sam-transcribe-download-bucket \\
+        --common-filename "Disclosure Call" --checkpoint backfill.json
+"""
+
+import argparse
+import json
+from contextlib import closing
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from io import BytesIO
+from pathlib import Path
+from time import perf_counter
+from botocore.exceptions import ClientError
+from functions.convert import app
+import compression
+import dockets
+from exporters import save_docx
+from transcript import load_transcript, parse_transcript
+
+
+TRANSCRIBED_PREFIX = "transcribed/"
+
+
+def render(body):
+    """Transcript bytes to docx bytes, run in a worker process.
+
+    Written with the DOCX_BACKEND the worker inherits, like ConvertToDocx.
+    """
+    buffer = BytesIO()
+    save_docx(parse_transcript(load_transcript(BytesIO(body))), buffer)
+    return buffer.getvalue()
+
+
+def load_checkpoint(path):
+    if path and Path(path).exists():
+        return json.loads(Path(path).read_text())
+    return {"start_after": None, "failed": []}
+
+
+def save_checkpoint(path, checkpoint):
+    if path:
+        Path(path).write_text(json.dumps(checkpoint, indent=2))
+
+
+def list_pages(bucket, start_after=None, page_size=1000):
+    """Yield lists of (key, ETag) for the transcripts, one per listing page"""
+    paginator = app.s3_client.get_paginator("list_objects_v2")
+    kwargs = {"Bucket": bucket, "Prefix": TRANSCRIBED_PREFIX}
+    if start_after:
+        kwargs["StartAfter"] = start_after
+    for page in paginator.paginate(**kwargs, PaginationConfig={"PageSize": page_size}):
+        yield [
+            (obj["Key"], obj["ETag"].strip('"'))
+            for obj in page.get("Contents", [])
+            if obj["Key"].endswith(".json")
+        ]
+
+
+def fetch(bucket, key, new_key, stamps, force):
+    """Transcript bytes, or None when the existing output is up to date"""
+    if not force and app.is_up_to_date(bucket, new_key, stamps):
+        return None
+    response = app.s3_client.get_object(Bucket=bucket, Key=key)
+    # The listing has the ETag of a compressed rewrite, the output is stamped
+    # with the one the transcript was written with
+    logical_etag = response["Metadata"].get(compression.LOGICAL_ETAG)
+    if logical_etag:
+        stamps["source-etag"] = logical_etag
+        if not force and app.is_up_to_date(bucket, new_key, stamps):
+            response["Body"].close()
+            return None
+    with closing(compression.open_body(response)) as body:
+        return body.read()
+
+
+def upload(body, bucket, new_key, stamps):
+    app.upload_fileobj(BytesIO(body), bucket, new_key, stamps)
+
+
+def retry_page(bucket, keys, report):
+    """(key, ETag) of the keys that failed before, without those since removed"""
+    page = []
+    for key in keys:
+        try:
+            head = app.s3_client.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                report["failed"].append({"key": key, "error": str(e)})
+            continue
+        page.append((key, head["ETag"].strip('"')))
+    return page
+
+
+def convert_page(page, bucket, common_filename, force, io, renderers, report, window):
+    """Convert the transcripts of ``page``, the keys that failed.
+
+    Each transcript goes from fetch to render to upload as soon as the
+    stage before is done, and at most ``window`` transcripts are in flight,
+    so only that many bodies and documents are held at once.
+    """
+    failed_before = len(report["failed"])
+    page_dockets = dockets.get_dockets([key for key, _ in page], app.DOCKET_FALLBACK)
+    waiting = iter(page)
+    in_flight = {}
+
+    def start_next():
+        for key, etag in waiting:
+            new_key = app.make_new_key(page_dockets[key], common_filename)
+            stamps = {
+                "source-etag": etag,
+                "renderer-version": app.get_renderer_version("native"),
+            }
+            future = io.submit(fetch, bucket, key, new_key, stamps, force)
+            in_flight[future] = ("fetch", key, new_key, stamps)
+            return
+
+    for _ in range(window):
+        start_next()
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            stage, key, new_key, stamps = in_flight.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                report["failed"].append({"key": key, "error": str(e)})
+                start_next()
+                continue
+            if stage == "fetch" and result is None:
+                report["skipped"] += 1
+                start_next()
+            elif stage == "fetch":
+                future = renderers.submit(render, result)
+                in_flight[future] = ("render", key, new_key, stamps)
+            elif stage == "render":
+                future = io.submit(upload, result, bucket, new_key, stamps)
+                in_flight[future] = ("upload", key, new_key, stamps)
+            else:
+                report["converted"] += 1
+                start_next()
+    return {failure["key"] for failure in report["failed"][failed_before:]}
+
+
+def backfill(
+    bucket,
+    common_filename,
+    checkpoint_path=None,
+    processes=None,
+    io_workers=8,
+    force=False,
+    page_size=1000,
+    window=None,
+):
+    # Enough in flight to keep every worker busy
+    window = window or 2 * io_workers
+    checkpoint = load_checkpoint(checkpoint_path)
+    report = {"converted": 0, "skipped": 0, "failed": []}
+    start = perf_counter()
+
+    with ThreadPoolExecutor(max_workers=io_workers) as io, ProcessPoolExecutor(
+        max_workers=processes
+    ) as renderers:
+        # Keys that failed before come first and are dropped once they succeed
+        if checkpoint["failed"]:
+            failed_before = len(report["failed"])
+            page = retry_page(bucket, checkpoint["failed"], report)
+            convert_page(
+                page, bucket, common_filename, force, io, renderers, report, window
+            )
+            checkpoint["failed"] = sorted(
+                {f["key"] for f in report["failed"][failed_before:]}
+            )
+            save_checkpoint(checkpoint_path, checkpoint)
+
+        for page in list_pages(bucket, checkpoint["start_after"], page_size):
+            failed = convert_page(
+                page, bucket, common_filename, force, io, renderers, report, window
+            )
+            if page:
+                checkpoint["start_after"] = page[-1][0]
+                checkpoint["failed"] = sorted({*checkpoint["failed"], *failed})
+                save_checkpoint(checkpoint_path, checkpoint)
+
+    elapsed = perf_counter() - start
+    report["seconds"] = round(elapsed, 2)
+    report["docs_per_second"] = (
+        round(report["converted"] / elapsed, 2) if elapsed else 0
+    )
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bucket", required=True, help="the download bucket")
+    parser.add_argument("--common-filename", required=True)
+    parser.add_argument(
+        "--checkpoint", help="file to resume from and record progress in"
+    )
+    parser.add_argument(
+        "--processes", type=int, help="render processes (default: CPUs)"
+    )
+    parser.add_argument("--io-workers", type=int, default=8)
+    parser.add_argument(
+        "--force", action="store_true", help="re-render up to date outputs"
+    )
+    args = parser.parse_args(argv)
+
+    report = backfill(
+        args.bucket,
+        args.common_filename,
+        checkpoint_path=args.checkpoint,
+        processes=args.processes,
+        io_workers=args.io_workers,
+        force=args.force,
+    )
+    print(
+        f"{report['converted']} converted, {report['skipped']} up to date,"
+        f" {len(report['failed'])} failed in {report['seconds']}s"
+        f" ({report['docs_per_second']} docs/s)"
+    )
+    for failure in report["failed"]:
+        print(f"FAILED {failure['key']}: {failure['error']}")
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
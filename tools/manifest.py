@@ -0,0 +1,73 @@
+"""Where dockets are in the pipeline, from the manifest in the download bucket.
+
+The state of a docket is one GET, a date range one GET a day, with no bucket
+listing. Both are as fresh as the last compaction, which CompactManifest
+runs every few minutes and ``compact`` runs now:
+
+    python -m tools.manifest --bucket sam-transcribe-download-bucket status P12345-US01
+    python -m tools.manifest --bucket sam-transcribe-download-bucket \\
+        range 2026-10-01 2026-10-18 --stage converted
+    python -m tools.manifest --bucket sam-transcribe-download-bucket compact
+"""
+
+import argparse
+import json
+from datetime import date
+from functions.convert import app
+import manifest
+
+
+def print_records(records):
+    for record in records:
+        details = " ".join(
+            f"{name}={value}"
+            for name, value in record.items()
+            if name not in ("id", "docket", "stage", "time")
+        )
+        print(f"{record['time']} {record['docket']} {record['stage']} {details}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bucket", required=True, help="the download bucket")
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    status = commands.add_parser("status", help="the records of dockets")
+    status.add_argument("dockets", nargs="+")
+    between = commands.add_parser("range", help="the records of a date range")
+    between.add_argument("start", type=date.fromisoformat)
+    between.add_argument("end", type=date.fromisoformat)
+    between.add_argument("--stage", choices=manifest.STAGES)
+    commands.add_parser("compact", help="merge the appended parts now")
+    args = parser.parse_args(argv)
+
+    if args.command == "compact":
+        print(json.dumps(manifest.compact(app.s3_client, args.bucket)))
+        return 0
+
+    if args.command == "range":
+        records = manifest.records_between(
+            app.s3_client, args.bucket, args.start, args.end, args.stage
+        )
+        if args.json:
+            print(json.dumps(records, indent=2))
+        else:
+            print_records(records)
+        return 0
+
+    missing = 0
+    for docket in args.dockets:
+        entry = manifest.read_docket(app.s3_client, args.bucket, docket)
+        if entry is None:
+            missing += 1
+            print(f"{docket}: no records")
+        elif args.json:
+            print(json.dumps(entry, indent=2))
+        else:
+            print(f"{docket}: {entry['stage']} at {entry['updated']}")
+            print_records(entry["records"])
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+"""Search the full-text index of the transcripts for the calls that said a term.
+
+Reads only the index partitions of the query's terms from the download
+bucket, which ConvertToDocx adds to with ``SEARCH_INDEX`` on. A term ending
+in ``*`` matches every term it starts and reads the partitions of terms
+with that start. Results are as fresh as the last merge, which
+MergeSearchIndex runs every few minutes and ``--merge`` runs now:
+
+    python -m tools.search --bucket sam-transcribe-download-bucket \\
+        "refund policy" "escalat*"
+"""
+
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functions.convert import app
+import search
+from transcript import format_timestamp
+
+
+def query(bucket, text, limit=10, workers=8):
+    """Dockets matching ``text``, best first, with their matches in time order"""
+    layout = search.read_layout(app.s3_client, bucket)
+    partitions = search.query_partitions(text, layout["partitions"])
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        contents = executor.map(
+            lambda partition: search.read_partition(app.s3_client, bucket, partition),
+            partitions,
+        )
+        return search.search(dict(zip(partitions, contents)), text, limit)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bucket", required=True, help="the download bucket")
+    parser.add_argument("query", nargs="+", help="terms to search for")
+    parser.add_argument("--limit", type=int, default=10, help="dockets to show")
+    parser.add_argument(
+        "--matches", type=int, default=5, help="time offsets to show per docket"
+    )
+    parser.add_argument(
+        "--merge", action="store_true", help="merge the pending dockets first"
+    )
+    parser.add_argument("--json", action="store_true", help="print the hits as JSON")
+    args = parser.parse_args(argv)
+
+    if args.merge:
+        search.merge_pending(app.s3_client, args.bucket)
+    hits = query(args.bucket, " ".join(args.query), args.limit)
+    if args.json:
+        print(json.dumps(hits, indent=2))
+        return 0
+    for hit in hits:
+        print(f"{hit['docket']}: {hit['terms']} term(s), {hit['count']} mention(s)")
+        for match in hit["matches"][: args.matches]:
+            print(
+                f"  {format_timestamp(match['start_time'])}"
+                f" {match['speaker']} {match['term']}"
+            )
+    if not hits:
+        print("No matches")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,545 @@
+"""Run the whole pipeline in process, from uploads to docx, offline.
+
+The functions of template.yaml run against moto S3, with the template's S3
+events installed as the buckets' notification configuration, and against
+``FakeTranscribe``, which finishes every job on a simulated clock and
+writes a synthetic transcript of ``--words`` words as its output. After
+every step the simulator lists the buckets and delivers an S3 event for
+every new object to each function whose notification filter matches.
+SubmitPendingJobs runs every simulated minute while jobs are queued.
+
+Functions are invoked one at a time, like a single warm container each: the
+module-level clients and metrics state are per container in Lambda too.
+Every upload arrives at once, so they are all in flight together.
+
+Function and stage latencies come from every invocation's metrics record,
+Transcribe's from the simulated clock:
+
+    python -m tools.simulator --uploads 200 --words 3000 --max-concurrent-jobs 50
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import statistics
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote_plus
+import boto3
+import yaml
+from moto import mock_aws
+from benchmarks.fake_transcribe import FakeClock, FakeTranscribe
+from benchmarks.synthetic import make_transcript
+
+
+TEMPLATE = Path(__file__).parent.parent / "template.yaml"
+STACK_NAME = "sam-transcribe-sim"
+ACCOUNT_ID = "123456789012"
+REGION = "us-east-1"
+DRAIN_FUNCTION = "SubmitPendingJobs"
+DRAIN_SECONDS = 60
+# Modules functions import top-level whose clients are patched as well
+SIBLINGS = ("scheduler",)
+ENVIRONMENT = {
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_SECURITY_TOKEN": "testing",
+    "AWS_SESSION_TOKEN": "testing",
+    "AWS_DEFAULT_REGION": REGION,
+    "MAX_SPEAKERS": "4",
+    "COMMON_FILENAME": "Call transcript",
+    "DOWNLOAD_BUCKET_NAME": f"{STACK_NAME}-download-bucket",
+}
+PERCENTILES = (50, 95, 99)
+
+
+class _TemplateLoader(yaml.SafeLoader):
+    """Reads CloudFormation's short-form tags as ``{"Ref": ...}`` style dicts"""
+
+
+def _construct_tag(loader, suffix, node):
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    return {suffix: value}
+
+
+_TemplateLoader.add_multi_constructor("!", _construct_tag)
+
+
+def _conditions(spec):
+    """The template's conditions with every parameter at its default"""
+    parameters = {
+        name: parameter.get("Default")
+        for name, parameter in spec.get("Parameters", {}).items()
+    }
+    definitions = spec.get("Conditions", {})
+    resolved = {}
+
+    def evaluate(node):
+        if isinstance(node, dict) and len(node) == 1:
+            ((tag, value),) = node.items()
+            if tag == "Ref":
+                return parameters.get(value, value)
+            if tag == "Equals":
+                return evaluate(value[0]) == evaluate(value[1])
+            if tag == "Not":
+                return not evaluate(value[0] if isinstance(value, list) else value)
+            if tag == "Condition":
+                if value not in resolved:
+                    resolved[value] = evaluate(definitions[value])
+                return resolved[value]
+        return node
+
+    for name in definitions:
+        evaluate({"Condition": name})
+    return resolved
+
+
+def _resolve(node, conditions):
+    """``node`` with ``!If`` resolved, None for ``AWS::NoValue``"""
+    if isinstance(node, dict) and len(node) == 1:
+        ((tag, value),) = node.items()
+        if tag == "If":
+            name, when_true, when_false = value
+            return _resolve(when_true if conditions[name] else when_false, conditions)
+        if tag == "Ref" and value == "AWS::NoValue":
+            return None
+    return node
+
+
+def _rules(s3_filter):
+    rules = s3_filter.get("S3Key", {}).get("Rules", [])
+    return {rule["Name"]: rule["Value"] for rule in rules}
+
+
+def load_functions(template=TEMPLATE):
+    """Every function of the template with its handler and S3 events.
+
+    The events are the functions' S3 events and the buckets' own Lambda
+    notifications, with the template's conditions at their defaults.
+    """
+    spec = yaml.load(Path(template).read_text(), Loader=_TemplateLoader)
+    default_handler = spec["Globals"]["Function"]["Handler"]
+    conditions = _conditions(spec)
+    functions = {}
+    for name, resource in spec["Resources"].items():
+        if resource["Type"] != "AWS::Serverless::Function":
+            continue
+        properties = resource["Properties"]
+        module, _, handler = properties.get("Handler", default_handler).rpartition(".")
+        code = properties["CodeUri"].strip("/").replace("/", ".")
+        events = []
+        for event in properties.get("Events", {}).values():
+            if event["Type"] != "S3":
+                continue
+            events.append(
+                {
+                    "bucket": event["Properties"]["Bucket"]["Ref"],
+                    "events": event["Properties"]["Events"],
+                    "rules": _rules(event["Properties"].get("Filter", {})),
+                }
+            )
+        functions[name] = {
+            "module": f"{code}.{module}",
+            "handler": handler,
+            "environment": properties.get("Environment", {}).get("Variables", {}),
+            "events": events,
+        }
+
+    for bucket, resource in spec["Resources"].items():
+        if resource["Type"] != "AWS::S3::Bucket":
+            continue
+        notifications = resource["Properties"].get("NotificationConfiguration", {})
+        for configuration in notifications.get("LambdaConfigurations", []):
+            configuration = _resolve(configuration, conditions)
+            if configuration is None:
+                continue
+            target = configuration["Function"]["GetAtt"].split(".")[0]
+            functions[target]["events"].append(
+                {
+                    "bucket": bucket,
+                    "events": [configuration["Event"]],
+                    "rules": _rules(configuration.get("Filter", {})),
+                }
+            )
+    return functions
+
+
+def bucket_names(template=TEMPLATE):
+    spec = yaml.load(Path(template).read_text(), Loader=_TemplateLoader)
+    names = {}
+    for name, resource in spec["Resources"].items():
+        if resource["Type"] == "AWS::S3::Bucket":
+            pattern = resource["Properties"]["BucketName"]["Sub"]
+            names[name] = pattern.replace("${AWS::StackName}", STACK_NAME)
+    return names
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    summary = {"count": len(ordered), "mean": statistics.fmean(ordered)}
+    for percent in PERCENTILES:
+        index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+        summary[f"p{percent}"] = ordered[index]
+    summary["max"] = ordered[-1]
+    return summary
+
+
+class Simulator:
+    def __init__(
+        self,
+        uploads=20,
+        words=2000,
+        job_seconds=120,
+        max_concurrent_jobs=100,
+        seed=0,
+        template=TEMPLATE,
+    ):
+        self.uploads = uploads
+        self.words = words
+        self.job_seconds = job_seconds
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.seed = seed
+        self.functions = load_functions(template)
+        self.buckets = bucket_names(template)
+        self.clock = FakeClock()
+        self.transcribe = FakeTranscribe(
+            self.clock,
+            max_concurrent=max_concurrent_jobs,
+            job_seconds=job_seconds,
+            on_complete=self.write_transcript,
+        )
+        self.uploaded_at = {}
+        self.ready_at = {}
+        self.seen = {}
+        self.sequencer = 0
+        self.patches = []
+        self.output = io.StringIO()
+
+    def run(self):
+        with self.environment(), mock_aws():
+            self.s3_client = boto3.client("s3", region_name=REGION)
+            self.create_buckets()
+            try:
+                handlers = {name: self.load_handler(name) for name in self.functions}
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(self.output):
+                    self.upload_audio()
+                    self.deliver(handlers)
+                wall_seconds = time.perf_counter() - started
+            finally:
+                self.unpatch()
+            converted = self.list_keys(self.buckets["DownloadBucket"], "converted/")
+        return self.report(wall_seconds, len(converted))
+
+    @contextlib.contextmanager
+    def environment(self):
+        values = dict(ENVIRONMENT)
+        for function in self.functions.values():
+            for name, value in function["environment"].items():
+                if isinstance(value, (str, int, float)):
+                    values.setdefault(name, str(value))
+        values["MAX_CONCURRENT_JOBS"] = str(self.max_concurrent_jobs)
+        saved = {name: os.environ.get(name) for name in values}
+        os.environ.update(values)
+        try:
+            yield
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    def create_buckets(self):
+        for resource, bucket in self.buckets.items():
+            self.s3_client.create_bucket(Bucket=bucket)
+            configurations = []
+            for name, function in self.functions.items():
+                for event in function["events"]:
+                    if event["bucket"] != resource:
+                        continue
+                    rules = [
+                        {"Name": rule, "Value": value}
+                        for rule, value in event["rules"].items()
+                    ]
+                    configuration = {
+                        "Id": name,
+                        "LambdaFunctionArn": (
+                            f"arn:aws:lambda:{REGION}:{ACCOUNT_ID}:function:"
+                            f"{STACK_NAME}-{name}"
+                        ),
+                        "Events": event["events"],
+                    }
+                    if rules:
+                        configuration["Filter"] = {"Key": {"FilterRules": rules}}
+                    configurations.append(configuration)
+            self.s3_client.put_bucket_notification_configuration(
+                Bucket=bucket,
+                NotificationConfiguration={
+                    "LambdaFunctionConfigurations": configurations
+                },
+            )
+
+    def load_handler(self, name):
+        """Import a function and point its clients at the simulation"""
+        module = importlib.import_module(self.functions[name]["module"])
+        # Siblings are imported top-level, as in Lambda, so patch those too
+        targets = [module] + [
+            getattr(module, sibling) for sibling in SIBLINGS if hasattr(module, sibling)
+        ]
+        for target in targets:
+            if hasattr(target, "s3_client"):
+                self.patch(target, "s3_client", self.s3_client)
+            if hasattr(target, "transcribe"):
+                self.patch(target, "transcribe", self.transcribe)
+            if hasattr(target, "MAX_CONCURRENT_JOBS"):
+                self.patch(target, "MAX_CONCURRENT_JOBS", self.max_concurrent_jobs)
+            if hasattr(target, "pacer"):
+                # Pacing and backoff wait on the simulated clock
+                pacer = target.TokenBucket(
+                    target.SUBMIT_RATE,
+                    target.SUBMIT_BURST,
+                    self.clock.time,
+                    self.clock.sleep,
+                )
+                self.patch(target, "pacer", pacer)
+                self.patch(target, "sleep", self.clock.sleep)
+        return getattr(module, self.functions[name]["handler"])
+
+    def patch(self, target, name, value):
+        self.patches.append((target, name, getattr(target, name)))
+        setattr(target, name, value)
+
+    def unpatch(self):
+        while self.patches:
+            target, name, value = self.patches.pop()
+            setattr(target, name, value)
+
+    def upload_audio(self):
+        bucket = self.buckets["UploadBucket"]
+        for index in range(self.uploads):
+            key = f"Call P{10000 + index}-US01.m4a"
+            body = f"{self.seed}:{index}".encode() * 64
+            self.s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+            self.uploaded_at[f"s3://{bucket}/{key}"] = self.clock.time()
+
+    def write_transcript(self, job):
+        name = job["TranscriptionJobName"]
+        data = make_transcript(
+            words=self.words,
+            speakers=2,
+            seed=zlib.crc32(f"{self.seed}:{name}".encode()),
+            job_name=name,
+        )
+        self.s3_client.put_object(
+            Bucket=job["OutputBucketName"],
+            Key=job["OutputKey"],
+            Body=json.dumps(data).encode(),
+        )
+
+    def deliver(self, handlers):
+        """Invoke functions until every upload has gone as far as it can"""
+        drain = handlers.get(DRAIN_FUNCTION)
+        next_drain = DRAIN_SECONDS
+        while True:
+            events = self.new_events()
+            for name, event in events:
+                handlers[name](event, {})
+            if events:
+                continue
+
+            finishes = [
+                job["_finishes"]
+                for job in self.transcribe.jobs.values()
+                if job["TranscriptionJobStatus"] == "IN_PROGRESS"
+            ]
+            queued = drain and self.list_keys(
+                self.buckets["DownloadBucket"], "pending/"
+            )
+            if not finishes and not queued:
+                break
+            # Skip ahead to whichever comes first
+            wake = min(finishes + ([next_drain] if queued else []))
+            self.clock.now = max(self.clock.now, wake)
+            if queued and self.clock.now >= next_drain:
+                drain({}, {})
+            while next_drain <= self.clock.now:
+                next_drain += DRAIN_SECONDS
+            self.transcribe.advance()
+
+    def new_events(self):
+        """S3 events for objects created since the last call, per function"""
+        events = []
+        for resource, bucket in self.buckets.items():
+            configuration = self.s3_client.get_bucket_notification_configuration(
+                Bucket=bucket
+            )
+            for target in configuration.get("LambdaFunctionConfigurations", []):
+                rules = {
+                    rule["Name"].lower(): rule["Value"]
+                    for rule in target.get("Filter", {})
+                    .get("Key", {})
+                    .get("FilterRules", [])
+                }
+                prefix = rules.get("prefix", "")
+                for entry in self.list_objects(bucket, prefix):
+                    if not entry["Key"].endswith(rules.get("suffix", "")):
+                        continue
+                    seen_key = (target["Id"], bucket, entry["Key"])
+                    if self.seen.get(seen_key) == entry["ETag"]:
+                        continue
+                    self.seen[seen_key] = entry["ETag"]
+                    events.append((target["Id"], self.make_event(bucket, entry)))
+                    if target["Id"] == "ConvertToDocx":
+                        self.ready_at[entry["Key"]] = self.clock.time()
+        return events
+
+    def make_event(self, bucket, entry):
+        self.sequencer += 1
+        return {
+            "Records": [
+                {
+                    "eventSource": "aws:s3",
+                    "eventName": "ObjectCreated:Put",
+                    "eventTime": datetime.fromtimestamp(
+                        self.clock.time(), timezone.utc
+                    ).isoformat(),
+                    "s3": {
+                        "bucket": {"name": bucket},
+                        "object": {
+                            "key": quote_plus(entry["Key"]),
+                            "size": entry["Size"],
+                            "eTag": entry["ETag"].strip('"'),
+                            "sequencer": f"{self.sequencer:016X}",
+                        },
+                    },
+                }
+            ]
+        }
+
+    def list_objects(self, bucket, prefix):
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            yield from page.get("Contents", [])
+
+    def list_keys(self, bucket, prefix):
+        return [entry["Key"] for entry in self.list_objects(bucket, prefix)]
+
+    def metrics(self):
+        records = []
+        for line in self.output.getvalue().splitlines():
+            if '"_aws"' in line:
+                records.append(json.loads(line))
+        return records
+
+    def report(self, wall_seconds, converted):
+        functions = {}
+        for record in self.metrics():
+            stages = functions.setdefault(record["FunctionName"], {})
+            for name, value in record.items():
+                if name.endswith("Duration") and name != "InitDuration":
+                    stages.setdefault(name, []).append(value)
+
+        jobs = list(self.transcribe.jobs.values())
+        waits = [
+            job["StartTime"].timestamp()
+            - self.uploaded_at[job["Media"]["MediaFileUri"]]
+            for job in jobs
+            if job["Media"]["MediaFileUri"] in self.uploaded_at
+        ]
+        return {
+            "uploads": self.uploads,
+            "converted": converted,
+            "wall_seconds": wall_seconds,
+            "uploads_per_second": self.uploads / wall_seconds,
+            "simulated_seconds": self.clock.time(),
+            "transcribe": {
+                "jobs": len(jobs),
+                "rejected": self.transcribe.rejected,
+                "peak_in_flight": self.transcribe.peak_in_flight,
+                "wait_seconds": percentiles(waits),
+                "job_seconds": percentiles(
+                    [
+                        job["CompletionTime"].timestamp() - job["StartTime"].timestamp()
+                        for job in jobs
+                        if "CompletionTime" in job
+                    ]
+                ),
+                # From the uploads until their transcripts were ready to convert
+                "ready_seconds": percentiles(list(self.ready_at.values())),
+            },
+            "functions": {
+                function: {
+                    stage: percentiles(values) for stage, values in stages.items()
+                }
+                for function, stages in sorted(functions.items())
+            },
+        }
+
+
+def print_report(report):
+    print(
+        f"{report['converted']}/{report['uploads']} converted in"
+        f" {report['wall_seconds']:.2f}s of function time"
+        f" ({report['uploads_per_second']:.1f} uploads/s),"
+        f" {report['simulated_seconds']:.0f}s simulated"
+    )
+    transcribe = report["transcribe"]
+    print(
+        f"Transcribe: {transcribe['jobs']} jobs, peak {transcribe['peak_in_flight']}"
+        f" in flight, {transcribe['rejected']} rejected starts"
+    )
+    print(f"{'stage':<46} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    rows = [
+        (f"Transcribe {name} (s)", summary)
+        for name, summary in transcribe.items()
+        if isinstance(summary, dict) and summary
+    ]
+    for function, stages in report["functions"].items():
+        rows.extend(
+            (f"{function} {stage} (ms)", summary) for stage, summary in stages.items()
+        )
+    for name, summary in rows:
+        print(
+            f"{name:<46} {summary['count']:>6} {summary['p50']:>9.1f}"
+            f" {summary['p95']:>9.1f} {summary['p99']:>9.1f} {summary['max']:>9.1f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--words", type=int, default=2000)
+    parser.add_argument("--job-seconds", type=float, default=120)
+    parser.add_argument("--max-concurrent-jobs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the raw report")
+    args = parser.parse_args(argv)
+
+    report = Simulator(
+        uploads=args.uploads,
+        words=args.words,
+        job_seconds=args.job_seconds,
+        max_concurrent_jobs=args.max_concurrent_jobs,
+        seed=args.seed,
+    ).run()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()